@@ -1,3 +1,15 @@
 # see https://docs.python.org/3/library/pkgutil.html
 from pkgutil import extend_path
 __path__ = extend_path(__path__, __name__)
+
+def __getattr__(name):
+  # sub-packages of the namespace (bob.io, bob.learn, ...) are only imported
+  # when first accessed as attributes, see PEP 562
+  if name.startswith('__'):
+    raise AttributeError(name)
+  import importlib
+  try:
+    return importlib.import_module(__name__ + '.' + name)
+  except ImportError as e:
+    if getattr(e, 'name', None) != __name__ + '.' + name: raise
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
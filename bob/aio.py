@@ -0,0 +1,551 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Coroutine versions of the metadata lookups and downloads of :py:mod:`bob.utils`.
+
+They run on an :py:mod:`asyncio` event loop instead of tying up a thread per
+call, so that hundreds of lookups can be in flight from a single loop. All
+requests of a :py:class:`Client` share a budget of connections, bounded by a
+semaphore, and keep-alive connections are reused between requests. Metadata
+goes through the same on-disk cache as the blocking functions.
+
+Every network operation is subject to the timeout of the client, and can be
+cancelled: a cancelled request closes its connection and returns its slot to
+the budget. Use :py:func:`asyncio.wait_for` to bound a whole operation.
+Transient failures are retried as decided by the :py:class:`bob.retry.RetryPolicy`
+of the blocking functions (its number of attempts, backoff and deadline;
+requests are not hedged).
+
+This module requires python 3.5 or later.
+"""
+
+import os
+import ssl
+import json
+import time
+import errno
+import asyncio
+import weakref
+
+import bob.http
+import bob.retry
+import bob.trace
+
+DEFAULT_LIMIT = 16
+"""The maximum number of simultaneous requests of a :py:class:`Client`"""
+
+
+class _Connection(object):
+
+  def __init__(self, key, reader, writer):
+    self.key = key
+    self.reader = reader
+    self.writer = writer
+
+  def close(self):
+    self.writer.close()
+
+
+class Response(object):
+  """
+  A response being read from a connection of a :py:class:`Client`
+
+  The connection goes back to the client, and the request releases its slot
+  in the budget, as soon as the body has been entirely read or the response
+  is closed.
+  """
+
+  def __init__(self, client, connection, url, status, reason, headers, will_close, method):
+    self._client = client
+    self._connection = connection
+    self.url = url
+    self.status = status
+    self.reason = reason
+    self.headers = headers
+    self._will_close = will_close
+    self._chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+    length = headers.get('content-length')
+    self._remaining = int(length) if length and not self._chunked else None
+    self._chunk = 0
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+      self._remaining = 0
+      self._chunked = False
+
+  def getheader(self, name, default=None):
+    """Returns the value of the given response header"""
+    return self.headers.get(name.lower(), default)
+
+  async def _read_some(self, size):
+    reader = self._connection.reader
+    timeout = self._client.timeout
+
+    if self._chunked:
+      if not self._chunk:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if not line: raise IOError("connection closed while reading %s" % self.url)
+        self._chunk = int(line.split(b';', 1)[0].strip(), 16)
+        if not self._chunk:
+          # the last chunk, followed by (optional) trailers
+          while (await asyncio.wait_for(reader.readline(), timeout)).strip(): pass
+          self._chunked = False
+          self._remaining = 0
+          return b''
+      data = await asyncio.wait_for(reader.read(min(size, self._chunk)), timeout)
+      if not data: raise IOError("connection closed while reading %s" % self.url)
+      self._chunk -= len(data)
+      if not self._chunk: await asyncio.wait_for(reader.readexactly(2), timeout)
+      return data
+
+    if self._remaining is not None:
+      if not self._remaining: return b''
+      size = min(size, self._remaining)
+    data = await asyncio.wait_for(reader.read(size), timeout)
+    if self._remaining is not None:
+      if not data: raise IOError("connection closed while reading %s" % self.url)
+      self._remaining -= len(data)
+    return data
+
+  async def read(self, size=-1):
+    """Reads (at most) ``size`` bytes of the body, or all of it"""
+    if self._connection is None: return b''
+    try:
+      if size is not None and size >= 0:
+        data = await self._read_some(size) if size else b''
+        if size and not data: self._release()
+        elif self._remaining == 0 and not self._chunked: self._release()
+        return data
+      parts = []
+      while True:
+        data = await self._read_some(1 << 20)
+        if not data: break
+        parts.append(data)
+      self._release()
+      return b''.join(parts)
+    except BaseException:
+      # includes cancellation: the connection is in an unknown state
+      self.close()
+      raise
+
+  def _release(self):
+    if self._connection is None: return
+    connection, self._connection = self._connection, None
+    if self._will_close or self._remaining is None:
+      connection.close()
+      self._client._done(None)
+    else:
+      self._client._done(connection)
+
+  def close(self):
+    """Closes the response; its connection is discarded if the body was not entirely read"""
+    if self._connection is None: return
+    connection, self._connection = self._connection, None
+    connection.close()
+    self._client._done(None)
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    self.close()
+
+
+class Client(object):
+  """
+  An HTTP/1.1 client running on the current event loop
+
+  **Parameters**:
+
+    limit: The maximum number of simultaneous requests; further requests wait
+           for a slot. See :py:data:`DEFAULT_LIMIT`.
+    timeout: The timeout, in seconds, for connecting and for each read; see
+             :py:data:`bob.http.DEFAULT_TIMEOUT`
+    max_idle: The maximum number of idle connections kept per host
+
+  """
+
+  def __init__(self, limit=DEFAULT_LIMIT, timeout=None, max_idle=8):
+    self.limit = limit
+    self.timeout = float(os.environ.get('BOB_HTTP_TIMEOUT', bob.http.DEFAULT_TIMEOUT)) if timeout is None else timeout
+    self.max_idle = max_idle
+    self._budget = asyncio.Semaphore(limit)
+    self._idle = {}
+
+  async def _connect(self, key):
+    scheme, host, port = key
+    context = ssl.create_default_context() if scheme == 'https' else None
+    with bob.trace.span('http.connect', host=host, port=port, tls=context is not None):
+      reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context), self.timeout)
+    return _Connection(key, reader, writer)
+
+  def _done(self, connection):
+    """Called by a response when it is done with its connection"""
+    if connection is not None:
+      idle = self._idle.setdefault(connection.key, [])
+      if len(idle) < self.max_idle and not connection.reader.at_eof():
+        idle.append(connection)
+      else:
+        connection.close()
+    self._budget.release()
+
+  async def _exchange(self, connection, method, url, host, path, headers, body):
+    lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % host, 'Accept-Encoding: identity']
+    lines.extend('%s: %s' % item for item in headers.items())
+    if body is not None: lines.append('Content-Length: %d' % len(body))
+    connection.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+    await asyncio.wait_for(connection.writer.drain(), self.timeout)
+
+    reader = connection.reader
+    status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+    if not status_line: raise ConnectionResetError("connection closed by %s" % host)
+    version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+    response_headers = {}
+    while True:
+      line = await asyncio.wait_for(reader.readline(), self.timeout)
+      line = line.decode('latin-1').rstrip('\r\n')
+      if not line: break
+      name, _, value = line.partition(':')
+      response_headers[name.strip().lower()] = value.strip()
+    will_close = version == 'HTTP/1.0' or response_headers.get('connection', '').lower() == 'close'
+    return Response(self, connection, url, int(status), reason, response_headers, will_close, method)
+
+  async def request(self, method, url, headers=None, body=None, max_redirects=5):
+    """
+    Sends a request and returns the :py:class:`Response`, once its headers
+    are received; redirections are followed. The response must be read
+    entirely or closed, to give its slot back to the budget.
+
+    **Raises**:
+
+      :py:class:`bob.http.HTTPError` for responses with a status of 400 or more
+
+    """
+    with bob.trace.span('http.request', method=method, url=url) as span:
+      response = await self._request(method, url, headers, body, max_redirects)
+      span.set(status=response.status)
+    return response
+
+  async def _request(self, method, url, headers, body, max_redirects):
+    from urllib.parse import urlsplit, urljoin
+
+    for _ in range(max_redirects + 1):
+      parts = urlsplit(url)
+      scheme = parts.scheme.lower()
+      default_port = 443 if scheme == 'https' else 80
+      key = (scheme, parts.hostname, parts.port or default_port)
+      host = parts.hostname if key[2] == default_port else '%s:%d' % (parts.hostname, key[2])
+      path = parts.path or '/'
+      if parts.query: path += '?' + parts.query
+
+      await self._budget.acquire()
+      try:
+        idle = self._idle.get(key)
+        connection = idle.pop() if idle else None
+        if connection is not None:
+          try:
+            response = await self._exchange(connection, method, url, host, path, dict(headers or {}), body)
+          except BaseException as e:
+            connection.close()
+            if not isinstance(e, (OSError, EOFError, ValueError)): raise
+            # the server closed the idle connection: tries again on a new one
+            connection = None
+        if connection is None:
+          connection = await self._connect(key)
+          try:
+            response = await self._exchange(connection, method, url, host, path, dict(headers or {}), body)
+          except BaseException:
+            connection.close()
+            raise
+      except BaseException:
+        self._budget.release()
+        raise
+
+      if response._remaining == 0 and not response._chunked:
+        response._release()
+
+      if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+        await response.read()
+        url = urljoin(url, response.getheader('Location'))
+        if response.status == 303: method, body = 'GET', None
+        continue
+
+      if response.status >= 400:
+        await response.read()
+        raise bob.http.HTTPError(url, response.status, response.reason)
+      return response
+
+    raise bob.http.HTTPError(url, response.status, "too many redirections")
+
+  async def get(self, url, headers=None):
+    """Sends a ``GET`` request; see :py:meth:`request`"""
+    return await self.request('GET', url, headers)
+
+  def close(self):
+    """Closes all idle connections"""
+    idle, self._idle = self._idle, {}
+    for connections in idle.values():
+      for c in connections: c.close()
+
+
+async def _retry(function, policy=None):
+  """
+  Awaits ``function()``, retrying it on transient failures; see
+  :py:meth:`bob.retry.RetryPolicy.call`. Each attempt is bounded by the
+  deadline of the policy.
+  """
+  policy = policy or bob.retry.get_policy()
+  for retry in range(policy.attempts):
+    try:
+      if policy.deadline is None:
+        return await function()
+      try:
+        return await asyncio.wait_for(function(), policy.deadline)
+      except asyncio.TimeoutError:
+        policy._count('deadlines')
+        raise bob.retry.DeadlineExceeded("the request did not complete within %g s" % policy.deadline)
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      # the timeouts of the client are transient, as socket timeouts are
+      if retry + 1 == policy.attempts or not (isinstance(e, asyncio.TimeoutError) or policy.retryable(e)): raise
+    policy._count('retries')
+    await asyncio.sleep(policy.delay(retry))
+
+
+_clients = weakref.WeakKeyDictionary()
+
+def get_client():
+  """Returns the client shared by all coroutines of this module running on the current event loop"""
+  loop = asyncio.get_event_loop()
+  client = _clients.get(loop)
+  if client is None:
+    client = _clients[loop] = Client()
+  return client
+
+
+async def _fetch_fields(url, key, template, max_age, client, policy, span):
+  """Returns the fields of a JSON document selected by ``template``, through the on-disk cache"""
+  import bob.cache
+  import bob.streamjson
+
+  cache = bob.cache.get_default_cache()
+  entry, headers = bob.cache._lookup(cache, url, key, max_age)
+  if headers is None:
+    span.set(result='fresh')
+  else:
+    async def _get():
+      async with await client.get(url, headers) as response:
+        if response.status == 304 and entry is not None:
+          # not modified: the cached document is still valid
+          entry.fetched = time.time()
+          span.set(result='not modified')
+          return entry
+        data = await response.read()
+        fields = bob.streamjson.loads(data, template)
+        span.set(result='fetched', bytes=len(data))
+        return bob.cache.CacheEntry(url, json.dumps(fields).encode('utf-8'), response.getheader('ETag'), response.getheader('Last-Modified'))
+    entry = await _retry(_get, policy)
+    cache.put(key, entry)
+  return json.loads(entry.body.decode('utf-8'))
+
+
+async def get_package_info(package_name, max_age=None, client=None, policy=None):
+  """
+  Given a package name, get its metadata from PyPI, as a dictionary; see
+  :py:func:`bob.utils.get_package_info`. Transient failures are retried as
+  decided by ``policy`` (by default, the one of :py:func:`bob.retry.get_policy`).
+  """
+  from bob.utils import PACKAGE_FIELDS
+
+  url = bob.http.index_url(package_name, 'json')
+  with bob.trace.span('metadata', package=package_name) as span:
+    return await _fetch_fields(url, url + '#fields', PACKAGE_FIELDS, max_age, client or get_client(), policy, span)
+
+
+async def get_release_info(package, version, client=None, policy=None):
+  """
+  Given a package name and one of its versions, get the metadata of that
+  release from PyPI, as a dictionary; see :py:func:`bob.utils.get_release_info`
+  """
+  from bob.utils import RELEASE_FIELDS, RELEASE_MAX_AGE
+
+  url = bob.http.index_url(package, version, 'json')
+  with bob.trace.span('metadata.release', package=package, version=version) as span:
+    return await _fetch_fields(url, url + '#release', RELEASE_FIELDS, RELEASE_MAX_AGE, client or get_client(), policy, span)
+
+
+async def get_url(package_name, client=None):
+  """Given a package name get, from PyPI, the URL name"""
+  return (await get_package_info(package_name, client=client))['urls'][0]['url']
+
+
+async def get_release_file(package_name, version=None, client=None):
+  """
+  Given a package name, get, from PyPI, the description of the source archive
+  of one of its releases; see :py:func:`bob.utils.get_release_file`
+  """
+  from bob.utils import _release_file
+  info = await get_package_info(package_name, client=client)
+  # the metadata of the package only has the files of the latest release
+  release = None
+  if version not in (None, info['info']['version']) and not info['releases'].get(version, True):
+    release = await get_release_info(package_name, version, client=client)
+  return _release_file(package_name, info, version, release)
+
+
+async def get_releases(package, raise_errors=False, client=None):
+  """Given a package name, get the release versions; see :py:func:`bob.utils.get_releases`"""
+  import http.client
+  try:
+    return list((await get_package_info(package, client=client))['releases'].keys())
+  except (IOError, OSError, ValueError, KeyError, http.client.HTTPException, asyncio.TimeoutError):
+    # the index failed, after the retries of bob.retry, or does not know the package
+    if raise_errors: raise
+    return []
+
+
+async def resolve_versions(packages, client=None):
+  """
+  Resolves the latest version of several packages, querying PyPI
+  concurrently; see :py:func:`bob.utils.resolve_versions`
+
+  **Returns**:
+
+    A list of ``(package, version, error)`` tuples in the same order as
+    ``packages``
+
+  """
+  from bob.utils import get_max_version
+
+  async def _resolve(package):
+    try:
+      versions = await get_releases(package, raise_errors=True, client=client)
+      if not versions:
+        raise ValueError("no releases found for package '%s'" % package)
+      return (package, get_max_version(versions), None)
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      return (package, None, e)
+
+  return list(await asyncio.gather(*[_resolve(p) for p in packages]))
+
+
+async def download(url, output_dir=".", progress=None, interval=0.5, block_size=262144, client=None, policy=None):
+  """
+  Download a file given the URL, streaming it to disk
+
+  The body is read from the network by the event loop, and written to the
+  file by the default executor, so that a slow disk does not block the loop.
+  If the download fails or is cancelled, the partial file is removed.
+
+  **Parameters**:
+
+    url: The URL
+    output_dir: The directory that stores the file
+    progress: A function called as ``progress(done, total)`` to report the
+              status of the download, or ``None``; see :py:func:`bob.utils.copy_stream`
+    interval: The minimum time, in seconds, between two status reports
+    block_size: The maximum number of bytes read at once
+    policy: The :py:class:`bob.retry.RetryPolicy` of the download; see
+            :py:func:`bob.retry.get_policy`
+
+  **Returns**:
+
+    The name of the downloaded file
+
+  """
+  client = client or get_client()
+  file_name = os.path.join(output_dir, url.split('/')[-1])
+
+  with bob.trace.span('download', url=url) as span:
+    await _retry(lambda: _download(client, url, file_name, progress, interval, block_size, span), policy)
+  return file_name
+
+
+async def _download(client, url, file_name, progress, interval, block_size, span):
+  loop = asyncio.get_event_loop()
+  async with await client.get(url) as response:
+    length = response.getheader('Content-Length')
+    total = int(length) if length else None
+    f = open(file_name, 'wb')
+    try:
+      done = 0
+      last = time.time()
+      while True:
+        data = await response.read(block_size)
+        if not data: break
+        await loop.run_in_executor(None, f.write, data)
+        done += len(data)
+        if progress is not None and time.time() - last >= interval:
+          progress(done, total)
+          last = time.time()
+      f.close()
+    except BaseException:
+      f.close()
+      os.unlink(file_name)
+      raise
+  span.set(bytes=done)
+  if progress is not None: progress(done, total)
+
+
+async def download_packages(requirements, output_dir="./temp", extract_workers=2, client=None):
+  """
+  Downloads and unpacks the given packages, concurrently; see
+  :py:func:`bob.utils.download_packages`
+
+  The number of simultaneous queries and downloads is bounded by the budget of
+  the client. Archives are unpacked in the default executor, at most
+  ``extract_workers`` at a time.
+
+  **Returns**:
+
+    A list of ``(package_name, directory, error)`` tuples, in the order of
+    ``requirements``. For packages that could not be downloaded,
+    ``directory`` is ``None`` and ``error`` holds the exception.
+
+  """
+  from bob.utils import split_requirement, _extract
+
+  try:
+    os.makedirs(output_dir)
+  except OSError as e:
+    if e.errno != errno.EEXIST: raise
+
+  loop = asyncio.get_event_loop()
+  unpacking = asyncio.Semaphore(extract_workers)
+  names = [split_requirement(r)[0] for r in requirements]
+
+  async def _package(package_name):
+    try:
+      url = await get_url(package_name, client)
+      file_name = await download(url, output_dir, client=client)
+      try:
+        async with unpacking:
+          target = await loop.run_in_executor(None, _extract, file_name, package_name, output_dir)
+      finally:
+        os.unlink(file_name)
+      return (package_name, target, None)
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      return (package_name, None, e)
+
+  return list(await asyncio.gather(*[_package(n) for n in names]))
+
+
+def run(coroutine):
+  """
+  Runs a coroutine of this module to completion on a new event loop, from
+  blocking code, and returns its result
+  """
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coroutine)
+  finally:
+    client = _clients.pop(loop, None)
+    if client is not None: client.close()
+    loop.close()
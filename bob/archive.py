@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Selective extraction of source archives.
+
+Source distributions unpack into a single ``<package>-<version>`` directory.
+The functions in this module strip that directory and only write the members
+matching a set of patterns, relative to it. Archives can be read from a file
+or straight from a stream, like an HTTP response, in which case no copy of the
+archive is ever written to disk.
+"""
+
+import os
+import zlib
+import struct
+import shutil
+import fnmatch
+import hashlib
+
+DOC_PATTERNS = ('doc/*', '*.rst', 'version.txt', 'bob/*.py')
+"""The members needed to build the documentation of a package: its ``doc``
+tree, the files it may include, and the python sources used by autodoc"""
+
+
+def member_path(name, patterns=None):
+  """
+  Returns the path of an archive member, relative to the top directory of the
+  archive, or ``None`` if the member is a directory, is unsafe (absolute or
+  containing ``..``), or does not match any of the given patterns
+  """
+  parts = name.replace('\\', '/').split('/')[1:]
+  if not parts or not parts[-1]:
+    return None
+  if any(p in ('', '.', '..') for p in parts):
+    return None
+  path = '/'.join(parts)
+  if patterns is not None and not any(fnmatch.fnmatch(path, p) for p in patterns):
+    return None
+  return path
+
+
+def _open_output(target, path):
+  file_name = os.path.join(target, *path.split('/'))
+  directory = os.path.dirname(file_name)
+  if not os.path.isdir(directory): os.makedirs(directory)
+  return open(file_name, 'wb')
+
+
+def extract(file_name, target, patterns=None):
+  """
+  Extracts the members of the given archive (zip or tar) matching
+  ``patterns`` into the directory ``target``
+
+  **Parameters**:
+
+    file_name: The path of the archive
+    target: The directory where members are written, without the top directory of the archive
+    patterns: The shell-like patterns of the members to extract; all are extracted if ``None``
+
+  **Returns**:
+
+    The number of extracted files
+
+  """
+  import zipfile
+  import tarfile
+
+  count = 0
+  if zipfile.is_zipfile(file_name):
+    with zipfile.ZipFile(file_name) as z:
+      for info in z.infolist():
+        path = member_path(info.filename, patterns)
+        if path is None: continue
+        with z.open(info) as source, _open_output(target, path) as f:
+          shutil.copyfileobj(source, f)
+        count += 1
+  else:
+    with tarfile.open(file_name) as t:
+      count = _extract_tar(t, target, patterns)
+  return count
+
+
+def _extract_tar(t, target, patterns):
+  count = 0
+  for info in t:
+    if not info.isfile(): continue
+    path = member_path(info.name, patterns)
+    if path is None: continue
+    source = t.extractfile(info)
+    with _open_output(target, path) as f:
+      shutil.copyfileobj(source, f)
+    count += 1
+  return count
+
+
+class HashingReader(object):
+  """
+  Wraps a readable stream, computing the SHA-256 digest of everything read
+  through it
+  """
+
+  def __init__(self, stream):
+    self.stream = stream
+    self.hash = hashlib.sha256()
+    self.size = 0
+
+  def read(self, size=-1):
+    data = self.stream.read(size)
+    self.hash.update(data)
+    self.size += len(data)
+    return data
+
+  def drain(self, block_size=65536):
+    """Reads the stream until its end"""
+    while self.read(block_size): pass
+
+  def hexdigest(self):
+    return self.hash.hexdigest()
+
+
+class _Buffer(object):
+  """A read buffer over a stream, which allows data to be pushed back"""
+
+  def __init__(self, stream, block_size=65536):
+    self.stream = stream
+    self.block_size = block_size
+    self.data = b''
+
+  def read_some(self):
+    if self.data:
+      data, self.data = self.data, b''
+      return data
+    return self.stream.read(self.block_size)
+
+  def read(self, size=-1):
+    if size is None or size < 0:
+      data, self.data = self.data + self.stream.read(), b''
+      return data
+    if not self.data:
+      return self.stream.read(size)
+    data, self.data = self.data[:size], self.data[size:]
+    return data
+
+  def read_exact(self, size):
+    chunks = [self.data[:size]]
+    self.data = self.data[size:]
+    missing = size - len(chunks[0])
+    while missing > 0:
+      data = self.stream.read(max(missing, self.block_size))
+      if not data:
+        raise IOError("unexpected end of archive")
+      chunks.append(data[:missing])
+      self.data = data[missing:]
+      missing -= len(chunks[-1])
+    return b''.join(chunks)
+
+  def unread(self, data):
+    self.data = data + self.data
+
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+
+
+def _zip64_sizes(extra):
+  """Returns the (compressed, uncompressed) sizes from a zip64 extra field, or None"""
+  while len(extra) >= 4:
+    tag, size = struct.unpack('<HH', extra[:4])
+    if tag == 1 and size >= 16:
+      usize, csize = struct.unpack('<QQ', extra[4:20])
+      return csize, usize
+    extra = extra[4+size:]
+  return None
+
+
+def _stream_zip(buf, target, patterns):
+  count = 0
+  while True:
+    header = buf.read_exact(4)
+    if header != _LOCAL_SIGNATURE:
+      # the central directory, after the last member
+      return count
+    fields = _LOCAL_HEADER.unpack(header + buf.read_exact(_LOCAL_HEADER.size - 4))
+    _, _, flags, method, _, _, crc, csize, usize, name_length, extra_length = fields
+    name = buf.read_exact(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+    extra = buf.read_exact(extra_length)
+    zip64 = _zip64_sizes(extra)
+    if zip64 and csize == 0xFFFFFFFF: csize, usize = zip64
+    if method not in (0, 8):
+      raise IOError("unsupported compression method %d for member '%s'" % (method, name))
+    descriptor = flags & 0x08
+
+    path = member_path(name, patterns)
+    output = _open_output(target, path) if path is not None else None
+    checksum = 0
+    try:
+      if method == 8:
+        decompressor = zlib.decompressobj(-15)
+        remaining = None if descriptor else csize
+        while not decompressor.eof:
+          data = buf.read_some() if remaining is None else buf.read_exact(min(remaining, buf.block_size))
+          if not data:
+            raise IOError("unexpected end of archive in member '%s'" % name)
+          if remaining is not None: remaining -= len(data)
+          data = decompressor.decompress(data)
+          if output is not None:
+            output.write(data)
+            checksum = zlib.crc32(data, checksum)
+        buf.unread(decompressor.unused_data)
+      else:
+        if descriptor:
+          raise IOError("cannot stream member '%s': stored with a data descriptor" % name)
+        remaining = csize
+        while remaining:
+          data = buf.read_exact(min(remaining, buf.block_size))
+          remaining -= len(data)
+          if output is not None:
+            output.write(data)
+            checksum = zlib.crc32(data, checksum)
+    finally:
+      if output is not None: output.close()
+
+    if descriptor:
+      signature = buf.read_exact(4)
+      if signature != _DESCRIPTOR_SIGNATURE: buf.unread(signature)
+      crc = struct.unpack('<I', buf.read_exact(4))[0]
+      buf.read_exact(16 if zip64 else 8)
+
+    if output is not None:
+      if (checksum & 0xFFFFFFFF) != crc:
+        raise IOError("CRC mismatch for member '%s'" % name)
+      count += 1
+
+
+def stream_extract(stream, target, patterns=None):
+  """
+  Extracts the members of an archive (zip or tar) matching ``patterns`` into
+  the directory ``target``, reading the archive sequentially from a stream
+
+  Zip archives are read through their local headers, so the central
+  directory at the end of the file is not needed. The stream is not consumed
+  past the last member.
+
+  **Parameters**:
+
+    stream: A readable stream, like an HTTP response
+    target: The directory where members are written, without the top directory of the archive
+    patterns: The shell-like patterns of the members to extract; all are extracted if ``None``
+
+  **Returns**:
+
+    The number of extracted files
+
+  """
+  import tarfile
+
+  buf = _Buffer(stream)
+  magic = buf.read_exact(4)
+  buf.unread(magic)
+  if magic == _LOCAL_SIGNATURE:
+    return _stream_zip(buf, target, patterns)
+
+  with tarfile.open(fileobj=buf, mode='r|*') as t:
+    return _extract_tar(t, target, patterns)
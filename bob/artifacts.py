@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+A local cache of the built distributions (wheels, or eggs) of the sub-packages
+pinned in ``requirements.txt``.
+
+Compiling the C++ sub-packages (``bob.blitz``, ``bob.io.*``, ``bob.ip.*``,
+``bob.learn.*``) takes most of the time of setting up an environment, while
+what they compile to only depends on the release, the python ABI and the
+compiler flags. Built distributions are kept in one directory per ABI and set
+of flags, named after their package and version, and a package is only built
+when its release is not found there. That directory can be given to ``pip
+install --find-links`` (or to the ``find-links`` option of buildout).
+
+The sub-packages need their dependencies at build time, so
+:py:meth:`ArtifactCache.install` goes through the requirements in order,
+installing each one (from the cache, or after building it) before the next.
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+
+from bob.cache import _replace
+from bob.requirements import normalize_name
+
+FLAG_VARIABLES = ('CC', 'CXX', 'CFLAGS', 'CPPFLAGS', 'CXXFLAGS', 'LDFLAGS', 'BOB_PREFIX_PATH')
+"""The environment variables changing the result of a build"""
+
+EXTENSIONS = ('.whl', '.egg')
+"""The extensions of the files kept in the cache"""
+
+
+def default_artifact_dir():
+  """
+  Returns the directory of the artifact cache: the ``BOB_ARTIFACT_DIR``
+  environment variable, or else ``artifacts`` inside the :py:mod:`bob.cache`
+  directory
+  """
+  if os.environ.get('BOB_ARTIFACT_DIR'):
+    return os.environ['BOB_ARTIFACT_DIR']
+  import bob.cache
+  return os.path.join(bob.cache.default_cache_dir(), 'artifacts')
+
+
+def abi_tag():
+  """
+  Returns a tag identifying the python ABI and platform of this interpreter,
+  like ``cpython-35m-x86_64-linux-gnu-linux_x86_64``
+  """
+  import sysconfig
+  soabi = sysconfig.get_config_var('SOABI')
+  if not soabi:
+    # python 2: the ABI is given by the version and the width of unicode characters
+    soabi = 'cpython-%d%d%s' % (sys.version_info[0], sys.version_info[1], 'mu' if sys.maxunicode > 0xffff else 'm')
+  return '%s-%s' % (soabi, re.sub(r'[-.]', '_', sysconfig.get_platform()))
+
+
+def build_flags(environ=None):
+  """Returns the compiler and flags of the builds, as a dictionary; see :py:data:`FLAG_VARIABLES`"""
+  import sysconfig
+  environ = os.environ if environ is None else environ
+  flags = dict((v, environ[v]) for v in FLAG_VARIABLES if environ.get(v))
+  flags.setdefault('CC', sysconfig.get_config_var('CC') or '')
+  return flags
+
+
+def cache_key(abi=None, flags=None):
+  """
+  Returns the name of the directory holding the artifacts built for the
+  given ABI (see :py:func:`abi_tag`) and flags (see :py:func:`build_flags`)
+  """
+  flags = build_flags() if flags is None else flags
+  digest = hashlib.sha256(json.dumps(flags, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+  return '%s-%s' % (abi or abi_tag(), digest)
+
+
+def parse_file_name(file_name):
+  """
+  Returns the normalized package name and the version of a wheel or egg
+  file, or ``None`` for other files
+  """
+  base, extension = os.path.splitext(os.path.basename(file_name))
+  if extension not in EXTENSIONS: return None
+  parts = base.split('-')
+  if len(parts) < 2: return None
+  return normalize_name(parts[0]), parts[1]
+
+
+class ArtifactCache(object):
+  """
+  A cache of built distributions, for one python ABI and set of compiler
+  flags
+
+  **Parameters**:
+
+    directory: The root directory of the cache; see :py:func:`default_artifact_dir`
+    abi: The ABI tag of the artifacts; see :py:func:`abi_tag`
+    flags: The compiler and flags of the builds; see :py:func:`build_flags`
+    python: The interpreter building and installing the packages
+
+  **Attributes**:
+
+    links: The directory of the artifacts of this ABI and flags, to be
+           given to ``pip install --find-links``
+    hits, misses: Counters of the packages found in the cache, and of
+                  those built
+
+  """
+
+  def __init__(self, directory=None, abi=None, flags=None, python=None):
+    self.directory = directory or default_artifact_dir()
+    self.flags = build_flags() if flags is None else flags
+    self.key = cache_key(abi, self.flags)
+    self.links = os.path.join(self.directory, self.key)
+    self.python = python or sys.executable
+    self.hits = self.misses = 0
+
+  def _ensure_directory(self):
+    if not os.path.isdir(self.links):
+      try:
+        os.makedirs(self.links)
+      except OSError:
+        if not os.path.isdir(self.links): raise
+      with open(os.path.join(self.links, 'key.json'), 'w') as f:
+        json.dump(self.flags, f, indent=2, sort_keys=True)
+
+  def entries(self):
+    """Returns the artifacts in the cache, as a sorted list of ``(name, version, path)`` tuples"""
+    if not os.path.isdir(self.links): return []
+    entries = []
+    for f in os.listdir(self.links):
+      parsed = parse_file_name(f)
+      if parsed is not None: entries.append(parsed + (os.path.join(self.links, f),))
+    return sorted(entries)
+
+  def find(self, name, version):
+    """Returns the path of the artifact of the given release, or ``None`` if it is not in the cache"""
+    name = normalize_name(name)
+    for n, v, path in self.entries():
+      if n == name and v == version: return path
+    return None
+
+  def put(self, file_name):
+    """Copies the given wheel or egg into the cache, returning its path there"""
+    self._ensure_directory()
+    path = os.path.join(self.links, os.path.basename(file_name))
+    # copies under a private name, so that concurrent processes never see a
+    # partially written artifact
+    fd, temp = tempfile.mkstemp(dir=self.links, prefix='.tmp-')
+    os.close(fd)
+    try:
+      shutil.copyfile(file_name, temp)
+      _replace(temp, path)
+    except:
+      os.unlink(temp)
+      raise
+    return path
+
+  def _pip(self, arguments):
+    import subprocess
+    command = [self.python, '-m', 'pip'] + list(arguments)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0].decode('utf-8', 'replace')
+    if process.returncode:
+      raise RuntimeError("'%s' failed:\n%s" % (' '.join(command), output))
+    return output
+
+  def _build_isolation_options(self):
+    # pip 10 builds in an isolated environment by default; the sub-packages
+    # must be built against the ones already installed instead
+    version = re.match(r'pip (\d+)', self._pip(['--version']))
+    return ['--no-build-isolation'] if version and int(version.group(1)) >= 10 else []
+
+  def build(self, name, version, pip_options=()):
+    """
+    Builds a wheel of the given release, against the packages installed in
+    the environment, and stores it in the cache
+
+    **Parameters**:
+
+      name: The package name
+      version: The version to build
+      pip_options: Options of ``pip wheel``, like ``['--find-links', URL]``
+
+    **Returns**:
+
+      The path of the wheel in the cache
+
+    **Raises**:
+
+      :py:class:`RuntimeError` if the build failed
+
+    """
+    import bob.trace
+    self._ensure_directory()
+    temp_dir = tempfile.mkdtemp(dir=self.links, prefix='.build-')
+    try:
+      with bob.trace.span('artifact.build', package=name, version=version):
+        self._pip(['wheel', '--no-deps', '--wheel-dir', temp_dir] + self._build_isolation_options() + list(pip_options) + ['%s==%s' % (name, version)])
+      built = [f for f in os.listdir(temp_dir) if parse_file_name(f) == (normalize_name(name), version)]
+      if not built:
+        raise RuntimeError("building %s==%s did not produce a wheel" % (name, version))
+      return self.put(os.path.join(temp_dir, built[0]))
+    finally:
+      shutil.rmtree(temp_dir, ignore_errors=True)
+
+  def fetch(self, name, version, pip_options=()):
+    """
+    Returns the path of the artifact of the given release, building it on a
+    cache miss
+
+    **Returns**:
+
+      A tuple ``(path, hit)``
+
+    """
+    path = self.find(name, version)
+    if path is not None:
+      self.hits += 1
+      return path, True
+    self.misses += 1
+    return self.build(name, version, pip_options), False
+
+  def install(self, requirements, pip_options=(), progress=None):
+    """
+    Installs the given pinned requirements, in order, from the cache, and
+    builds (then caches) those not found there
+
+    Consecutive cache hits are installed together, with a single call to
+    ``pip``; a miss is only built once the requirements before it are
+    installed, since it may need them at build time.
+
+    **Parameters**:
+
+      requirements: The requirements, like ``['bob.core == 2.1.2']``;
+                    requirements that are not pinned with ``==`` are ignored
+      pip_options: Options of ``pip wheel``, for the builds
+      progress: A function called as ``progress(name, version, hit)`` for
+                each requirement, or ``None``
+
+    **Returns**:
+
+      The list of the paths of the installed artifacts
+
+    """
+    import bob.trace
+    from bob.utils import split_requirement
+
+    installed = []
+    pending = []
+
+    def _flush():
+      if not pending: return
+      with bob.trace.span('artifact.install', count=len(pending)):
+        self._pip(['install', '--no-deps', '--no-index', '--find-links', self.links] + list(pending))
+      installed.extend(pending)
+      del pending[:]
+
+    for requirement in requirements:
+      name, version = split_requirement(requirement)
+      if version is None: continue
+      path = self.find(name, version)
+      hit = path is not None
+      if hit:
+        self.hits += 1
+      else:
+        _flush()
+        self.misses += 1
+        path = self.build(name, version, pip_options)
+      if progress is not None: progress(name, version, hit)
+      pending.append(path)
+    _flush()
+    return installed
+
+  def prune(self, requirements):
+    """
+    Removes the artifacts of this ABI and flags whose release is not among
+    the given pinned requirements
+
+    **Returns**:
+
+      The list of the paths removed
+
+    """
+    from bob.utils import split_requirement
+    keep = set((normalize_name(n), v) for n, v in (split_requirement(r) for r in requirements) if v is not None)
+    removed = []
+    for name, version, path in self.entries():
+      if (name, version) not in keep:
+        os.unlink(path)
+        removed.append(path)
+    return removed
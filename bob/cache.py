@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+A persistent, on-disk cache for the documents fetched from the package index.
+
+Entries are stored one per file, in a directory shared by all processes of the
+same user (``http``, inside the cache directory of bob, which also holds the
+caches and state of other modules). Each file holds a one-line JSON header
+(the URL, the validators returned by the server and the time of the last
+successful fetch) followed by the raw body. Files are replaced atomically, so concurrent readers never see a
+partially written entry.
+"""
+
+import os
+import re
+import json
+import time
+import errno
+import hashlib
+import tempfile
+
+DEFAULT_TTL = 3600
+"""Time, in seconds, during which a cached document is used without contacting
+the server"""
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+"""Maximum size, in bytes, of all cached documents together"""
+
+_ENTRY_NAME = re.compile(r'^[0-9a-f]{40}$')
+
+
+def default_cache_dir():
+  """
+  Returns the directory used by default to store the cache
+
+  It is taken from the ``BOB_CACHE_DIR`` environment variable, defaulting to
+  ``bob`` inside the user's cache directory (``$XDG_CACHE_HOME`` or
+  ``~/.cache``).
+  """
+  if os.environ.get('BOB_CACHE_DIR'):
+    return os.environ['BOB_CACHE_DIR']
+  base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(base, 'bob')
+
+
+def default_entry_dir():
+  """Returns the directory of the entries of the default cache, inside :py:func:`default_cache_dir`"""
+  return os.path.join(default_cache_dir(), 'http')
+
+
+def _env_flag(name):
+  return os.environ.get(name, '').lower() in ('1', 'yes', 'true', 'on')
+
+
+def _replace(source, destination):
+  if hasattr(os, 'replace'):
+    os.replace(source, destination)
+  else:
+    # python 2 on POSIX: rename() silently replaces the destination
+    os.rename(source, destination)
+
+
+class CacheEntry(object):
+  """
+  A single cached document
+
+  **Attributes**:
+
+    url: The URL the document was fetched from
+    body: The raw contents of the document (bytes)
+    etag: The ``ETag`` returned by the server, if any
+    last_modified: The ``Last-Modified`` date returned by the server, if any
+    fetched: The time of the last successful fetch or revalidation
+
+  """
+
+  def __init__(self, url, body, etag=None, last_modified=None, fetched=None):
+    self.url = url
+    self.body = body
+    self.etag = etag
+    self.last_modified = last_modified
+    self.fetched = time.time() if fetched is None else fetched
+
+  def age(self):
+    """Returns the number of seconds since the entry was last validated"""
+    return time.time() - self.fetched
+
+
+class DiskCache(object):
+  """
+  A size-bounded cache of documents, stored on disk
+
+  **Parameters**:
+
+    directory: The directory where entries are stored; see
+               :py:func:`default_entry_dir`. Only the files named like
+               entries are ever removed from it.
+    ttl: The time, in seconds, during which entries are considered fresh
+    max_size: The maximum size, in bytes, of all entries together. When it is
+              exceeded, the least recently used entries are removed.
+    offline: If set, the network is never used and all entries are served,
+             regardless of their age. Defaults to the ``BOB_OFFLINE``
+             environment variable.
+
+  """
+
+  def __init__(self, directory=None, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, offline=None):
+    self.directory = directory or default_entry_dir()
+    self.ttl = ttl
+    self.max_size = max_size
+    self.offline = _env_flag('BOB_OFFLINE') if offline is None else offline
+
+  def _path(self, key):
+    return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+  def get(self, key):
+    """Returns the :py:class:`CacheEntry` stored for ``key``, or ``None``"""
+    path = self._path(key)
+    try:
+      with open(path, 'rb') as f:
+        header = json.loads(f.readline().decode('utf-8'))
+        body = f.read()
+    except (IOError, OSError, ValueError):
+      return None
+    try:
+      # records the access time, used to evict the least recently used entries
+      os.utime(path, None)
+    except OSError:
+      pass
+    return CacheEntry(header['url'], body, header.get('etag'), header.get('last_modified'), header.get('fetched'))
+
+  def put(self, key, entry):
+    """Stores the given :py:class:`CacheEntry` under ``key``"""
+    try:
+      os.makedirs(self.directory)
+    except OSError as e:
+      if e.errno != errno.EEXIST: raise
+
+    header = {'url': entry.url, 'etag': entry.etag, 'last_modified': entry.last_modified, 'fetched': entry.fetched}
+    fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        f.write(entry.body)
+      _replace(temp, self._path(key))
+    except:
+      if os.path.exists(temp): os.unlink(temp)
+      raise
+
+    self.evict()
+
+  def is_fresh(self, entry, max_age=None):
+    """Tells if the given entry can be used without revalidation"""
+    return self.offline or entry.age() < (self.ttl if max_age is None else max_age)
+
+  def evict(self):
+    """Removes the least recently used entries until the cache fits ``max_size``"""
+    if self.max_size is None: return
+    entries = []
+    total = 0
+    for name in os.listdir(self.directory):
+      if not _ENTRY_NAME.match(name): continue
+      path = os.path.join(self.directory, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+      total += stat.st_size
+
+    for _, size, path in sorted(entries):
+      if total <= self.max_size: break
+      try:
+        os.unlink(path)
+      except OSError:
+        # already removed by another process
+        pass
+      total -= size
+
+  def clear(self):
+    """Removes all entries from the cache"""
+    if not os.path.isdir(self.directory): return
+    for name in os.listdir(self.directory):
+      if not _ENTRY_NAME.match(name): continue
+      try:
+        os.unlink(os.path.join(self.directory, name))
+      except OSError:
+        pass
+
+
+_default_cache = None
+
+def get_default_cache():
+  """
+  Returns the cache shared by all functions in :py:mod:`bob.utils`
+
+  The TTL can be changed using the ``BOB_CACHE_TTL`` environment variable.
+  """
+  global _default_cache
+  if _default_cache is None:
+    _default_cache = DiskCache(ttl=float(os.environ.get('BOB_CACHE_TTL', DEFAULT_TTL)))
+  return _default_cache
+
+
+def _lookup(cache, url, key, max_age):
+  """
+  Looks ``key`` up in the cache
+
+  **Returns**:
+
+    A tuple ``(entry, headers)``: ``headers`` is ``None`` if the cached entry
+    can be used as it is, or else the headers of the request revalidating it
+    (``entry`` may then be ``None``)
+
+  """
+  entry = cache.get(key)
+  if entry is not None and cache.is_fresh(entry, max_age):
+    return entry, None
+  if cache.offline:
+    raise IOError("'%s' is not available in the cache and offline mode is set" % url)
+
+  headers = {}
+  if entry is not None:
+    if entry.etag: headers['If-None-Match'] = entry.etag
+    if entry.last_modified: headers['If-Modified-Since'] = entry.last_modified
+  return entry, headers
+
+
+def fetch(url, cache=None, max_age=None, transform=None, key=None, policy=None):
+  """
+  Fetches the given URL, going through the cache
+
+  Fresh entries are returned straight from the cache. Stale entries are
+  revalidated with the server using the ``ETag`` and ``Last-Modified``
+  validators, so that unchanged documents are not transferred again. In
+  offline mode, cached entries are always returned and a missing entry raises
+  an :py:class:`IOError`. Transient failures of the server are retried, as
+  decided by the :py:class:`bob.retry.RetryPolicy`.
+
+  **Parameters**:
+
+    url: The URL to fetch
+    cache: The :py:class:`DiskCache` to use; see :py:func:`get_default_cache`
+    max_age: The age, in seconds, after which the cached document is
+             revalidated; defaults to the TTL of the cache. Use ``0`` to always
+             revalidate.
+    transform: A function reading the response (a stream) and returning the
+               bytes to cache, instead of the raw body
+    key: The key of the entry in the cache; defaults to ``url``. Different
+         transformations of the same URL must use different keys.
+    policy: The :py:class:`bob.retry.RetryPolicy` of the request; see
+            :py:func:`bob.retry.get_policy`
+
+  **Returns**:
+
+    The contents of the document (bytes)
+
+  """
+  import bob.http
+  import bob.retry
+  import bob.trace
+
+  cache = cache or get_default_cache()
+  key = key or url
+  with bob.trace.span('cache.fetch', url=url) as span:
+    entry, headers = _lookup(cache, url, key, max_age)
+    if headers is None:
+      span.set(result='fresh', bytes=len(entry.body))
+      return entry.body
+
+    def _get():
+      with bob.http.get(url, headers) as response:
+        if response.status == 304 and entry is not None: return None
+        body = response.read() if transform is None else transform(response)
+        return CacheEntry(url, body, response.getheader('ETag'), response.getheader('Last-Modified'))
+
+    fetched = (policy or bob.retry.get_policy()).call(_get)
+    if fetched is None:
+      # not modified: the cached document is still valid
+      entry.fetched = time.time()
+      cache.put(key, entry)
+      span.set(result='not modified', bytes=len(entry.body))
+      return entry.body
+    cache.put(key, fetched)
+    span.set(result='fetched', bytes=len(fetched.body))
+    return fetched.body
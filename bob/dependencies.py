@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+The graph of dependencies between installed packages.
+
+The graph is built by walking the requirements of the installed distributions,
+starting from one or more root packages; each distribution is inspected once.
+It provides a build order, in which every package comes after all of its
+dependencies, grouped in levels of packages that can be built in parallel,
+and can be exported to DOT and JSON.
+"""
+
+import json
+
+from bob.utils import split_requirement
+from bob.requirements import normalize_name
+
+
+class CycleError(ValueError):
+  """Raised when a build order is requested for a graph with cycles"""
+
+  def __init__(self, cycles):
+    self.cycles = cycles
+    ValueError.__init__(self, "dependency cycles: %s" % '; '.join(' -> '.join(c + c[:1]) for c in cycles))
+
+
+def installed_requires(name):
+  """
+  Returns the requirements of the installed distribution ``name``, or
+  ``None`` if it is not installed; see :py:func:`bob.utils.get_requires`
+  """
+  from bob.utils import get_requires
+  return get_requires(name)
+
+
+class DependencyGraph(object):
+  """
+  A directed graph from packages to the packages they require
+
+  **Parameters**:
+
+    roots: The names of the packages whose dependencies are walked
+    requires: A function returning the list of requirements of a package, or
+              ``None`` if the package is unknown; defaults to the installed
+              distributions, see :py:func:`installed_requires`
+
+  Package names are compared in their PEP 503 normalized form, so
+  ``Foo_Bar`` and ``foo-bar`` are the same node, named after the first
+  spelling met (in lower case).
+
+  """
+
+  def __init__(self, roots=(), requires=installed_requires):
+    self.requires = requires
+    self.edges = {}
+    self.missing = set()
+    self._names = {}
+    self._reverse = None
+    for root in roots: self.add(root)
+
+  def _node(self, name):
+    """Returns the node of the given package name, registering new names"""
+    return self._names.setdefault(normalize_name(name), name.lower())
+
+  def _find(self, name):
+    """Returns the node of the given package name, if it is in the graph, or else the name"""
+    return self._names.get(normalize_name(name), name.lower())
+
+  def add(self, root):
+    """Adds ``root`` and all of its transitive dependencies to the graph"""
+    stack = [self._node(root)]
+    while stack:
+      name = stack.pop()
+      if name in self.edges: continue
+      requirements = self.requires(name)
+      if requirements is None:
+        self.missing.add(name)
+        requirements = []
+      self.edges[name] = sorted(set(self._node(split_requirement(r)[0]) for r in requirements))
+      stack.extend(d for d in self.edges[name] if d not in self.edges)
+    self._reverse = None
+
+  @property
+  def nodes(self):
+    """The sorted list of packages in the graph"""
+    return sorted(self.edges)
+
+  def _closure(self, name, edges):
+    seen = set()
+    stack = list(edges.get(name, ()))
+    while stack:
+      n = stack.pop()
+      if n in seen: continue
+      seen.add(n)
+      stack.extend(edges.get(n, ()))
+    seen.discard(name)
+    return sorted(seen)
+
+  def _reverse_edges(self):
+    if self._reverse is None:
+      self._reverse = dict((n, []) for n in self.edges)
+      for name, dependencies in self.edges.items():
+        for d in dependencies:
+          self._reverse[d].append(name)
+      for dependents in self._reverse.values(): dependents.sort()
+    return self._reverse
+
+  def dependencies(self, name, transitive=False):
+    """Returns the packages required by ``name``, directly or, if ``transitive``, indirectly"""
+    name = self._find(name)
+    if transitive: return self._closure(name, self.edges)
+    return list(self.edges.get(name, ()))
+
+  def dependents(self, name, transitive=False):
+    """Returns the packages requiring ``name``, directly or, if ``transitive``, indirectly"""
+    name = self._find(name)
+    reverse = self._reverse_edges()
+    if transitive: return self._closure(name, reverse)
+    return list(reverse.get(name, ()))
+
+  def cycles(self):
+    """
+    Returns the dependency cycles in the graph, as lists of package names
+
+    Uses Tarjan's strongly connected components algorithm, without recursion.
+    """
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    result = []
+    counter = [0]
+
+    for start in self.nodes:
+      if start in index: continue
+      work = [(start, iter(self.edges[start]))]
+      index[start] = low[start] = counter[0]; counter[0] += 1
+      stack.append(start); on_stack.add(start)
+      while work:
+        node, children = work[-1]
+        advanced = False
+        for child in children:
+          if child not in index:
+            index[child] = low[child] = counter[0]; counter[0] += 1
+            stack.append(child); on_stack.add(child)
+            work.append((child, iter(self.edges[child])))
+            advanced = True
+            break
+          elif child in on_stack:
+            low[node] = min(low[node], index[child])
+        if advanced: continue
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          low[parent] = min(low[parent], low[node])
+        if low[node] == index[node]:
+          component = []
+          while True:
+            n = stack.pop(); on_stack.discard(n)
+            component.append(n)
+            if n == node: break
+          if len(component) > 1 or node in self.edges[node]:
+            result.append(sorted(component))
+    return result
+
+  def build_levels(self):
+    """
+    Returns the build order as a list of levels: each level is a sorted list
+    of packages whose dependencies are all in previous levels, so packages in
+    the same level can be built in parallel
+
+    **Raises**:
+
+      :py:class:`CycleError` if the graph has cycles
+
+    """
+    remaining = dict((n, len(set(d))) for n, d in self.edges.items())
+    reverse = self._reverse_edges()
+    level = sorted(n for n, count in remaining.items() if not count)
+    levels = []
+    while level:
+      levels.append(level)
+      following = []
+      for n in level:
+        for dependent in reverse[n]:
+          remaining[dependent] -= 1
+          if not remaining[dependent]: following.append(dependent)
+      level = sorted(following)
+    if sum(len(l) for l in levels) != len(self.edges):
+      raise CycleError(self.cycles())
+    return levels
+
+  def build_order(self):
+    """Returns the packages in an order where each comes after all of its dependencies"""
+    return [n for level in self.build_levels() for n in level]
+
+  def to_dict(self):
+    """Returns the graph as a dictionary, ready to be serialized to JSON"""
+    return {
+        'nodes': self.nodes,
+        'edges': dict((n, list(d)) for n, d in self.edges.items()),
+        'missing': sorted(self.missing),
+        }
+
+  def to_json(self, indent=2):
+    """Returns the graph in JSON format"""
+    return json.dumps(self.to_dict(), indent=indent, sort_keys=True)
+
+  def to_dot(self, name='dependencies'):
+    """Returns the graph in the DOT format of Graphviz"""
+    lines = ['digraph "%s" {' % name, '  rankdir=LR;', '  node [shape=box];']
+    for n in self.nodes:
+      style = ' [style=dashed]' if n in self.missing else ''
+      lines.append('  "%s"%s;' % (n, style))
+    for n in self.nodes:
+      for d in self.edges[n]:
+        lines.append('  "%s" -> "%s";' % (n, d))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Incremental, parallel builds of the documentation of the sub-packages.
+
+Instead of a single Sphinx project including the doc trees of all
+sub-packages (``doc/conf.py``), the documentation of each package unpacked in
+the sandbox of :py:mod:`bob.sandbox` is built as a project of its own, by a
+separate ``sphinx-build`` process. Packages are built after the packages they
+require, whose documentation they link to with intersphinx, and packages that
+do not depend on each other are built simultaneously. Each build is recorded
+with the version of its package, and is only repeated when that version
+changes.
+
+The umbrella index, ``doc/index.rst``, is turned into a page linking to the
+documentation of every package, in the same sections.
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+
+DEFAULT_SPHINX_BUILD = (sys.executable, '-m', 'sphinx')
+"""The command running Sphinx"""
+
+_TITLE_UNDERLINE = re.compile(r'^([=\-~^"+*#])\1+\s*$')
+_INDEX_ENTRY = re.compile(r'^\s+temp/([^/\s]+)/doc/index(?:\.rst)?\s*$')
+
+# the configuration of a package, with paths made absolute and links to the
+# documentation of the packages it requires
+_UNIT_CONF = '''# generated by bob.docs
+import os
+_conf = %(conf)r
+_cwd = os.getcwd()
+os.chdir(os.path.dirname(_conf))
+try:
+  __file__ = _conf
+  exec(compile(open(_conf).read(), _conf, 'exec'))
+finally:
+  os.chdir(_cwd)
+
+def _absolute(p):
+  return p if os.path.isabs(p) else os.path.join(os.path.dirname(_conf), p)
+
+templates_path = [_absolute(p) for p in globals().get('templates_path', [])]
+html_static_path = [_absolute(p) for p in globals().get('html_static_path', [])]
+for _name in ('html_logo', 'html_favicon'):
+  if globals().get(_name): globals()[_name] = _absolute(globals()[_name])
+globals().setdefault('extensions', [])
+if 'sphinx.ext.intersphinx' not in extensions: extensions.append('sphinx.ext.intersphinx')
+intersphinx_mapping = dict(globals().get('intersphinx_mapping') or {})
+intersphinx_mapping.update(%(links)r)
+import bob.inventories
+intersphinx_mapping = bob.inventories.localize(intersphinx_mapping)
+'''
+
+_UMBRELLA_CONF = '''# generated by bob.docs
+extensions = ['sphinx.ext.todo']
+master_doc = 'index'
+source_suffix = '.rst'
+project = u'Bob'
+version = release = %(version)r
+html_theme = 'nature'
+html_logo = %(logo)r
+html_favicon = %(favicon)r
+'''
+
+
+def parse_index(file_name):
+  """
+  Returns the packages listed in the toctrees of the umbrella index, as a
+  list of ``(section, packages)`` pairs, in the order of the file
+  """
+  with open(file_name) as f:
+    lines = f.read().splitlines()
+  sections = []
+  title = None
+  for i, line in enumerate(lines):
+    if i + 1 < len(lines) and line.strip() and _TITLE_UNDERLINE.match(lines[i+1]) and not _TITLE_UNDERLINE.match(line):
+      title = line.strip()
+      continue
+    match = _INDEX_ENTRY.match(line)
+    if match:
+      if not sections or sections[-1][0] != title: sections.append((title, []))
+      sections[-1][1].append(match.group(1))
+  return sections
+
+
+def write_umbrella(index_file, output_file, built):
+  """
+  Writes the umbrella index, where the toctrees of ``index_file`` including
+  the documentation of the packages are replaced by links to the
+  documentation built separately
+
+  **Parameters**:
+
+    index_file: The umbrella index, ``doc/index.rst``
+    output_file: The generated index
+    built: A dictionary from the names of the packages whose documentation is
+           available to their version
+
+  """
+  with open(index_file) as f:
+    lines = f.read().splitlines()
+  result = []
+  in_toctree = False
+  for line in lines:
+    if line.strip() == '.. toctree::':
+      in_toctree = True
+      continue
+    if in_toctree:
+      if line.strip().startswith(':'): continue
+      match = _INDEX_ENTRY.match(line)
+      if match:
+        name = match.group(1)
+        if name in built:
+          result.append('* `%s <%s/index.html>`__ (%s)' % (name, name, built[name]))
+        else:
+          result.append('* %s (not available)' % name)
+        continue
+      if line.strip() and not line.startswith(' '):
+        in_toctree = False
+        if result and result[-1].startswith('*'): result.append('')
+      elif not line.strip():
+        continue
+    result.append(line)
+  with open(output_file, 'w') as f:
+    f.write('\n'.join(result) + '\n')
+
+
+def units(sandbox_dir, index_file):
+  """
+  Returns the packages of the umbrella index with documentation in the
+  sandbox, as a dictionary from their names to their versions
+  """
+  from bob.sandbox import read_manifest
+  manifest = read_manifest(sandbox_dir)
+  result = {}
+  for _, packages in parse_index(index_file):
+    for name in packages:
+      if name in manifest and os.path.exists(os.path.join(sandbox_dir, name, 'doc', 'conf.py')):
+        result[name] = manifest[name]['version']
+  return result
+
+
+def build_levels(names):
+  """
+  Returns the given packages grouped in levels, where each package comes
+  after the packages it requires; see :py:meth:`bob.dependencies.DependencyGraph.build_levels`
+
+  **Returns**:
+
+    A tuple ``(levels, requires)``: ``requires`` is a dictionary from each
+    package to the given packages it requires, directly or not
+
+  """
+  from bob.dependencies import DependencyGraph, CycleError
+  graph = DependencyGraph(names)
+  names = set(names)
+  requires = dict((n, [d for d in graph.dependencies(n, transitive=True) if d in names]) for n in names)
+  try:
+    levels = [[n for n in level if n in names] for level in graph.build_levels()]
+  except CycleError:
+    levels = [sorted(names)]
+  return [l for l in levels if l], requires
+
+
+def build_unit(name, source_dir, output_dir, work_dir, links, sphinx_build=DEFAULT_SPHINX_BUILD):
+  """
+  Builds the documentation of a package into ``output_dir/name``
+
+  **Parameters**:
+
+    name: The package name
+    source_dir: The documentation of the package, holding its ``conf.py``
+    output_dir: The directory of the documentation of all packages
+    work_dir: The directory of the generated configurations, doctrees and logs
+    links: The intersphinx mapping to the documentation of other packages
+    sphinx_build: The command running Sphinx; see :py:data:`DEFAULT_SPHINX_BUILD`
+
+  **Raises**:
+
+    :py:class:`RuntimeError` if Sphinx failed, with the name of its log file
+
+  """
+  import subprocess
+  import tempfile
+  import bob.trace
+
+  conf_dir = os.path.join(work_dir, 'conf', name)
+  log_dir = os.path.join(work_dir, 'logs')
+  for d in (conf_dir, log_dir):
+    if not os.path.isdir(d): os.makedirs(d)
+  with open(os.path.join(conf_dir, 'conf.py'), 'w') as f:
+    f.write(_UNIT_CONF % {'conf': os.path.abspath(os.path.join(source_dir, 'conf.py')), 'links': links})
+
+  # builds aside, so that the previous documentation stays whole until replaced
+  temp = tempfile.mkdtemp(dir=output_dir, prefix='.tmp-')
+  log = os.path.join(log_dir, name + '.log')
+  try:
+    with bob.trace.span('docs.build', package=name):
+      with open(log, 'wb') as f:
+        status = subprocess.call(list(sphinx_build) + ['-b', 'html', '-E', '-q', '-c', conf_dir,
+          '-d', os.path.join(work_dir, 'doctrees', name), source_dir, temp], stdout=f, stderr=subprocess.STDOUT)
+    if status:
+      raise RuntimeError("the documentation of %s could not be built; see %s" % (name, log))
+    target = os.path.join(output_dir, name)
+    if os.path.exists(target): shutil.rmtree(target)
+    os.rename(temp, target)
+  except:
+    shutil.rmtree(temp, ignore_errors=True)
+    raise
+
+
+def build(sandbox_dir, output_dir, index_file, work_dir=None, jobs=4, sphinx_build=DEFAULT_SPHINX_BUILD, force=False, progress=None):
+  """
+  Builds the documentation of the packages in the sandbox whose version
+  changed since the last build, then the umbrella index
+
+  **Parameters**:
+
+    sandbox_dir: The sandbox of :py:func:`bob.sandbox.sync_packages`
+    output_dir: The directory of the documentation
+    index_file: The umbrella index, ``doc/index.rst``
+    work_dir: The directory of the generated configurations, doctrees and
+              logs; defaults to ``output_dir.doctrees``
+    jobs: The maximum number of simultaneous Sphinx processes
+    sphinx_build: The command running Sphinx; see :py:data:`DEFAULT_SPHINX_BUILD`
+    force: If set, all packages are built again
+    progress: A function called as ``progress(name, version, status,
+              duration)`` for each package, ``status`` being ``'built'``,
+              ``'cached'`` or the exception raised, or ``None``
+
+  **Returns**:
+
+    A dictionary from package names to their status
+
+  """
+  from bob.sandbox import read_manifest, write_manifest
+  from bob.utils import map_concurrently
+
+  work_dir = work_dir or output_dir.rstrip(os.sep) + '.doctrees'
+  if not os.path.isdir(output_dir): os.makedirs(output_dir)
+  available = units(sandbox_dir, index_file)
+  manifest = read_manifest(output_dir)
+  for name in set(manifest) - set(available):
+    del manifest[name]
+
+  def _cached(name):
+    entry = manifest.get(name)
+    return not force and entry and entry['version'] == available[name] and os.path.exists(os.path.join(output_dir, name, 'index.html'))
+
+  def _links(name):
+    # relative to the documentation of the package, deployed next to the others
+    return dict((d, ('../%s/' % d, os.path.abspath(os.path.join(output_dir, d, 'objects.inv'))))
+        for d in requires[name] if os.path.exists(os.path.join(output_dir, d, 'objects.inv')))
+
+  def _build(name):
+    start = time.time()
+    build_unit(name, os.path.join(sandbox_dir, name, 'doc'), output_dir, work_dir, _links(name), sphinx_build)
+    return time.time() - start
+
+  levels, requires = build_levels(sorted(available))
+  status = {}
+  for level in levels:
+    outdated = []
+    for name in level:
+      if _cached(name):
+        status[name] = 'cached'
+        if progress is not None: progress(name, available[name], 'cached', 0.)
+      else:
+        outdated.append(name)
+    for name, duration, error in map_concurrently(_build, outdated, jobs):
+      status[name] = error or 'built'
+      if error is None:
+        manifest[name] = {'version': available[name], 'built': time.time(), 'duration': duration}
+      else:
+        manifest.pop(name, None)
+      if progress is not None: progress(name, available[name], status[name], duration or 0.)
+    write_manifest(output_dir, manifest)
+
+  build_umbrella(index_file, output_dir, work_dir, dict((n, manifest[n]['version']) for n in manifest), sphinx_build)
+  return status
+
+
+def build_umbrella(index_file, output_dir, work_dir, built, sphinx_build=DEFAULT_SPHINX_BUILD):
+  """Builds the umbrella index, linking to the documentation of the packages, into ``output_dir``"""
+  import subprocess
+  source_dir = os.path.join(work_dir, 'umbrella')
+  if not os.path.isdir(source_dir): os.makedirs(source_dir)
+  doc_dir = os.path.dirname(os.path.abspath(index_file))
+  version_file = os.path.join(os.path.dirname(doc_dir), 'version.txt')
+  version = open(version_file).read().strip() if os.path.exists(version_file) else ''
+  write_umbrella(index_file, os.path.join(source_dir, 'index.rst'), built)
+  with open(os.path.join(source_dir, 'conf.py'), 'w') as f:
+    f.write(_UMBRELLA_CONF % {'version': version, 'logo': os.path.join(doc_dir, 'img', 'logo.png'), 'favicon': os.path.join(doc_dir, 'img', 'favicon.ico')})
+  with open(os.path.join(work_dir, 'umbrella.log'), 'wb') as f:
+    status = subprocess.call(list(sphinx_build) + ['-b', 'html', '-q', '-d', os.path.join(work_dir, 'doctrees', 'umbrella'), source_dir, output_dir],
+        stdout=f, stderr=subprocess.STDOUT)
+  if status:
+    raise RuntimeError("the umbrella index could not be built; see %s" % os.path.join(work_dir, 'umbrella.log'))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+The HTTP client used for all network accesses of :py:mod:`bob.utils`.
+
+Connections are kept alive and pooled per host, so that the many small
+metadata queries made to the package index share a few TCP (and TLS)
+connections instead of opening one each. The base URL of the index is
+configurable, to use a mirror or a local stand-in for PyPI.
+"""
+
+import os
+import threading
+
+DEFAULT_INDEX_URL = "https://pypi.org/pypi"
+"""The base URL of the package index, serving the JSON and XML-RPC APIs"""
+
+DEFAULT_TIMEOUT = 30.
+"""The time, in seconds, after which a connection attempt or a read fails"""
+
+_index_url = None
+
+
+def get_index_url():
+  """
+  Returns the base URL of the package index
+
+  It is the one set by :py:func:`set_index_url`, or else the one given by the
+  ``BOB_INDEX_URL`` environment variable, or else :py:data:`DEFAULT_INDEX_URL`.
+  """
+  url = _index_url or os.environ.get('BOB_INDEX_URL') or DEFAULT_INDEX_URL
+  return url.rstrip('/')
+
+
+def set_index_url(url):
+  """Sets the base URL of the package index; ``None`` restores the default"""
+  global _index_url
+  _index_url = url
+
+
+def index_url(*parts):
+  """Returns the URL of the given path in the package index, like ``index_url('bob', 'json')``"""
+  return '/'.join((get_index_url(),) + parts)
+
+
+class HTTPError(IOError):
+  """
+  Raised for responses with an error status
+
+  **Attributes**:
+
+    url: The requested URL
+    code: The HTTP status code
+    reason: The reason phrase sent by the server
+
+  """
+
+  def __init__(self, url, code, reason):
+    IOError.__init__(self, "HTTP Error %d: %s (%s)" % (code, reason, url))
+    self.url = url
+    self.code = code
+    self.reason = reason
+
+
+class Response(object):
+  """
+  A response being read from a pooled connection
+
+  The connection goes back to the pool as soon as the body has been entirely
+  read; closing a response before that discards its connection.
+  """
+
+  def __init__(self, pool, key, connection, response, url):
+    self._pool = pool
+    self._key = key
+    self._connection = connection
+    self._response = response
+    self.url = url
+    self.status = response.status
+    self.reason = response.reason
+    self.headers = response.msg
+
+  def getheader(self, name, default=None):
+    """Returns the value of the given response header"""
+    return self._response.getheader(name, default)
+
+  def info(self):
+    """Returns the response headers, like the responses of ``urlopen``"""
+    return self.headers
+
+  def _check_done(self):
+    if self._connection is not None and self._response.isclosed():
+      if self._response.will_close:
+        self._connection.close()
+      else:
+        self._pool._release(self._key, self._connection)
+      self._connection = None
+
+  def read(self, size=-1):
+    """Reads (at most) ``size`` bytes of the body, or all of it"""
+    data = self._response.read() if size is None or size < 0 else self._response.read(size)
+    if not data or size is None or size < 0: self._response.close()
+    self._check_done()
+    return data
+
+  def readinto(self, buffer):
+    """Reads the body into the given (writable) buffer, returning the number of bytes read"""
+    if hasattr(self._response, 'readinto'):
+      n = self._response.readinto(buffer)
+    else:
+      data = self._response.read(len(buffer))
+      n = len(data)
+      buffer[:n] = data
+    if not n: self._response.close()
+    self._check_done()
+    return n
+
+  def close(self):
+    """Closes the response; its connection is discarded if the body was not entirely read"""
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+    self._response.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+class ConnectionPool(object):
+  """
+  A thread-safe pool of keep-alive HTTP(S) connections
+
+  **Parameters**:
+
+    timeout: The timeout, in seconds, for connecting and for each read; see
+             :py:data:`DEFAULT_TIMEOUT`
+    max_idle: The maximum number of idle connections kept per host
+
+  """
+
+  def __init__(self, timeout=None, max_idle=8):
+    self.timeout = float(os.environ.get('BOB_HTTP_TIMEOUT', DEFAULT_TIMEOUT)) if timeout is None else timeout
+    self.max_idle = max_idle
+    self._idle = {}
+    self._lock = threading.Lock()
+
+  def _connect(self, key):
+    import six
+    import bob.trace
+    scheme, host, port = key
+    if scheme == 'https':
+      import ssl
+      connection = six.moves.http_client.HTTPSConnection(host, port, timeout=self.timeout, context=ssl.create_default_context())
+    else:
+      connection = six.moves.http_client.HTTPConnection(host, port, timeout=self.timeout)
+    # connects now (name resolution, TCP and TLS handshakes), to time it apart from the request
+    with bob.trace.span('http.connect', host=host, port=port, tls=scheme == 'https'):
+      connection.connect()
+    return connection
+
+  def _acquire(self, key):
+    """Returns ``(connection, reused)``"""
+    with self._lock:
+      idle = self._idle.get(key)
+      if idle: return idle.pop(), True
+    return self._connect(key), False
+
+  def _release(self, key, connection):
+    with self._lock:
+      idle = self._idle.setdefault(key, [])
+      if len(idle) < self.max_idle:
+        idle.append(connection)
+        return
+    connection.close()
+
+  def request(self, method, url, headers=None, body=None, max_redirects=5):
+    """
+    Sends a request and returns the :py:class:`Response`, once its headers
+    are received; redirections are followed
+
+    **Raises**:
+
+      :py:class:`HTTPError` for responses with a status of 400 or more
+
+    """
+    import bob.trace
+
+    with bob.trace.span('http.request', method=method, url=url) as span:
+      response = self._request(method, url, headers, body, max_redirects)
+      span.set(status=response.status)
+    return response
+
+  def _request(self, method, url, headers, body, max_redirects):
+    import six
+
+    for _ in range(max_redirects + 1):
+      parts = six.moves.urllib.parse.urlsplit(url)
+      scheme = parts.scheme.lower()
+      key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+      path = parts.path or '/'
+      if parts.query: path += '?' + parts.query
+
+      connection, reused = self._acquire(key)
+      try:
+        connection.request(method, path, body, dict(headers or {}))
+        response = connection.getresponse()
+      except (six.moves.http_client.HTTPException, IOError):
+        connection.close()
+        if not reused: raise
+        # the server closed the idle connection: tries again on a new one
+        connection = self._connect(key)
+        try:
+          connection.request(method, path, body, dict(headers or {}))
+          response = connection.getresponse()
+        except:
+          connection.close()
+          raise
+
+      result = Response(self, key, connection, response, url)
+      if method == 'HEAD' or result.status in (204, 304):
+        result.read()
+
+      if result.status in (301, 302, 303, 307, 308) and result.getheader('Location'):
+        result.read()
+        url = six.moves.urllib.parse.urljoin(url, result.getheader('Location'))
+        if result.status == 303: method, body = 'GET', None
+        continue
+
+      if result.status >= 400:
+        result.read()
+        raise HTTPError(url, result.status, result.reason)
+      return result
+
+    raise HTTPError(url, result.status, "too many redirections")
+
+  def close(self):
+    """Closes all idle connections"""
+    with self._lock:
+      idle, self._idle = self._idle, {}
+    for connections in idle.values():
+      for c in connections: c.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_pool():
+  """Returns the connection pool shared by all functions in :py:mod:`bob.utils`"""
+  global _default_pool
+  with _default_pool_lock:
+    if _default_pool is None:
+      _default_pool = ConnectionPool()
+  return _default_pool
+
+
+def request(method, url, headers=None, body=None):
+  """Sends a request through the shared connection pool; see :py:meth:`ConnectionPool.request`"""
+  return get_pool().request(method, url, headers, body)
+
+
+def get(url, headers=None):
+  """Sends a ``GET`` request through the shared connection pool"""
+  return request('GET', url, headers)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Local copies of the intersphinx inventories used by the documentation.
+
+Sphinx downloads the ``objects.inv`` inventory of every documentation linked
+with intersphinx, one after the other, on each build. Here they are fetched
+simultaneously, through the cache of :py:mod:`bob.cache` (so unchanged
+inventories are only revalidated, and not at all while fresh), and written to
+local files, one per inventory URL, so that the inventories of different
+versions of a documentation are kept apart. The intersphinx mapping given to
+Sphinx then points to these files.
+
+In offline mode (``BOB_OFFLINE``, see :py:class:`bob.cache.DiskCache`), the
+inventories and the mapping of the last online build are used, and the
+network is not accessed at all.
+"""
+
+import os
+import json
+import hashlib
+
+
+def default_inventory_dir():
+  """Returns the directory of the local inventories, inside the :py:mod:`bob.cache` directory"""
+  import bob.cache
+  return os.path.join(bob.cache.default_cache_dir(), 'inventories')
+
+
+def _remote(location):
+  return location is not None and location.split(':', 1)[0] in ('http', 'https')
+
+
+def inventory_url(uri, inventory=None):
+  """
+  Returns the URL of the inventory of an entry of the intersphinx mapping, or
+  ``None`` if the inventory is a local file
+  """
+  if isinstance(inventory, (tuple, list)):
+    inventory = inventory[0] if inventory else None
+  if inventory is None:
+    return uri.rstrip('/') + '/objects.inv' if _remote(uri) else None
+  return inventory if _remote(inventory) else None
+
+
+def _write(file_name, data):
+  """Writes the file, atomically, unless it already holds ``data``"""
+  import tempfile
+  from bob.cache import _replace
+  if os.path.exists(file_name):
+    with open(file_name, 'rb') as f:
+      if f.read() == data: return
+  # the documentation of several packages may be built simultaneously
+  fd, temp = tempfile.mkstemp(dir=os.path.dirname(file_name), prefix='.tmp-')
+  with os.fdopen(fd, 'wb') as f: f.write(data)
+  _replace(temp, file_name)
+
+
+def localize(mapping, directory=None, cache=None, workers=8):
+  """
+  Fetches the remote inventories of an intersphinx mapping, simultaneously,
+  into local files
+
+  **Parameters**:
+
+    mapping: The intersphinx mapping, from names to ``(uri, inventory)``
+             pairs
+    directory: The directory of the local inventories; see
+               :py:func:`default_inventory_dir`
+    cache: The :py:class:`bob.cache.DiskCache` the inventories go through
+    workers: The maximum number of simultaneous downloads
+
+  **Returns**:
+
+    The mapping, where the inventories that could be fetched (or, offline,
+    found in the cache) are local files. Other remote inventories are left
+    to Sphinx when online, and removed when offline.
+
+  """
+  import bob.cache
+  from bob.utils import map_concurrently
+
+  cache = cache or bob.cache.get_default_cache()
+  directory = directory or default_inventory_dir()
+  if not os.path.isdir(directory): os.makedirs(directory)
+
+  remote = []
+  for name, value in sorted(mapping.items()):
+    if not isinstance(value, (tuple, list)) or len(value) != 2: continue
+    url = inventory_url(*value)
+    if url is not None: remote.append((name, url))
+
+  def _fetch(entry):
+    name, url = entry
+    file_name = os.path.join(directory, '%s-%s.inv' % (name, hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]))
+    _write(file_name, bob.cache.fetch(url, cache=cache))
+    return file_name
+
+  result = dict(mapping)
+  for (name, url), file_name, error in map_concurrently(_fetch, remote, workers):
+    if error is None:
+      result[name] = (mapping[name][0], file_name)
+    else:
+      print ("Could not fetch the inventory of %s (%s): %s" % (name, url, error))
+      if cache.offline: del result[name]
+  return result
+
+
+def link_documentation(additional_packages=('python', 'numpy', 'scipy'), requirements_file=None, directory=None, cache=None):
+  """
+  Returns the intersphinx mapping of
+  :py:func:`bob.extension.utils.link_documentation`, with local inventories;
+  see :py:func:`localize`
+
+  The mapping is recorded, so that offline builds use the one of the last
+  online build, without calling :py:mod:`bob.extension`, which may access
+  the network.
+  """
+  import bob.cache
+  cache = cache or bob.cache.get_default_cache()
+  directory = directory or default_inventory_dir()
+  recorded = os.path.join(directory, 'mapping.json')
+
+  if cache.offline:
+    try:
+      with open(recorded) as f:
+        mapping = dict((k, tuple(v)) for k, v in json.load(f).items())
+    except (IOError, OSError, ValueError):
+      print ("No intersphinx mapping was recorded in %s; building without links" % directory)
+      return {}
+  else:
+    from bob.extension.utils import link_documentation as _link_documentation
+    mapping = _link_documentation(additional_packages=list(additional_packages), requirements_file=requirements_file)
+    if not os.path.isdir(directory): os.makedirs(directory)
+    _write(recorded, json.dumps(mapping, indent=2, sort_keys=True).encode('utf-8'))
+
+  return localize(mapping, directory, cache)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Incremental refresh of pinned requirement files, like ``requirements.txt``.
+
+Next to the requirements file, a state file records the serial number of the
+package index at the time of the last refresh and the last serial of each
+pinned package. On the next refresh, the changelog of the index tells which
+packages changed since then, and only those are queried again. If the index
+does not provide a changelog, all packages are revalidated through the
+metadata cache, which only transfers the documents that changed.
+"""
+
+import os
+import re
+import json
+
+from bob.utils import split_requirement, get_package_info, get_max_version, map_concurrently
+from bob.cache import _replace
+
+
+def normalize_name(name):
+  """Returns the normalized form of a package name, as defined by PEP 503"""
+  return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def default_state_file(file_name):
+  """Returns the state file used for the given requirements file"""
+  return os.path.splitext(file_name)[0] + '.serials.json'
+
+
+def read_pins(lines):
+  """
+  Returns the pinned requirements in the given lines, as a list of
+  ``(line_index, name, version)`` tuples; comments, blank lines and requirements
+  that are not pinned with ``==`` are ignored
+  """
+  pins = []
+  for i, line in enumerate(lines):
+    stripped = line.split('#', 1)[0].strip()
+    if not stripped: continue
+    name, version = split_requirement(stripped)
+    if version is not None: pins.append((i, name, version))
+  return pins
+
+
+def _load_state(state_file):
+  try:
+    with open(state_file) as f:
+      state = json.load(f)
+  except (IOError, OSError, ValueError):
+    state = {}
+  state.setdefault('serial', None)
+  state.setdefault('packages', {})
+  return state
+
+
+def _write_atomically(file_name, contents):
+  temp = file_name + '.tmp'
+  with open(temp, 'w') as f: f.write(contents)
+  _replace(temp, file_name)
+
+
+def _changelog():
+  import six
+  import bob.http
+  # PyPI serves its XML-RPC API at the base URL of the index
+  return six.moves.xmlrpc_client.ServerProxy(bob.http.get_index_url())
+
+
+def changed_since(serial):
+  """
+  Returns the changes in the package index since the given serial
+
+  **Returns**:
+
+    A tuple ``(names, serial)`` with the set of normalized names of the
+    packages that changed, and the serial of the last change
+
+  """
+  names = set()
+  for name, _, _, _, change_serial in _changelog().changelog_since_serial(serial):
+    names.add(normalize_name(name))
+    serial = max(serial, change_serial)
+  return names, serial
+
+
+def refresh_requirements(file_name, state_file=None, workers=8, prereleases='fallback'):
+  """
+  Updates, in place, the pinned versions of a requirements file
+
+  Only the lines whose version changed are rewritten; the order, comments and
+  formatting of the file are kept.
+
+  **Parameters**:
+
+    file_name: The requirements file
+    state_file: The file where serials are recorded; see :py:func:`default_state_file`
+    workers: The maximum number of simultaneous queries to the index
+    prereleases: The policy regarding pre-releases; see :py:func:`bob.versions.get_max_version`
+
+  **Returns**:
+
+    A tuple ``(changes, errors)``: ``changes`` is a list of
+    ``(name, old_version, new_version)`` for the updated pins, ``errors`` a list
+    of ``(name, exception)`` for the packages that could not be queried
+
+  """
+  state_file = state_file or default_state_file(file_name)
+  with open(file_name) as f:
+    lines = f.read().splitlines(True)
+  pins = read_pins(lines)
+  state = _load_state(state_file)
+  known = state['packages']
+
+  try:
+    if state['serial'] is None:
+      # the first incremental run: records where the index is, before querying it
+      changed, serial = None, _changelog().changelog_last_serial()
+    else:
+      changed, serial = changed_since(state['serial'])
+  except Exception:
+    # no changelog (e.g. a mirror): every package is revalidated
+    changed, serial = None, state['serial']
+
+  if changed is None:
+    candidates = [p for p in pins]
+  else:
+    candidates = [p for p in pins if normalize_name(p[1]) in changed or p[1] not in known]
+
+  def _query(pin):
+    # the serial recorded below must cover what is queried: cached metadata,
+    # which may predate it, is always revalidated (unchanged documents are
+    # not transferred again)
+    info = get_package_info(pin[1], max_age=0)
+    if info.get('last_serial') is not None and info['last_serial'] == known.get(pin[1]):
+      return info['last_serial'], pin[2]
+    version = get_max_version(list(info['releases'].keys()), prereleases)
+    if version is None:
+      raise ValueError("no releases found for package '%s'" % pin[1])
+    return info.get('last_serial'), version
+
+  changes = []
+  errors = []
+  for (index, name, old), result, error in map_concurrently(_query, candidates, workers):
+    if error is not None:
+      errors.append((name, error))
+      continue
+    package_serial, version = result
+    known[name] = package_serial
+    if version != old:
+      lines[index] = re.sub(r'(==\s*)[^\s,;#]+', lambda m: m.group(1) + version, lines[index], count=1)
+      changes.append((name, old, version))
+
+  if changes:
+    _write_atomically(file_name, ''.join(lines))
+
+  # packages that failed are queried again on the next run
+  for name, _ in errors: known.pop(name, None)
+  pinned = set(p[1] for p in pins)
+  state['packages'] = dict((n, s) for n, s in known.items() if n in pinned)
+  state['serial'] = serial if not errors else state['serial']
+  _write_atomically(state_file, json.dumps(state, indent=2, sort_keys=True) + '\n')
+
+  return changes, errors
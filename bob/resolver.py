@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+A long-running resolver, keeping package metadata in memory.
+
+The resolver daemon (see ``resolver.py serve``) loads the metadata of the
+packages it is asked about, keeps their releases, archives and newest
+versions in memory, and refreshes them in the background. It answers queries
+sent over a Unix socket, one JSON object per line::
+
+  {"method": "get_max_version", "params": {"package": "bob.core"},
+   "context": {"index": "https://pypi.org/pypi", "max_age": 3600}}
+  {"result": "2.1.2"}
+
+The ``context`` of a query is the package index of the client and the age
+its metadata may have (the TTL of its cache; ``null`` in offline mode). The
+daemon only answers queries about its own index with metadata at most that
+old; other queries are answered by the client itself.
+
+When the socket exists, :py:func:`bob.utils.get_url`,
+:py:func:`bob.utils.get_releases`, :py:func:`bob.utils.get_release_file` and
+:py:func:`bob.utils.resolve_versions` send their queries to the daemon instead
+of going to the package index; if the daemon does not answer, they fall back
+to querying the index themselves.
+
+The socket is ``resolver.sock``, in the cache directory of
+:py:func:`bob.cache.default_cache_dir`, or else the one given by the
+``BOB_RESOLVER_SOCKET`` environment variable. Setting that variable to an
+empty value disables the use of the daemon.
+"""
+
+import os
+import json
+import time
+import errno
+import socket
+import threading
+
+DEFAULT_REFRESH = 300
+"""The time, in seconds, between two refreshes of the metadata held by the daemon"""
+
+DEFAULT_EXPIRE = 86400
+"""The time, in seconds, after which packages that were not queried are forgotten"""
+
+
+class Unavailable(IOError):
+  """Raised when no resolver daemon answers on the socket"""
+
+
+class Mismatch(Unavailable):
+  """
+  Raised when the daemon does not hold the metadata asked for by the context
+  of a query: the metadata of another index, or older metadata
+  """
+
+
+def socket_path():
+  """Returns the path of the socket of the resolver daemon, or ``None`` if its use is disabled"""
+  path = os.environ.get('BOB_RESOLVER_SOCKET')
+  if path is not None: return path or None
+  import bob.cache
+  return os.path.join(bob.cache.default_cache_dir(), 'resolver.sock')
+
+
+def _error(e):
+  """
+  Describes an exception raised by the resolver, to be sent to the client;
+  its type is sent as the category the client handles: ``HTTPError``,
+  ``Mismatch``, ``KeyError``, ``ValueError``, or else ``IOError`` (for
+  connection failures, timeouts and truncated responses, among others)
+  """
+  import bob.http
+  if isinstance(e, bob.http.HTTPError): category = 'HTTPError'
+  elif isinstance(e, Mismatch): category = 'Mismatch'
+  elif isinstance(e, KeyError): category = 'KeyError'
+  elif isinstance(e, ValueError): category = 'ValueError'
+  else: category = 'IOError'
+  error = {'type': category, 'message': str(e)}
+  for attribute in ('url', 'code', 'reason'):
+    if hasattr(e, attribute): error[attribute] = getattr(e, attribute)
+  return error
+
+
+def _exception(error):
+  """Rebuilds, on the client, the exception described by :py:func:`_error`"""
+  if error['type'] == 'HTTPError' and 'code' in error:
+    import bob.http
+    return bob.http.HTTPError(error['url'], error['code'], error['reason'])
+  if error['type'] == 'Mismatch':
+    return Mismatch(error['message'])
+  types = {'ValueError': ValueError, 'KeyError': KeyError}
+  return types.get(error['type'], IOError)(error['message'])
+
+
+class Client(object):
+  """
+  A connection to the resolver daemon; each thread has its own connection
+
+  **Parameters**:
+
+    path: The path of the socket; see :py:func:`socket_path`
+    timeout: The time, in seconds, after which a query fails
+
+  """
+
+  def __init__(self, path, timeout=60.):
+    self.path = path
+    self.timeout = timeout
+    self._local = threading.local()
+
+  def _connection(self):
+    connection = getattr(self._local, 'connection', None)
+    if connection is None:
+      for attempt in range(50):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        try:
+          s.connect(self.path)
+          break
+        except socket.error as e:
+          s.close()
+          # the backlog of the daemon is full: waits for it to accept connections
+          if e.errno != errno.EAGAIN or attempt == 49:
+            raise Unavailable("no resolver at %s: %s" % (self.path, e))
+          time.sleep(0.01)
+      connection = self._local.connection = (s, s.makefile('rb'))
+    return connection
+
+  def _close(self):
+    connection = getattr(self._local, 'connection', None)
+    if connection is not None:
+      connection[1].close()
+      connection[0].close()
+      self._local.connection = None
+
+  def call(self, method, context=None, **params):
+    """
+    Sends a query and returns its result
+
+    **Parameters**:
+
+      method: The name of the method of :py:class:`Resolver`
+      context: The context of the query, or ``None``; see :py:func:`context`
+      params: The parameters of the method
+
+    **Raises**:
+
+      :py:class:`Unavailable` if the daemon does not answer,
+      :py:class:`Mismatch` if it does not hold the metadata of the context,
+      or else the exception raised by the query in the daemon
+
+    """
+    query = {'method': method, 'params': params}
+    if context is not None: query['context'] = context
+    request = (json.dumps(query) + '\n').encode('utf-8')
+    for attempt in (0, 1):
+      s, reader = self._connection()
+      try:
+        s.sendall(request)
+        line = reader.readline()
+        if line: break
+      except socket.error:
+        pass
+      # the daemon may have closed an idle connection: tries again on a new one
+      self._close()
+    else:
+      raise Unavailable("the resolver at %s does not answer" % self.path)
+
+    response = json.loads(line.decode('utf-8'))
+    if 'error' in response: raise _exception(response['error'])
+    return response['result']
+
+  def close(self):
+    """Closes the connection of the current thread"""
+    self._close()
+
+
+def context():
+  """
+  Returns the context of the queries of this process: the URL of its package
+  index, and the age its metadata may have (the TTL of its cache, or
+  ``None`` in offline mode)
+  """
+  import bob.http
+  import bob.cache
+  cache = bob.cache.get_default_cache()
+  return {'index': bob.http.get_index_url(), 'max_age': None if cache.offline else cache.ttl}
+
+
+_disabled = False
+_clients = {}
+_clients_lock = threading.Lock()
+
+def query(method, **params):
+  """
+  Sends a query to the resolver daemon, if one is running, with the context
+  of this process; see :py:func:`context`
+
+  **Raises**:
+
+    :py:class:`Unavailable` if there is no daemon, or if it does not hold the
+    metadata of the context of the query (:py:class:`Mismatch`), in which
+    case the caller answers the query itself
+
+  """
+  global _disabled
+  if _disabled: raise Unavailable("the resolver is disabled")
+  path = socket_path()
+  if path is None or not os.path.exists(path): raise Unavailable("no resolver")
+  with _clients_lock:
+    client = _clients.get(path)
+    if client is None: client = _clients[path] = Client(path)
+  try:
+    return client.call(method, context(), **params)
+  except Mismatch:
+    raise
+  except Unavailable:
+    # a stale socket: the daemon is not queried again by this process
+    _disabled = True
+    raise
+
+
+class _Package(object):
+  """The metadata of a package held in memory"""
+
+  def __init__(self, info):
+    self.info = info
+    self.releases = list(info['releases'].keys())
+    self.maxima = {}
+    self.fetched = time.time()
+    self.used = self.fetched
+
+
+class Resolver(object):
+  """
+  Answers queries about packages, keeping their metadata in memory
+
+  **Parameters**:
+
+    refresh: The time, in seconds, between two refreshes of the metadata; see
+             :py:data:`DEFAULT_REFRESH`
+    expire: The time, in seconds, after which packages that were not queried
+            are forgotten; see :py:data:`DEFAULT_EXPIRE`
+    workers: The maximum number of simultaneous queries to the index while
+             refreshing
+    hedge: When to duplicate a slow query to the index, so that a few slow
+           responses do not hold back a refresh; see
+           :py:class:`bob.retry.RetryPolicy`
+
+  """
+
+  methods = ('ping', 'stats', 'get_releases', 'get_max_version', 'get_url', 'get_release_file')
+
+  def __init__(self, refresh=DEFAULT_REFRESH, expire=DEFAULT_EXPIRE, workers=8, hedge='p95'):
+    import bob.http
+    import bob.retry
+    default = bob.retry.get_policy()
+    self.policy = bob.retry.RetryPolicy(attempts=default.attempts, deadline=default.deadline, hedge=hedge)
+    self.index = bob.http.get_index_url()
+    self.refresh_interval = refresh
+    self.expire = expire
+    self.workers = workers
+    self.packages = {}
+    self.hits = 0
+    self.misses = 0
+    self.started = time.time()
+    self._lock = threading.Lock()
+
+  def _package(self, name):
+    key = name.lower()
+    with self._lock:
+      package = self.packages.get(key)
+      if package is not None:
+        self.hits += 1
+        package.used = time.time()
+        return package
+      self.misses += 1
+    from bob.utils import get_package_info
+    # revalidated, so that the age of the metadata is known
+    package = _Package(get_package_info(name, max_age=0, policy=self.policy))
+    with self._lock:
+      self.packages[key] = package
+    return package
+
+  def ping(self):
+    return True
+
+  def stats(self):
+    """Returns statistics about the daemon"""
+    with self._lock:
+      return {'index': self.index, 'packages': len(self.packages), 'hits': self.hits, 'misses': self.misses, 'uptime': time.time() - self.started,
+          'retries': self.policy.retries, 'hedges': self.policy.hedges}
+
+  def get_releases(self, package):
+    """Returns the release versions of the given package"""
+    return list(self._package(package).releases)
+
+  def get_max_version(self, package, prereleases='fallback'):
+    """Returns the newest release of the given package; see :py:func:`bob.versions.get_max_version`"""
+    entry = self._package(package)
+    if prereleases not in entry.maxima:
+      from bob.utils import get_max_version
+      version = get_max_version(entry.releases, prereleases)
+      if version is None:
+        raise ValueError("no releases found for package '%s'" % package)
+      entry.maxima[prereleases] = version
+    return entry.maxima[prereleases]
+
+  def get_url(self, package):
+    """Returns the URL of the archive of the latest release of the given package"""
+    return self._package(package).info['urls'][0]['url']
+
+  def get_release_file(self, package, version=None):
+    """Returns the description of the archive of a release; see :py:func:`bob.utils.get_release_file`"""
+    from bob.utils import _release_file
+    return _release_file(package, self._package(package).info, version)
+
+  def _check(self, context, params):
+    """Raises :py:class:`Mismatch` if the metadata asked for by the context of a query is not held here"""
+    index = context.get('index')
+    if index is not None and index.rstrip('/') != self.index:
+      raise Mismatch("the resolver serves %s, not %s" % (self.index, index))
+    max_age = context.get('max_age')
+    if max_age is not None and 'package' in params:
+      with self._lock:
+        package = self.packages.get(params['package'].lower())
+      if package is not None and time.time() - package.fetched > max_age:
+        raise Mismatch("the metadata of %s is older than %g s" % (params['package'], max_age))
+
+  def handle(self, request):
+    """Answers a query, given as a dictionary, with a dictionary holding the ``result`` or the ``error``"""
+    method = request.get('method')
+    if method not in self.methods:
+      return {'error': {'type': 'ValueError', 'message': "unknown method '%s'" % method}}
+    try:
+      params = request.get('params', {})
+      if request.get('context') is not None: self._check(request['context'], params)
+      return {'result': getattr(self, method)(**params)}
+    except Exception as e:
+      return {'error': _error(e)}
+
+  def refresh(self):
+    """
+    Revalidates the metadata of the packages queried recently with the index,
+    and forgets the others
+
+    **Returns**:
+
+      The number of packages whose metadata was refreshed
+    """
+    from bob.utils import get_package_info, map_concurrently
+    now = time.time()
+    with self._lock:
+      for key in [k for k, p in self.packages.items() if now - p.used > self.expire]:
+        del self.packages[key]
+      names = list(self.packages)
+
+    refreshed = 0
+    # documents that did not change are not transferred again; see bob.cache
+    for name, info, error in map_concurrently(lambda n: get_package_info(n, max_age=0, policy=self.policy), names, self.workers):
+      if error is not None: continue
+      with self._lock:
+        old = self.packages.get(name)
+        if old is None: continue
+        package = _Package(info)
+        package.used = old.used
+        self.packages[name] = package
+      refreshed += 1
+    return refreshed
+
+
+def serve(path=None, resolver=None, preload=()):
+  """
+  Runs the resolver daemon until it is interrupted
+
+  **Parameters**:
+
+    path: The path of the socket; see :py:func:`socket_path`
+    resolver: The :py:class:`Resolver` answering the queries
+    preload: Names of packages whose metadata is loaded at start
+
+  """
+  import six
+
+  global _disabled
+  # the daemon answers queries itself
+  _disabled = True
+
+  path = path or socket_path()
+  resolver = resolver or Resolver()
+  if os.path.exists(path):
+    try:
+      Client(path, timeout=1.).call('ping')
+      raise IOError("a resolver is already running at %s" % path)
+    except Unavailable:
+      # a stale socket, left by a daemon that died
+      os.unlink(path)
+  directory = os.path.dirname(path)
+  if directory and not os.path.isdir(directory): os.makedirs(directory)
+
+  class _Handler(six.moves.socketserver.StreamRequestHandler):
+    def handle(self):
+      while True:
+        line = self.rfile.readline()
+        if not line: break
+        try:
+          request = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+          request, response = {}, {'error': _error(e)}
+        else:
+          if request.get('method') == 'shutdown':
+            response = {'result': True}
+          else:
+            response = resolver.handle(request)
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+        if request.get('method') == 'shutdown':
+          threading.Thread(target=server.shutdown).start()
+
+  class _Server(six.moves.socketserver.ThreadingMixIn, six.moves.socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+  from bob.utils import map_concurrently
+  map_concurrently(resolver._package, preload, resolver.workers)
+
+  stop = threading.Event()
+  def _refresh():
+    while not stop.wait(resolver.refresh_interval):
+      resolver.refresh()
+  refresher = threading.Thread(target=_refresh)
+  refresher.daemon = True
+  refresher.start()
+
+  server = _Server(path, _Handler)
+  try:
+    server.serve_forever()
+  finally:
+    stop.set()
+    server.server_close()
+    if os.path.exists(path): os.unlink(path)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+The policy deciding how requests to the package index are retried.
+
+Errors are classified with :py:func:`is_retryable`: connection failures,
+timeouts, truncated responses and the ``408``, ``429`` and ``5xx`` statuses
+are transient, while other errors (a missing package, a malformed document,
+a bug) are raised at once. Transient failures are retried after a jittered,
+exponentially growing delay, so that many clients failing together do not
+retry in lock-step.
+
+A :py:class:`RetryPolicy` may also bound the duration of each attempt, and
+hedge requests: when an attempt is slower than most (by default, than 95% of
+the recent ones), a duplicate is sent and the first answer wins. This keeps a
+few slow responses from dominating the time of a run querying many packages.
+
+The policy used by :py:mod:`bob.utils` is configured with environment
+variables: ``BOB_HTTP_RETRIES`` (the number of attempts), ``BOB_HTTP_DEADLINE``
+(the maximum duration of an attempt, in seconds) and ``BOB_HTTP_HEDGE`` (a
+percentile of the recent latencies, like ``p95``, or a delay in seconds).
+"""
+
+import os
+import time
+import random
+import threading
+import collections
+
+DEFAULT_ATTEMPTS = 3
+"""The number of attempts of a request, including the first one"""
+
+RETRYABLE_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+"""The HTTP statuses of the responses considered transient failures"""
+
+
+class DeadlineExceeded(IOError):
+  """Raised when an attempt did not complete within the deadline of its policy"""
+
+
+def is_retryable(error):
+  """
+  Tells if the given exception is a transient failure, worth retrying
+
+  **Returns**:
+
+    ``True`` for timeouts, connection errors, truncated responses and HTTP
+    errors with a status in :py:data:`RETRYABLE_STATUSES`; ``False`` otherwise
+
+  """
+  import six
+  import bob.http
+  if isinstance(error, bob.http.HTTPError):
+    return error.code in RETRYABLE_STATUSES
+  return isinstance(error, (IOError, OSError, EOFError, six.moves.http_client.HTTPException))
+
+
+def parse_hedge(value):
+  """
+  Parses the ``hedge`` parameter of a :py:class:`RetryPolicy` given as a
+  string: a percentile like ``p95``, a delay in seconds, or an empty string
+  (or ``none``) to never hedge
+  """
+  value = (value or '').strip().lower()
+  if value in ('', 'none'): return None
+  return value if value.startswith('p') else float(value)
+
+
+class RetryPolicy(object):
+  """
+  Retries transient failures, with a jittered exponential backoff
+
+  **Parameters**:
+
+    attempts: The maximum number of attempts; see :py:data:`DEFAULT_ATTEMPTS`
+    backoff: The delay, in seconds, before the first retry; it doubles with
+             each retry, and the actual delay is drawn uniformly below it
+    max_backoff: The maximum delay, in seconds, between two attempts
+    deadline: The maximum duration, in seconds, of each attempt, or ``None``
+    hedge: When to send a duplicate of a slow attempt: a percentile of the
+           latencies of the recent attempts, like ``'p95'``, a delay in
+           seconds, or ``None`` to never hedge
+    min_samples: The number of latencies needed before hedging at a
+                 percentile
+    retryable: The function classifying the errors; see :py:func:`is_retryable`
+
+  **Attributes**:
+
+    retries, hedges, deadlines: Counters of the retries, of the duplicate
+                                requests and of the attempts that exceeded
+                                their deadline
+
+  """
+
+  def __init__(self, attempts=DEFAULT_ATTEMPTS, backoff=0.1, max_backoff=5., deadline=None, hedge=None, min_samples=20, retryable=is_retryable):
+    if hedge is not None and not isinstance(hedge, (int, float)):
+      if not (hedge.startswith('p') and 0 < float(hedge[1:]) < 100):
+        raise ValueError("hedge must be a delay or a percentile like 'p95', not '%s'" % hedge)
+    self.attempts = max(1, attempts)
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.deadline = deadline
+    self.hedge = hedge
+    self.min_samples = min_samples
+    self.retryable = retryable
+    self.retries = self.hedges = self.deadlines = 0
+    self._latencies = collections.deque(maxlen=256)
+    self._lock = threading.Lock()
+    self._random = random.Random()
+
+  def delay(self, retry):
+    """Returns the time, in seconds, to wait before the given retry (counting from 0)"""
+    return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+  def hedge_delay(self):
+    """
+    Returns the time, in seconds, after which a duplicate of an attempt is
+    sent, or ``None`` if requests are not hedged (yet)
+    """
+    if self.hedge is None or isinstance(self.hedge, (int, float)):
+      return self.hedge
+    with self._lock:
+      if len(self._latencies) < self.min_samples: return None
+      ordered = sorted(self._latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * float(self.hedge[1:]) / 100.))]
+
+  def _count(self, name):
+    with self._lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def _record(self, latency):
+    with self._lock:
+      self._latencies.append(latency)
+
+  def _attempt(self, function, hedge, deadline):
+    """Runs one attempt, in threads if it has a deadline or may be hedged"""
+    # only the latencies of the requests that may be hedged are comparable
+    delay = self.hedge_delay() if hedge else None
+    deadline = self.deadline if deadline else None
+    if delay is None and deadline is None:
+      start = time.time()
+      result = function()
+      if hedge: self._record(time.time() - start)
+      return result
+
+    import six
+    results = six.moves.queue.Queue()
+
+    def _run():
+      start = time.time()
+      try:
+        result = function()
+      except Exception as e:
+        results.put((False, e))
+        return
+      if hedge: self._record(time.time() - start)
+      results.put((True, result))
+
+    def _launch():
+      thread = threading.Thread(target=_run)
+      thread.daemon = True
+      thread.start()
+
+    start = time.time()
+    end = start + deadline if deadline is not None else None
+    _launch()
+    running = 1
+    while True:
+      wait = [t for t in (start + delay if delay is not None else None, end) if t is not None]
+      try:
+        ok, value = results.get(timeout=max(0, min(wait) - time.time()) if wait else None)
+      except six.moves.queue.Empty:
+        if delay is not None and (end is None or time.time() < end):
+          # a straggler: the first answer of the two wins, the other is ignored
+          self._count('hedges')
+          _launch()
+          running += 1
+          delay = None
+          continue
+        self._count('deadlines')
+        raise DeadlineExceeded("the request did not complete within %g s" % deadline)
+      running -= 1
+      if ok: return value
+      if not running or not self.retryable(value): raise value
+
+  def call(self, function, hedge=True, deadline=True):
+    """
+    Calls ``function()``, retrying it on transient failures
+
+    **Parameters**:
+
+      function: The function, without parameters, sending the request and
+                reading the response; it is called again for each attempt
+      hedge: If unset, slow attempts are not duplicated (as for large
+             downloads)
+      deadline: If unset, attempts are not bounded by the deadline of the
+                policy, and run in the calling thread: an attempt abandoned
+                at its deadline would keep running (and writing its output)
+                alongside the next one
+
+    **Returns**:
+
+      The value returned by ``function``
+
+    **Raises**:
+
+      The exception of the last attempt, or the first one that is not
+      retryable
+
+    """
+    for retry in range(self.attempts):
+      try:
+        return self._attempt(function, hedge, deadline)
+      except Exception as e:
+        if retry + 1 == self.attempts or not self.retryable(e): raise
+      self._count('retries')
+      time.sleep(self.delay(retry))
+
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+def get_policy():
+  """Returns the policy used for all requests of :py:mod:`bob.utils`, configured from the environment"""
+  global _default_policy
+  with _default_policy_lock:
+    if _default_policy is None:
+      deadline = os.environ.get('BOB_HTTP_DEADLINE')
+      _default_policy = RetryPolicy(
+          attempts=int(os.environ.get('BOB_HTTP_RETRIES', DEFAULT_ATTEMPTS)),
+          deadline=float(deadline) if deadline else None,
+          hedge=parse_hedge(os.environ.get('BOB_HTTP_HEDGE')),
+          )
+  return _default_policy
+
+
+def set_policy(policy):
+  """Sets the policy used for all requests of :py:mod:`bob.utils`; ``None`` restores the default"""
+  global _default_policy
+  with _default_policy_lock:
+    _default_policy = policy
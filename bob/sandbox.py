@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+An incremental sandbox of unpacked sub-packages, used to build the integrated
+documentation.
+
+Source archives are kept in a content-addressed store, where each archive is
+named after the package, its version and the SHA-256 digest of its contents.
+Alternatively, archives can be streamed from the index straight into the
+sandbox, without ever being written to disk. The sandbox directory holds a
+manifest recording which release of each package is unpacked there, so that
+synchronizing it with a list of requirements only downloads and unpacks the
+packages whose version changed.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from bob.utils import split_requirement, get_release_file, download, _pipeline, _extract
+from bob.cache import _replace
+
+MANIFEST = '.manifest.json'
+
+DEFAULT_STORE_SIZE = 1024 * 1024 * 1024
+"""Maximum size, in bytes, of all archives in the package store together"""
+
+_ARCHIVE_NAME = re.compile(r'^.+-[^-]+-[0-9a-f]{64}(\.tar\.gz|\.[A-Za-z0-9]+)$')
+
+_STALE_DOWNLOAD = 24 * 3600
+"""The age, in seconds, after which the private directory of a download is
+considered left over by a process that died"""
+
+
+def default_store_dir():
+  """Returns the directory of the package store, inside the :py:mod:`bob.cache` directory"""
+  import bob.cache
+  return os.path.join(bob.cache.default_cache_dir(), 'packages')
+
+
+def file_digest(file_name, block_size=1024*1024):
+  """Returns the SHA-256 digest of the given file"""
+  h = hashlib.sha256()
+  with open(file_name, 'rb') as f:
+    for block in iter(lambda: f.read(block_size), b''):
+      h.update(block)
+  return h.hexdigest()
+
+
+class PackageStore(object):
+  """
+  A content-addressed store of source archives
+
+  Archives are stored as ``<name>-<version>-<sha256>.<extension>``, so that a
+  given release is downloaded only once, whatever the number of sandboxes
+  using it.
+
+  **Parameters**:
+
+    directory: The directory of the store; see :py:func:`default_store_dir`.
+               Only the files named like archives are ever removed from it.
+    max_size: The maximum size, in bytes, of all archives together, or
+              ``None``; see :py:meth:`evict`
+
+  """
+
+  def __init__(self, directory=None, max_size=DEFAULT_STORE_SIZE):
+    self.directory = directory or default_store_dir()
+    self.max_size = max_size
+
+  def path(self, name, version, sha256, filename):
+    """Returns the path of the given archive in the store"""
+    extension = '.tar.gz' if filename.endswith('.tar.gz') else os.path.splitext(filename)[1]
+    return os.path.join(self.directory, '%s-%s-%s%s' % (name, version, sha256, extension))
+
+  def fetch(self, name, release):
+    """
+    Returns the path of the archive of the given release, downloading it if
+    it is not in the store yet
+
+    **Parameters**:
+
+      name: The package name
+      release: The description of the release, as returned by :py:func:`bob.utils.get_release_file`
+
+    **Returns**:
+
+      A tuple ``(path, sha256)``
+
+    """
+    if release['sha256']:
+      path = self.path(name, release['version'], release['sha256'], release['filename'])
+      try:
+        # records the access time, used to evict the least recently used archives
+        os.utime(path, None)
+        return path, release['sha256']
+      except OSError:
+        pass
+
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError:
+        if not os.path.isdir(self.directory): raise
+
+    # downloads into a private directory, so that concurrent processes never
+    # see a partially written archive in the store
+    temp_dir = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+    try:
+      file_name = download(release['url'], temp_dir)
+      sha256 = file_digest(file_name)
+      if release['sha256'] and sha256 != release['sha256']:
+        raise IOError("checksum mismatch for '%s': expected %s, got %s" % (release['url'], release['sha256'], sha256))
+      path = self.path(name, release['version'], sha256, release['filename'])
+      _replace(file_name, path)
+    finally:
+      shutil.rmtree(temp_dir, ignore_errors=True)
+    return path, sha256
+
+  def evict(self, keep=()):
+    """
+    Removes the least recently used archives until the store fits
+    ``max_size``, and the downloads left over by processes that died
+
+    **Parameters**:
+
+      keep: The paths of archives that are never removed, like those unpacked
+            in a sandbox
+
+    **Returns**:
+
+      The list of the paths removed
+
+    """
+    if not os.path.isdir(self.directory): return []
+    keep = set(os.path.abspath(k) for k in keep)
+    archives = []
+    total = 0
+    for name in os.listdir(self.directory):
+      path = os.path.join(self.directory, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      if name.startswith('.tmp-') and stat.st_mtime < time.time() - _STALE_DOWNLOAD:
+        shutil.rmtree(path, ignore_errors=True)
+      elif _ARCHIVE_NAME.match(name):
+        total += stat.st_size
+        if os.path.abspath(path) not in keep: archives.append((stat.st_mtime, stat.st_size, path))
+
+    removed = []
+    for _, size, path in sorted(archives):
+      if self.max_size is None or total <= self.max_size: break
+      try:
+        os.unlink(path)
+        removed.append(path)
+      except OSError:
+        # already removed by another process
+        pass
+      total -= size
+    return removed
+
+
+def stream_package(name, release, output_dir, patterns=None):
+  """
+  Downloads the archive of the given release and extracts it, as it arrives,
+  into ``output_dir/name``; the archive itself is never written to disk.
+  Transient failures start the download and extraction over, as decided by
+  :py:func:`bob.retry.get_policy`.
+
+  **Parameters**:
+
+    name: The package name
+    release: The description of the release, as returned by :py:func:`bob.utils.get_release_file`
+    output_dir: The sandbox directory
+    patterns: The members to extract; see :py:func:`bob.archive.stream_extract`
+
+  **Returns**:
+
+    The SHA-256 digest of the archive
+
+  """
+  import bob.http
+  import bob.retry
+  import bob.archive
+  import bob.trace
+
+  target = os.path.join(output_dir, name)
+
+  def _attempt():
+    # each attempt extracts into its own directory, from the start of the archive
+    temp = tempfile.mkdtemp(dir=output_dir, prefix='.tmp-')
+    try:
+      response = bob.http.get(release['url'])
+      try:
+        reader = bob.archive.HashingReader(response)
+        bob.archive.stream_extract(reader, temp, patterns)
+        reader.drain()
+      finally:
+        response.close()
+    except:
+      shutil.rmtree(temp, ignore_errors=True)
+      raise
+    return temp, reader
+
+  with bob.trace.span('stream_extract', package=name, url=release['url']) as span:
+    temp, reader = bob.retry.get_policy().call(_attempt, hedge=False, deadline=False)
+    span.set(bytes=reader.size)
+  try:
+    sha256 = reader.hexdigest()
+    if release['sha256'] and sha256 != release['sha256']:
+      raise IOError("checksum mismatch for '%s': expected %s, got %s" % (release['url'], release['sha256'], sha256))
+    with bob.trace.span('extract.rename', package=name):
+      if os.path.exists(target): shutil.rmtree(target)
+      os.rename(temp, target)
+  except:
+    shutil.rmtree(temp, ignore_errors=True)
+    raise
+  return sha256
+
+
+def read_manifest(output_dir):
+  """Returns the manifest of the given sandbox, as a dictionary from package names to their entries"""
+  try:
+    with open(os.path.join(output_dir, MANIFEST)) as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return {}
+
+
+def write_manifest(output_dir, manifest):
+  """Atomically replaces the manifest of the given sandbox"""
+  fd, temp = tempfile.mkstemp(dir=output_dir, prefix='.tmp-')
+  with os.fdopen(fd, 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  _replace(temp, os.path.join(output_dir, MANIFEST))
+
+
+def sync_packages(requirements, output_dir="./temp", store=None, patterns=None, stream=False, metadata_workers=8, download_workers=4, extract_workers=2):
+  """
+  Makes the given sandbox contain exactly the unpacked sources of the required
+  packages
+
+  Packages pinned (with ``==``) to the version already unpacked in the sandbox
+  are not touched, and do not even require a query to PyPI. Packages not
+  listed in ``requirements`` are removed from the sandbox.
+
+  **Parameters**:
+
+    requirements: The list of requirements, like ``bob.core == 2.1.2``
+    output_dir: The sandbox directory
+    store: The :py:class:`PackageStore` holding the archives; once the
+           sandbox is up to date, its least recently used archives (except
+           those unpacked in the sandbox) are evicted
+    patterns: The archive members to extract, like
+              :py:data:`bob.archive.DOC_PATTERNS`; all are extracted if ``None``
+    stream: If set, archives are extracted while they are downloaded and are
+            not kept in the store
+    metadata_workers: The number of simultaneous queries to PyPI
+    download_workers: The number of simultaneous downloads
+    extract_workers: The number of archives unpacked simultaneously
+
+  **Returns**:
+
+    The list of names of the packages that were (re-)extracted
+
+  """
+  store = store or PackageStore()
+  if not os.path.isdir(output_dir): os.makedirs(output_dir)
+
+  manifest = read_manifest(output_dir)
+  wanted = [split_requirement(r) for r in requirements]
+  names = set(n for n, _ in wanted)
+
+  for name in sorted(set(manifest) - names):
+    print ("Removing {0}".format(name))
+    shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+    del manifest[name]
+
+  patterns = list(patterns) if patterns is not None else None
+
+  def _up_to_date(name, entry):
+    return entry.get('patterns') == patterns and os.path.isdir(os.path.join(output_dir, name))
+
+  outdated = []
+  for name, version in wanted:
+    entry = manifest.get(name)
+    if entry and version and entry['version'] == version and _up_to_date(name, entry):
+      continue
+    outdated.append((name, version))
+
+  def _resolve(args):
+    name, version = args
+    print ("  Fetching {0}".format(name))
+    return name, get_release_file(name, version)
+
+  def _unchanged(name, sha256):
+    # unpinned package, whose latest release did not change
+    entry = manifest.get(name)
+    return entry and sha256 and entry['sha256'] == sha256 and _up_to_date(name, entry)
+
+  def _fetch(args):
+    name, release = args
+    path, sha256 = store.fetch(name, release)
+    return name, release, path, sha256
+
+  def _unpack(args):
+    name, release, path, sha256 = args
+    if _unchanged(name, sha256): return None
+    print ("Unziping {0}".format(os.path.basename(path)))
+    _extract(path, name, output_dir, patterns)
+    return {'version': release['version'], 'sha256': sha256, 'archive': os.path.basename(path), 'patterns': patterns}
+
+  def _stream(args):
+    name, release = args
+    if _unchanged(name, release['sha256']): return None
+    print ("Streaming {0}".format(release['filename']))
+    sha256 = stream_package(name, release, output_dir, patterns)
+    return {'version': release['version'], 'sha256': sha256, 'archive': release['filename'], 'patterns': patterns}
+
+  if stream:
+    stages = [(_resolve, metadata_workers), (_stream, download_workers)]
+  else:
+    stages = [(_resolve, metadata_workers), (_fetch, download_workers), (_unpack, extract_workers)]
+  results, errors = _pipeline(((n, (n, v)) for n, v in outdated), stages)
+
+  updated = []
+  for name, _ in outdated:
+    if name in errors:
+      print ("Could not download package %s: %s" % (name, errors[name]))
+      # the sandbox may hold a partially extracted copy: retries on the next run
+      manifest.pop(name, None)
+    elif results.get(name) is not None:
+      manifest[name] = results[name]
+      updated.append(name)
+
+  write_manifest(output_dir, manifest)
+  store.evict(keep=[os.path.join(store.directory, e['archive']) for e in manifest.values()])
+  return updated
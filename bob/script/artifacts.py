@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Installs the sub-packages pinned in a requirements file from the artifact
+# cache of bob.artifacts, building only those that are not cached yet, and
+# lists or prunes the cached artifacts
+
+from __future__ import print_function
+
+import sys
+import time
+import argparse
+
+def main(command_line_parameters=None):
+
+  import bob.artifacts
+
+  parser = argparse.ArgumentParser(description="Installs the pinned sub-packages from a cache of built wheels, building those that are missing")
+  parser.add_argument('command', choices=('install', 'list', 'links', 'prune'), help="Installs the requirements, lists the cached artifacts, prints the directory of the artifacts (for --find-links), or removes the artifacts that are not required")
+  parser.add_argument('-r', '--requirements', default='requirements.txt', metavar='FILE', help="The requirements file (default: %(default)s)")
+  parser.add_argument('-d', '--directory', help="The root directory of the cache (default: %s)" % bob.artifacts.default_artifact_dir())
+  parser.add_argument('-p', '--pip-option', action='append', default=[], metavar='OPTION', help="An option of 'pip wheel', used for the builds, like --pip-option=--find-links=URL; may be repeated")
+  args = parser.parse_args(command_line_parameters)
+
+  cache = bob.artifacts.ArtifactCache(args.directory)
+
+  if args.command == 'links':
+    print(cache.links)
+    return 0
+
+  if args.command == 'list':
+    for name, version, path in cache.entries():
+      print("%-30s %-10s %s" % (name, version, path))
+    return 0
+
+  with open(args.requirements) as f:
+    requirements = [l for l in (l.split('#', 1)[0].strip() for l in f) if l]
+
+  if args.command == 'prune':
+    for path in cache.prune(requirements):
+      print("Removed %s" % path)
+    return 0
+
+  def _progress(name, version, hit):
+    print("  %s %s: %s" % (name, version, 'cached' if hit else 'built'))
+
+  start = time.time()
+  try:
+    cache.install(requirements, args.pip_option, _progress)
+  except RuntimeError as e:
+    print(e, file=sys.stderr)
+    return 1
+  print("%d cached, %d built, in %.1f s (artifacts in %s)" % (cache.hits, cache.misses, time.time() - start, cache.links))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Measures the throughput of bob.utils.download against the local stand-in
+# index of bob.test.fake_index, compared to the previous implementation, which
+# read 8 KB blocks and printed a status line for each of them.
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+def _legacy_download(url, output_dir, status_stream):
+  """The implementation of bob.utils.download up to version 2.2.0"""
+  import six
+  file_name = os.path.join(output_dir, url.split('/')[-1])
+  u = six.moves.urllib.request.urlopen(url)
+  f = open(file_name, 'wb')
+  file_size = int(u.info().get("Content-Length"))
+  file_size_dl = 0
+  block_sz = 8192
+  while True:
+    buffer = u.read(block_sz)
+    if not buffer:
+      break
+    file_size_dl += len(buffer)
+    f.write(buffer)
+    status = r"%10d  [%3.2f%%]" % (file_size_dl, file_size_dl * 100. / file_size)
+    status = status + chr(8)*(len(status)+1)
+    print(status, file=status_stream)
+  f.close()
+  u.close()
+  return file_name
+
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Measures the download throughput of bob.utils.download")
+  parser.add_argument('-s', '--size', type=float, default=64, help="The size of the downloaded file, in MB (default: %(default)s)")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help="The number of downloads per implementation; the median is reported (default: %(default)s)")
+  parser.add_argument('-t', '--terminal', action='store_true', help="Prints the status lines of the previous implementation to the terminal, instead of discarding them")
+  args = parser.parse_args(command_line_parameters)
+
+  import bob.utils
+  from bob.test.fake_index import FakeIndex
+
+  size = int(args.size * 1024 * 1024)
+  index = FakeIndex({'payload': {'versions': ['1.0']}}, archive_size=size).start()
+  url = index.document('payload')['urls'][0]['url']
+  output_dir = tempfile.mkdtemp()
+  null = sys.stdout if args.terminal else open(os.devnull, 'w')
+
+  implementations = [
+      ('before', lambda: _legacy_download(url, output_dir, null)),
+      ('after', lambda: bob.utils.download(url, output_dir, progress=None)),
+      ]
+
+  stdout = sys.stdout
+  try:
+    for name, function in implementations:
+      timings = []
+      for _ in range(args.repeat):
+        # the initial status line of bob.utils.download is not measured output
+        sys.stdout = null
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+        sys.stdout = stdout
+      median = sorted(timings)[len(timings)//2]
+      print("%-6s: %8.1f MB/s (median of %d downloads of %.0f MB)" % (name, args.size / median, args.repeat, args.size))
+  finally:
+    sys.stdout = stdout
+    index.stop()
+    shutil.rmtree(output_dir)
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Measures what each dependency of bob costs to import: every package is
+# imported in a fresh interpreter, recording the wall time of the import, the
+# tree of modules it imported (with ``python -X importtime``) and the growth of
+# the resident memory. Results can be saved as JSON and compared to a baseline
+# to flag regressions.
+
+from __future__ import print_function
+
+import sys
+import json
+import argparse
+import platform
+import subprocess
+
+_PROBE = """
+import os, sys, time
+def rss():
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (IOError, OSError):
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+before = rss()
+sys.stderr.write('%(mark)s\\n'); sys.stderr.flush()
+start = time.time()
+import %(module)s
+elapsed = time.time() - start
+sys.stderr.write('%(mark)s\\n'); sys.stderr.flush()
+import json
+print(json.dumps({'time': elapsed, 'rss': rss() - before, 'modules': len(sys.modules)}))
+"""
+_MARK = '-- bob.script.benchmark_imports --'
+
+
+def parse_importtime(output):
+  """
+  Parses the report of ``python -X importtime``
+
+  **Returns**:
+
+    A list of ``(module, depth, self, cumulative)`` tuples, times in seconds,
+    in the order of the report (every module comes after those it imported)
+
+  """
+  tree = []
+  for line in output.splitlines():
+    if not line.startswith('import time:'): continue
+    fields = line[len('import time:'):].split('|')
+    if len(fields) != 3 or not fields[0].strip().isdigit(): continue
+    name = fields[2][1:]
+    depth = (len(name) - len(name.lstrip())) // 2
+    tree.append((name.strip(), depth, int(fields[0]) / 1e6, int(fields[1]) / 1e6))
+  return tree
+
+
+def measure_import(module, python=None):
+  """
+  Imports ``module`` in a fresh interpreter
+
+  **Returns**:
+
+    A dictionary with the ``time`` taken by the import, in seconds, the growth
+    of the resident memory (``rss``), in bytes, the number of ``modules``
+    loaded and, if the interpreter supports it, the import ``tree``; see
+    :py:func:`parse_importtime`
+
+  """
+  python = python or sys.executable
+  command = [python, '-c', _PROBE % {'module': module, 'mark': _MARK}]
+  if sys.version_info >= (3, 7) and python == sys.executable:
+    command[1:1] = ['-X', 'importtime']
+  process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  out, err = process.communicate()
+  out, err = out.decode('utf-8', 'replace'), err.decode('utf-8', 'replace')
+  if process.returncode:
+    lines = [l for l in err.splitlines() if l and not l.startswith('import time:')]
+    raise ImportError(lines[-1] if lines else "cannot import %s" % module)
+  result = json.loads(out.strip().splitlines()[-1])
+  # only the modules imported by the import statement, not by the interpreter startup
+  parts = err.split(_MARK)
+  result['tree'] = parse_importtime(parts[1] if len(parts) == 3 else '')
+  return result
+
+
+def benchmark(modules, repeat=3, python=None):
+  """
+  Measures the import of each module ``repeat`` times, keeping the median
+  time and memory
+
+  **Returns**:
+
+    A dictionary from module names to their measurements, or to
+    ``{'error': message}`` for modules that could not be imported
+
+  """
+  results = {}
+  for module in modules:
+    try:
+      runs = sorted((measure_import(module, python) for _ in range(repeat)), key=lambda r: r['time'])
+    except ImportError as e:
+      results[module] = {'error': str(e)}
+      continue
+    median = runs[len(runs)//2]
+    median['rss'] = sorted(r['rss'] for r in runs)[len(runs)//2]
+    results[module] = median
+  return results
+
+
+def compare(results, baseline, threshold=0.2, min_time=0.005, min_rss=1<<20):
+  """
+  Compares measurements with a baseline
+
+  **Parameters**:
+
+    results, baseline: The ``results`` of two runs of :py:func:`benchmark`
+    threshold: The relative increase above which a measurement regressed
+    min_time, min_rss: The absolute increases, in seconds and bytes, below
+                       which differences are considered noise
+
+  **Returns**:
+
+    A list of ``(module, measure, baseline_value, value)`` tuples
+
+  """
+  regressions = []
+  for module in sorted(results):
+    new, old = results[module], baseline.get(module)
+    if old is None or 'error' in old: continue
+    if 'error' in new:
+      regressions.append((module, 'error', None, new['error']))
+      continue
+    for measure, minimum in (('time', min_time), ('rss', min_rss)):
+      if new[measure] - old[measure] > max(minimum, threshold * old[measure]):
+        regressions.append((module, measure, old[measure], new[measure]))
+  return regressions
+
+
+def _requirements(file_name):
+  from bob.utils import split_requirement
+  with open(file_name) as f:
+    lines = [l.split('#', 1)[0].strip() for l in f]
+  return [split_requirement(l)[0] for l in lines if l]
+
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Measures the time and memory taken to import each dependency of bob")
+  parser.add_argument('modules', nargs='*', help="The modules to import (default: the packages of the requirements file)")
+  parser.add_argument('-r', '--requirements', default='requirements.txt', help="The requirements file listing the packages to import (default: %(default)s)")
+  parser.add_argument('-n', '--repeat', type=int, default=3, help="The number of imports of each module; the median is reported (default: %(default)s)")
+  parser.add_argument('-t', '--top', type=int, default=3, help="The number of most expensive sub-modules listed for each import (default: %(default)s)")
+  parser.add_argument('-o', '--output', metavar='FILE', help="Saves the results, in JSON format, to the given file")
+  parser.add_argument('-b', '--baseline', metavar='FILE', help="Compares the results with those saved in the given file, and fails on regressions")
+  parser.add_argument('--threshold', type=float, default=0.2, help="With --baseline, the relative increase considered a regression (default: %(default)s)")
+  args = parser.parse_args(command_line_parameters)
+
+  modules = args.modules or _requirements(args.requirements)
+  results = benchmark(modules, args.repeat)
+
+  print("%-28s %10s %10s %8s" % ('module', 'time', 'RSS', 'modules'))
+  for module in modules:
+    r = results[module]
+    if 'error' in r:
+      print("%-28s failed: %s" % (module, r['error']))
+      continue
+    print("%-28s %7.1f ms %7.1f MB %8d" % (module, r['time'] * 1000, r['rss'] / 1e6, r['modules']))
+    # the direct imports of the module, and everything else, by cumulative time
+    children = sorted((t for t in r['tree'] if t[0] != module), key=lambda t: -t[3])
+    for name, _, _, cumulative in children[:args.top]:
+      print("  %-26s %7.1f ms" % (name, cumulative * 1000))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'results': results}, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for module, measure, old, new in regressions:
+      if measure == 'error':
+        print("REGRESSION %s: cannot be imported anymore (%s)" % (module, new))
+      elif measure == 'time':
+        print("REGRESSION %s: import time %.1f ms -> %.1f ms" % (module, old * 1000, new * 1000))
+      else:
+        print("REGRESSION %s: RSS growth %.1f MB -> %.1f MB" % (module, old / 1e6, new / 1e6))
+    if regressions: return 1
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
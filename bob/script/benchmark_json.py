@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Measures the time and peak memory taken to get the fields used by bob.utils
+# out of large, synthetic, PyPI JSON documents: by parsing the whole document,
+# as before, and with the streaming extraction of bob.streamjson.
+
+from __future__ import print_function
+
+import io
+import sys
+import json
+import time
+import random
+import argparse
+
+def synthetic_document(releases, description_size, seed=0):
+  """Returns a PyPI-like JSON document (bytes) with the given number of releases"""
+  rng = random.Random(seed)
+  def _file(version):
+    name = 'package-%s.tar.gz' % version
+    return {
+        'comment_text': '', 'downloads': -1, 'filename': name, 'has_sig': False,
+        'md5_digest': '%032x' % rng.getrandbits(128), 'packagetype': 'sdist',
+        'digests': {'md5': '%032x' % rng.getrandbits(128), 'sha256': '%064x' % rng.getrandbits(256)},
+        'python_version': 'source', 'size': rng.randint(10**4, 10**7),
+        'upload_time': '2015-07-20T17:30:00', 'url': 'https://files.example.org/packages/%s' % name,
+        }
+  versions = ['%d.%d.%d' % (i // 100, (i // 10) % 10, i % 10) for i in range(releases)]
+  document = {
+      'info': {
+        'name': 'package', 'version': versions[-1], 'summary': 'A synthetic package',
+        'description': ''.join(rng.choice('abcdefghij \n') for _ in range(description_size)),
+        'classifiers': ['Programming Language :: Python'] * 20, 'requires_dist': ['numpy', 'six'],
+        },
+      'last_serial': 123456,
+      'releases': dict((v, [_file(v), _file(v)]) for v in versions),
+      }
+  document['urls'] = document['releases'][versions[-1]]
+  return json.dumps(document).encode('utf-8')
+
+
+def _measure(function, repeat):
+  import tracemalloc
+  timings = []
+  for _ in range(repeat):
+    start = time.time()
+    function()
+    timings.append(time.time() - start)
+  tracemalloc.start()
+  function()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return sorted(timings)[len(timings)//2], peak
+
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Measures the extraction of fields from large PyPI JSON documents")
+  parser.add_argument('-n', '--releases', type=int, nargs='+', default=[100, 1000, 5000], help="The numbers of releases of the synthetic documents (default: %(default)s)")
+  parser.add_argument('-d', '--description', type=int, default=200000, help="The size of the package description, in characters (default: %(default)s)")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help="The number of measurements; the median time is reported (default: %(default)s)")
+  args = parser.parse_args(command_line_parameters)
+
+  import bob.utils
+  import bob.streamjson
+
+  minimal = {'info': {'version': True}, 'urls': [{'url': True}]}
+
+  print("%9s %9s | %-28s | %-28s | %-28s" % ('releases', 'size', 'json.loads (before)', 'PACKAGE_FIELDS', 'version and URL only'))
+  for releases in args.releases:
+    data = synthetic_document(releases, args.description)
+
+    def _full():
+      document = json.loads(data.decode('utf-8'))
+      return document['info']['version'], list(document['releases'].keys()), document['urls'][0]['url']
+
+    results = [
+        _measure(_full, args.repeat),
+        _measure(lambda: bob.streamjson.extract(io.BytesIO(data), bob.utils.PACKAGE_FIELDS), args.repeat),
+        _measure(lambda: bob.streamjson.extract(io.BytesIO(data), minimal), args.repeat),
+        ]
+    print("%9d %8.1fM | %s" % (releases, len(data) / 1e6, ' | '.join("%9.1f ms %11.1f KB peak" % (t * 1000, p / 1024.) for t, p in results)))
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Measures the latency and throughput of the network paths of bob.utils
+# (get_releases, get_max_version, download and download_packages) against the
+# local stand-in index of bob.test.fake_index, with a configurable latency,
+# bandwidth and error rate. Results can be saved as JSON and compared to a
+# baseline.
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+
+def percentiles(timings, points=(50, 90, 99)):
+  """Returns the given percentiles of a list of timings, as a dictionary ``{'p50': ...}``"""
+  ordered = sorted(timings)
+  return dict(('p%d' % p, ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.))]) for p in points)
+
+
+def _summary(timings, total, count, size=None, failed=0):
+  result = percentiles(timings) if timings else {}
+  result['total'] = total
+  result['failed'] = failed
+  result['per_second'] = count / total if total else None
+  if size is not None: result['mb_per_second'] = size / 1e6 / total if total else None
+  return result
+
+
+def run(index, workers=8, repeat=3):
+  """
+  Runs the benchmarks against a started :py:class:`bob.test.fake_index.FakeIndex`
+
+  **Returns**:
+
+    A dictionary from benchmark names to their results: latency percentiles
+    (``p50``, ``p90``, ``p99``, in seconds) of the successful operations, the
+    ``total`` time, the rate (``per_second``, and ``mb_per_second`` for
+    downloads) and the number of ``failed`` operations
+
+  """
+  import bob.http
+  import bob.cache
+  import bob.utils
+
+  names = sorted(index.packages)
+  results = {}
+  cache_dir = tempfile.mkdtemp()
+  output_dir = tempfile.mkdtemp()
+  stdout = sys.stdout
+  null = open(os.devnull, 'w')
+  try:
+    bob.http.set_index_url(index.url)
+    bob.cache._default_cache = bob.cache.DiskCache(cache_dir)
+
+    # metadata, one query at a time, with an empty cache, then all at once
+    timings = []
+    failed = 0
+    start = time.time()
+    for _ in range(repeat):
+      bob.cache.get_default_cache().clear()
+      for name in names:
+        t = time.time()
+        if bob.utils.get_releases(name): timings.append(time.time() - t)
+        else: failed += 1
+    results['get_releases'] = _summary(timings, time.time() - start, len(timings), failed=failed)
+
+    bob.cache.get_default_cache().clear()
+    start = time.time()
+    try:
+      bob.utils.resolve_versions(names, workers=workers)
+      results['resolve_versions'] = _summary([time.time() - start], time.time() - start, len(names))
+    except Exception:
+      results['resolve_versions'] = _summary([], time.time() - start, 0, failed=1)
+
+    # version ranking, on the release lists now in the cache
+    releases = [r for r in (bob.utils.get_releases(n) for n in names) if r]
+    timings = []
+    start = time.time()
+    for _ in range(repeat):
+      for r in releases:
+        t = time.time()
+        bob.utils.get_max_version(r)
+        timings.append(time.time() - t)
+    results['get_max_version'] = _summary(timings, time.time() - start, len(timings))
+
+    # downloads of the latest archives; status lines are not measured output
+    urls = [index.document(n)['urls'][0]['url'] for n in names]
+    sys.stdout = null
+    timings = []
+    failed = 0
+    size = 0
+    start = time.time()
+    for url in urls:
+      t = time.time()
+      try:
+        file_name = bob.utils.download(url, output_dir, progress=None)
+      except IOError:
+        failed += 1
+        continue
+      timings.append(time.time() - t)
+      size += os.path.getsize(file_name)
+      os.unlink(file_name)
+    results['download'] = _summary(timings, time.time() - start, len(timings), size, failed)
+
+    try:
+      start = time.time()
+      unpacked = bob.utils.download_packages(names, os.path.join(output_dir, 'packages'), metadata_workers=workers)
+      total = time.time() - start
+      results['download_packages'] = _summary([total], total, len(unpacked), size)
+    except ImportError as e:
+      # download_packages requires bob.io.base
+      results['download_packages'] = {'error': str(e)}
+  finally:
+    sys.stdout = stdout
+    null.close()
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = None
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    shutil.rmtree(output_dir, ignore_errors=True)
+  return results
+
+
+def compare(results, baseline, threshold=0.2):
+  """
+  Returns the benchmarks whose median latency increased by more than
+  ``threshold`` (relative) since the baseline, as ``(name, old, new)`` tuples
+  """
+  regressions = []
+  for name in sorted(results):
+    new, old = results[name], baseline.get(name)
+    if old is None or 'p50' not in old or 'p50' not in new: continue
+    if new['p50'] > old['p50'] * (1 + threshold):
+      regressions.append((name, old['p50'], new['p50']))
+  return regressions
+
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Measures the latency and throughput of bob.utils against a local stand-in for PyPI")
+  parser.add_argument('-n', '--packages', type=int, default=30, help="The number of synthetic packages (default: %(default)s)")
+  parser.add_argument('-l', '--latency', type=float, default=20, help="The latency of each response, in milliseconds (default: %(default)s)")
+  parser.add_argument('-w', '--bandwidth', type=float, help="The bandwidth of each connection, in MB/s (default: unlimited)")
+  parser.add_argument('-e', '--error-rate', type=float, default=0., help="The fraction of requests failing with a 503 error (default: %(default)s)")
+  parser.add_argument('-s', '--archive-size', type=float, default=256, help="The size of each archive, in KB (default: %(default)s)")
+  parser.add_argument('-j', '--jobs', type=int, default=8, help="The number of simultaneous queries of resolve_versions and download_packages (default: %(default)s)")
+  parser.add_argument('-r', '--repeat', type=int, default=3, help="The number of passes of the per-query benchmarks (default: %(default)s)")
+  parser.add_argument('-o', '--output', metavar='FILE', help="Saves the results, in JSON format, to the given file")
+  parser.add_argument('-b', '--baseline', metavar='FILE', help="Compares the results with those saved in the given file, and fails on regressions")
+  parser.add_argument('--threshold', type=float, default=0.2, help="With --baseline, the relative increase of the median latency considered a regression (default: %(default)s)")
+  args = parser.parse_args(command_line_parameters)
+
+  from bob.test.fake_index import FakeIndex
+
+  # the local index must be queried, not a resolver daemon or a snapshot
+  os.environ['BOB_RESOLVER_SOCKET'] = ''
+  os.environ.pop('BOB_SNAPSHOT', None)
+
+  bandwidth = args.bandwidth * 1e6 if args.bandwidth else None
+  with FakeIndex(args.packages, int(args.archive_size * 1024), args.latency / 1000., bandwidth, args.error_rate) as index:
+    results = run(index, args.jobs, args.repeat)
+    print("%d packages, %.0f ms latency, %d requests (%d failed) over %d connections" % (args.packages, args.latency, index.requests, index.errors, index.connections))
+
+  print("%-18s %10s %10s %10s %12s %10s" % ('', 'p50', 'p90', 'p99', 'rate', 'MB/s'))
+  for name in ('get_releases', 'resolve_versions', 'get_max_version', 'download', 'download_packages'):
+    r = results[name]
+    if 'error' in r:
+      print("%-18s skipped: %s" % (name, r['error']))
+      continue
+    if 'p50' not in r:
+      print("%-18s failed" % name)
+      continue
+    mb = '%10.1f' % r['mb_per_second'] if r.get('mb_per_second') else '%10s' % '-'
+    failed = ' (%d failed)' % r['failed'] if r['failed'] else ''
+    print("%-18s %7.2f ms %7.2f ms %7.2f ms %10.1f/s %s%s" % (name, r['p50'] * 1000, r['p90'] * 1000, r['p99'] * 1000, r['per_second'], mb, failed))
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'parameters': vars(args), 'results': results}, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for name, old, new in regressions:
+      print("REGRESSION %s: median %.2f ms -> %.2f ms" % (name, old * 1000, new * 1000))
+    if regressions: return 1
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Measures the time taken to select the newest of many releases, with the
+# version engine of bob.versions and with the previous, distutils-based,
+# implementation of bob.utils.get_max_version.
+
+from __future__ import print_function
+
+import sys
+import time
+import random
+import argparse
+
+def _legacy_get_max_version(versions):
+  """The implementation of bob.utils.get_max_version up to version 2.2.0"""
+  import re
+  import warnings
+  import distutils.version
+  warnings.simplefilter('ignore', DeprecationWarning)
+  try:
+    v = list(reversed(sorted([distutils.version.StrictVersion(k) for k in versions])))
+    final = [k for k in v if not k.prerelease]
+    if final: return final[0]
+    return v[0]
+  except:
+    v = list(reversed(sorted([distutils.version.LooseVersion(k) for k in versions])))
+    final = [k for k in v if not re.search(r'[a-z]', k.vstring)]
+    if final: return final[0]
+    return v[0]
+
+
+def synthetic_releases(count, seed=0):
+  """
+  Generates ``count`` distinct release strings, looking like the history of a
+  large package such as numpy: final releases, betas, release candidates and
+  post-releases over several major and minor versions
+  """
+  rng = random.Random(seed)
+  releases = set()
+  while len(releases) < count:
+    base = '%d.%d.%d' % (rng.randint(0, 3), rng.randint(0, 30), rng.randint(0, 12))
+    suffix = rng.choice(['', '', '', 'b1', 'b2', 'rc1', 'rc2', '.post1'])
+    releases.add(base + suffix)
+  releases = list(releases)
+  rng.shuffle(releases)
+  return releases
+
+
+def _measure(function, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.time()
+    result = function()
+    timings.append(time.time() - start)
+  return sorted(timings)[len(timings)//2], result
+
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Measures the time taken to find the newest of many releases")
+  parser.add_argument('-n', '--releases', type=int, default=5000, help="The number of releases of the synthetic package (default: %(default)s)")
+  parser.add_argument('-p', '--packages', type=int, default=30, help="The number of packages given to the batch API (default: %(default)s)")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help="The number of measurements; the median is reported (default: %(default)s)")
+  args = parser.parse_args(command_line_parameters)
+
+  import bob.versions
+
+  releases = synthetic_releases(args.releases)
+
+  def _cold():
+    bob.versions._cache.clear()
+    return bob.versions.get_max_version(releases)
+
+  measurements = [
+      ('engine, cold cache', _cold),
+      ('engine, warm cache', lambda: bob.versions.get_max_version(releases)),
+      ]
+
+  try:
+    # distutils is not available on recent pythons
+    _legacy_get_max_version(['1.0'])
+    measurements.insert(0, ('distutils (before)', lambda: _legacy_get_max_version(releases)))
+  except ImportError:
+    print("distutils is not available: the previous implementation is not measured")
+
+  print("Newest of %d releases:" % args.releases)
+  for name, function in measurements:
+    elapsed, result = _measure(function, args.repeat)
+    print("  %-20s: %9.3f ms  (-> %s)" % (name, elapsed * 1000, result))
+
+  batch = dict(('package%d' % i, synthetic_releases(args.releases // 10, seed=i)) for i in range(args.packages))
+  def _batch():
+    bob.versions._cache.clear()
+    return bob.versions.get_max_versions(batch)
+  elapsed, _ = _measure(_batch, args.repeat)
+  print("Batch of %d packages with %d releases each: %.3f ms" % (args.packages, args.releases // 10, elapsed * 1000))
+
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Builds the documentation of each sub-package as a separate Sphinx project,
+# in parallel, only rebuilding the packages whose version changed, and the
+# umbrella index linking to them (see bob.docs)
+
+from __future__ import print_function
+
+import sys
+import time
+import shlex
+import argparse
+import multiprocessing
+
+def main(command_line_parameters=None):
+
+  import bob.docs
+
+  parser = argparse.ArgumentParser(description="Builds the documentation of the sub-packages in parallel, rebuilding only those whose version changed")
+  parser.add_argument('-i', '--index', default='doc/index.rst', help="The umbrella index (default: %(default)s)")
+  parser.add_argument('-s', '--sandbox', default='doc/temp', help="The directory where the sources of the packages are unpacked (default: %(default)s)")
+  parser.add_argument('-o', '--output-dir', default='sphinx', help="The directory of the documentation (default: %(default)s)")
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help="The maximum number of packages built simultaneously (default: %(default)s)")
+  parser.add_argument('-f', '--force', action='store_true', help="Builds the documentation of all packages again")
+  parser.add_argument('--no-sync', action='store_true', help="Does not update the sources in the sandbox from the requirements of bob")
+  parser.add_argument('--sphinx-build', help="The command running Sphinx (default: %s)" % ' '.join(bob.docs.DEFAULT_SPHINX_BUILD[1:]))
+  args = parser.parse_args(command_line_parameters)
+
+  if not args.no_sync:
+    from bob.utils import get_sub_packages
+    from bob.sandbox import sync_packages
+    from bob.archive import DOC_PATTERNS
+    # the same packages as the single project of doc/conf.py
+    sync_packages(get_sub_packages(), args.sandbox, patterns=DOC_PATTERNS, stream=True)
+
+  def _progress(name, version, status, duration):
+    if status == 'cached':
+      print("  %-32s %-10s cached" % (name, version))
+    elif status == 'built':
+      print("  %-32s %-10s built in %.1f s" % (name, version, duration))
+    else:
+      print("  %-32s %-10s FAILED: %s" % (name, version, status))
+
+  start = time.time()
+  sphinx_build = shlex.split(args.sphinx_build) if args.sphinx_build else bob.docs.DEFAULT_SPHINX_BUILD
+  try:
+    status = bob.docs.build(args.sandbox, args.output_dir, args.index, jobs=args.jobs, sphinx_build=sphinx_build, force=args.force, progress=_progress)
+  except RuntimeError as e:
+    print(e, file=sys.stderr)
+    return 1
+  failed = [n for n, s in status.items() if s not in ('built', 'cached')]
+  print("%d built, %d cached, %d failed, in %.1f s" % (sum(1 for s in status.values() if s == 'built'), sum(1 for s in status.values() if s == 'cached'), len(failed), time.time() - start))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Exports the graph of the (transitive) dependencies of installed packages,
+# or the order in which they should be built. With --png, the image is
+# rendered with Graphviz, which is how dependencies.png is generated:
+#
+#   $ ./bin/dependency_graph.py bob --png dependencies.png
+
+from __future__ import print_function
+
+import sys
+import argparse
+import subprocess
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Exports the dependency graph of installed packages")
+  parser.add_argument('packages', nargs='*', default=['bob'], help="The root packages (default: bob)")
+  parser.add_argument('-f', '--format', choices=('dot', 'json', 'order', 'levels'), default='dot', help="The output format: the graph in DOT or JSON, the build order, or the build order grouped in levels that can be built in parallel (default: %(default)s)")
+  parser.add_argument('-d', '--dependents', metavar='PACKAGE', help="Only lists the packages depending, directly or not, on PACKAGE")
+  parser.add_argument('-o', '--output', help="The output file (default: the standard output)")
+  parser.add_argument('--png', metavar='FILE', help="Renders the graph into the given PNG image, using the 'dot' program of Graphviz")
+  args = parser.parse_args(command_line_parameters)
+
+  from bob.dependencies import DependencyGraph, CycleError
+
+  graph = DependencyGraph(args.packages)
+  for name in sorted(graph.missing):
+    print("Warning: package '%s' is not installed; its dependencies are unknown" % name, file=sys.stderr)
+
+  if args.png:
+    process = subprocess.Popen(['dot', '-Tpng', '-o', args.png], stdin=subprocess.PIPE)
+    process.communicate(graph.to_dot().encode('utf-8'))
+    if process.returncode:
+      return process.returncode
+
+  try:
+    if args.dependents:
+      output = '\n'.join(graph.dependents(args.dependents, transitive=True)) + '\n'
+    elif args.format == 'json':
+      output = graph.to_json() + '\n'
+    elif args.format == 'order':
+      output = '\n'.join(graph.build_order()) + '\n'
+    elif args.format == 'levels':
+      output = ''.join(' '.join(level) + '\n' for level in graph.build_levels())
+    else:
+      output = graph.to_dot()
+  except CycleError as e:
+    print(e, file=sys.stderr)
+    return 1
+
+  if args.png and not args.output and args.format == 'dot' and not args.dependents:
+    # the rendered image was all that was asked for
+    return 0
+  if args.output:
+    with open(args.output, 'w') as f: f.write(output)
+  else:
+    sys.stdout.write(output)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -3,26 +3,91 @@
 # Mon 20 Jul 17:30:00 CEST 2015
 
 # Lists the final version of a given package in PyPI
-# Uses the package 'pkgtools' for such.
+
+from __future__ import print_function
 
 import sys
 import os
-def main():
+import argparse
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), description="Lists the latest version, in PyPI, of each dependency of the given packages")
+  parser.add_argument('packages', nargs='*', metavar='package', help="The packages whose dependencies will be listed; dependencies shared by several packages are only queried once")
+  parser.add_argument('-j', '--jobs', type=int, default=8, help="The maximum number of simultaneous queries to PyPI (default: %(default)s)")
+  parser.add_argument('-x', '--exclude', action='append', default=None, metavar='PACKAGE', help="A dependency that is not listed; may be given several times (default: setuptools)")
+  parser.add_argument('-o', '--output-dir', metavar='DIR', help="Writes the versions of the dependencies of each package to DIR/<package>.txt, instead of the standard output")
+  parser.add_argument('-c', '--consistent', action='store_true', help="Lists the newest versions that can be installed together, honouring the requirements of each pinned release and of all their dependencies, instead of the newest version of each dependency")
+  parser.add_argument('--prereleases', choices=('fallback', 'exclude', 'include'), default='fallback', help="With --consistent, whether pre-releases are considered: only for packages without final releases, never, or always (default: %(default)s)")
+  parser.add_argument('-u', '--update', metavar='FILE', help="Updates, in place, the pinned versions of the given requirements file, only querying the packages that changed in PyPI since the last update")
+  parser.add_argument('-s', '--state', metavar='FILE', help="With --update, the file recording the PyPI serials seen by the last update (default: <requirements>.serials.json)")
+  args = parser.parse_args(command_line_parameters)
+
+  if args.update:
+    from bob.requirements import refresh_requirements
+    changes, errors = refresh_requirements(args.update, args.state, workers=args.jobs)
+    for d, old, new in changes:
+      print("{0}: {1} -> {2}".format(d, old, new))
+    for d, error in errors:
+      print("Could not resolve the version of '{0}': {1}".format(d, error), file=sys.stderr)
+    return 1 if errors else 0
+
+  if not args.packages:
+    parser.error("at least one package name is required, unless --update is given")
+
+  from bob.utils import get_dependencies, resolve_versions, split_requirement, BUILD_ONLY_PACKAGES
+
+  # setuptools is required to install the packages, but is not pinned with them
+  excluded = set(e.lower() for e in (args.exclude or BUILD_ONLY_PACKAGES))
+
+  failed = 0
+  roots = []
+  for package in args.packages:
+    if package in (r[0] for r in roots): continue
+    try:
+      dependencies = get_dependencies(pkg_name = package)
+    except KeyError:
+      print("Package '{0}' is not installed".format(package), file=sys.stderr)
+      failed += 1
+      continue
+    names = [split_requirement(d)[0] for d in dependencies]
+    roots.append((package, [n for n in names if n.lower() not in excluded]))
 
-  try:
-    from bob.utils import get_dependencies, get_releases, get_max_version
+  # each dependency is resolved once, however many packages require it
+  unique = []
+  seen = set()
+  for _, names in roots:
+    for n in names:
+      if n not in seen:
+        seen.add(n)
+        unique.append(n)
+  versions = {}
+  if args.consistent:
+    from bob.solver import Solver, ResolutionImpossible
+    solver = Solver(prereleases=args.prereleases, excluded=excluded, workers=args.jobs)
+    try:
+      versions = solver.solve(unique)
+    except (ResolutionImpossible, IOError) as e:
+      print("Could not resolve consistent versions: {0}".format(e), file=sys.stderr)
+      return 1
+  else:
+    for d, version, error in resolve_versions(unique, workers=args.jobs):
+      if error is not None:
+        print("Could not resolve the version of '{0}': {1}".format(d, error), file=sys.stderr)
+        failed += 1
+        continue
+      versions[d] = version
 
-    if len(sys.argv) != 2:
-      print "usage: %s <package>" % os.path.basename(sys.argv[0])
-      sys.exit(1)  
+  for package, names in roots:
+    lines = ["{0} == {1}".format(d, versions[d]) for d in names if d in versions]
+    if args.output_dir:
+      with open(os.path.join(args.output_dir, package + '.txt'), 'w') as f:
+        f.write(''.join(l + '\n' for l in lines))
+      continue
+    if len(roots) > 1: print("# {0}".format(package))
+    for l in lines: print(l)
 
-    dependencies = get_dependencies(pkg_name = sys.argv[1])
-    for i in range(2,len(dependencies)):
-      d = dependencies[i].split("==")[0]
-      versions = get_releases(d)
-      print "{0} == {1}".format(d,get_max_version(versions))
-  except ImportError:
-    print("Package pkgtools required, please install it.  <https://pypi.python.org/pypi/pkgtools/>")
+  return 1 if failed else 0
 
 if __name__ == '__main__':
-  main()
+  sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Runs, queries or stops the resolver daemon of bob.resolver, which keeps the
+# metadata of packages in memory and answers the queries of bob.utils.
+
+from __future__ import print_function
+
+import sys
+import json
+import signal
+import argparse
+
+def main(command_line_parameters=None):
+
+  import bob.retry
+  import bob.resolver
+
+  parser = argparse.ArgumentParser(description="Runs the resolver daemon, which keeps package metadata in memory")
+  parser.add_argument('command', choices=('serve', 'status', 'stop'), help="Runs the daemon in the foreground, shows its statistics, or stops it")
+  parser.add_argument('-s', '--socket', help="The path of the socket (default: %s)" % bob.resolver.socket_path())
+  parser.add_argument('-r', '--refresh', type=float, default=bob.resolver.DEFAULT_REFRESH, help="With serve, the time, in seconds, between two refreshes of the metadata (default: %(default)s)")
+  parser.add_argument('-e', '--expire', type=float, default=bob.resolver.DEFAULT_EXPIRE, help="With serve, the time, in seconds, after which packages that were not queried are forgotten (default: %(default)s)")
+  parser.add_argument('-H', '--hedge', default='p95', help="With serve, when to send a duplicate of a slow query to the index: a percentile of the recent latencies, a delay in seconds, or 'none' (default: %(default)s)")
+  parser.add_argument('-p', '--preload', metavar='FILE', help="With serve, a requirements file listing packages to load at start")
+  args = parser.parse_args(command_line_parameters)
+
+  path = args.socket or bob.resolver.socket_path()
+  if path is None:
+    parser.error("the use of the resolver is disabled (BOB_RESOLVER_SOCKET is empty); use --socket")
+
+  if args.command == 'serve':
+    preload = []
+    if args.preload:
+      from bob.utils import split_requirement
+      with open(args.preload) as f:
+        preload = [split_requirement(l)[0] for l in (l.split('#', 1)[0].strip() for l in f) if l]
+    # stops cleanly, removing the socket, when terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print("Serving on %s" % path)
+    try:
+      bob.resolver.serve(path, bob.resolver.Resolver(args.refresh, args.expire, hedge=bob.retry.parse_hedge(args.hedge)), preload)
+    except KeyboardInterrupt:
+      pass
+    return 0
+
+  client = bob.resolver.Client(path)
+  try:
+    if args.command == 'status':
+      print(json.dumps(client.call('stats'), indent=2, sort_keys=True))
+    else:
+      client.call('shutdown')
+  except bob.resolver.Unavailable as e:
+    print(e, file=sys.stderr)
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Runs the test suites of the installed sub-packages in parallel shards,
+# balanced with the durations of the previous runs (see bob.shards), and
+# reports the time taken by each package
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import shlex
+import argparse
+import multiprocessing
+
+def main(command_line_parameters=None):
+
+  import bob.shards
+
+  parser = argparse.ArgumentParser(description="Runs the tests of the installed sub-packages in parallel, balancing the shards with the durations of the previous runs")
+  parser.add_argument('packages', nargs='*', help="The packages to test (default: the installed dependencies of bob with tests)")
+  parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help="The number of shards run simultaneously (default: %(default)s)")
+  parser.add_argument('-s', '--shard', metavar='K/N', help="Only runs shard K (counting from 1) of N, to split the tests across machines")
+  parser.add_argument('-c', '--command', help="The command running the tests of a package, where {package} is replaced by its name (default: %s)" % ' '.join(bob.shards.DEFAULT_COMMAND[1:]))
+  parser.add_argument('-H', '--history', metavar='FILE', help="The file recording the durations of the packages (default: %s)" % bob.shards.default_history_file())
+  parser.add_argument('-l', '--log-dir', help="Writes the output of the tests of each package to a file in this directory, instead of only showing the output of failures")
+  parser.add_argument('-o', '--output', metavar='FILE', help="Saves the results, in JSON format, to the given file")
+  parser.add_argument('-n', '--dry-run', action='store_true', help="Only prints the shards")
+  args = parser.parse_args(command_line_parameters)
+
+  packages = args.packages or bob.shards.discover()
+  if not packages:
+    parser.error("no packages with tests were found")
+
+  history_file = args.history or bob.shards.default_history_file()
+  history = bob.shards.load_history(history_file)
+  command = shlex.split(args.command) if args.command else bob.shards.DEFAULT_COMMAND
+
+  if args.shard:
+    try:
+      index, count = [int(n) for n in args.shard.split('/')]
+      if not 1 <= index <= count: raise ValueError
+    except ValueError:
+      parser.error("--shard must be K/N, with 1 <= K <= N")
+    # the other shards are run elsewhere; each shard runs its packages in sequence
+    shards = [s if i == index - 1 else [] for i, s in enumerate(bob.shards.plan(packages, count, history))]
+  else:
+    shards = bob.shards.plan(packages, args.jobs, history)
+
+  for i, shard in enumerate(shards):
+    if not shard: continue
+    estimate = sum(history.get(p, bob.shards.DEFAULT_DURATION) for p in shard)
+    print("shard %d (~%.0fs): %s" % (i, estimate, ' '.join(shard)))
+  if args.dry_run: return 0
+
+  def _progress(result):
+    print("  %-36s %7.1fs %s" % (result['package'], result['duration'], 'FAILED' if result['status'] else 'ok'))
+
+  start = time.time()
+  results = bob.shards.run_shards(shards, command, args.log_dir, _progress)
+  wall_time = time.time() - start
+  bob.shards.save_history(history_file, dict((r['package'], r['duration']) for r in results))
+
+  failures = [r for r in results if r['status']]
+  for r in failures:
+    if 'output' in r:
+      print("\n==== %s ====\n%s" % (r['package'], r['output']))
+  print()
+  bob.shards.report(results, wall_time)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'wall_time': wall_time, 'results': results}, f, indent=2, sort_keys=True)
+
+  return 1 if failures else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
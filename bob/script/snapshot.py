@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+
+# Builds, shows, compares and verifies the snapshots of bob.snapshot
+
+from __future__ import print_function
+
+import sys
+import time
+import argparse
+
+def main(command_line_parameters=None):
+
+  parser = argparse.ArgumentParser(description="Builds, shows, compares and verifies snapshots of the package index")
+  commands = parser.add_subparsers(dest='command')
+
+  build = commands.add_parser('build', help="Queries the index and writes a snapshot of the given packages")
+  build.add_argument('packages', nargs='*', help="The packages to record")
+  build.add_argument('-r', '--requirements', metavar='FILE', help="A requirements file listing packages to record")
+  build.add_argument('-t', '--transitive', action='store_true', help="Also records the requirements of the packages, recursively")
+  build.add_argument('-j', '--jobs', type=int, default=8, help="The maximum number of simultaneous queries to PyPI (default: %(default)s)")
+  build.add_argument('-o', '--output', required=True, metavar='FILE', help="The snapshot file to write")
+
+  show = commands.add_parser('show', help="Lists the packages of a snapshot")
+  show.add_argument('snapshot', help="The snapshot file")
+  show.add_argument('packages', nargs='*', help="Only shows the details of these packages")
+
+  compare = commands.add_parser('diff', help="Lists the differences between two snapshots")
+  compare.add_argument('old', help="The older snapshot file")
+  compare.add_argument('new', help="The newer snapshot file")
+
+  verify = commands.add_parser('verify', help="Checks the integrity of a snapshot")
+  verify.add_argument('snapshot', help="The snapshot file")
+
+  args = parser.parse_args(command_line_parameters)
+  if args.command is None:
+    parser.error("a command is required")
+
+  import bob.snapshot
+
+  if args.command == 'build':
+    names = list(args.packages)
+    if args.requirements:
+      from bob.utils import split_requirement
+      with open(args.requirements) as f:
+        names.extend(split_requirement(l)[0] for l in (l.split('#', 1)[0].strip() for l in f) if l)
+    if not names:
+      parser.error("no packages given")
+    packages, errors = bob.snapshot.collect(names, args.transitive, args.jobs)
+    for name, error in errors:
+      print("Could not query package '{0}': {1}".format(name, error), file=sys.stderr)
+    bob.snapshot.write(args.output, packages)
+    print("{0} packages written to {1}".format(len(packages), args.output))
+    return 1 if errors else 0
+
+  if args.command == 'show':
+    start = time.time()
+    with bob.snapshot.Snapshot(args.snapshot) as snapshot:
+      opened = time.time() - start
+      if not args.packages:
+        print("{0} packages, created {1} (opened in {2:.1f} us)".format(len(snapshot), time.ctime(snapshot.created), opened * 1e6))
+        for p in snapshot.packages():
+          print("{0} == {1}".format(p.name, p.version))
+        return 0
+      failed = 0
+      for name in args.packages:
+        try:
+          p = snapshot.package(name)
+        except KeyError:
+          print("Package '{0}' is not in the snapshot".format(name), file=sys.stderr)
+          failed += 1
+          continue
+        for field in bob.snapshot.Package.fields:
+          print("{0}: {1}".format(field, getattr(p, field)))
+        print()
+      return 1 if failed else 0
+
+  if args.command == 'diff':
+    with bob.snapshot.Snapshot(args.old) as old:
+      with bob.snapshot.Snapshot(args.new) as new:
+        changes = bob.snapshot.diff(old, new)
+    for name, field, a, b in changes:
+      if field == 'package':
+        print("{0}: {1}".format(name, "added ({0})".format(b) if a is None else "removed"))
+      elif field in ('releases', 'requires'):
+        added = [v for v in b if v not in a]
+        removed = [v for v in a if v not in b]
+        print("{0}: {1} {2}".format(name, field, ' '.join(['+' + v for v in added] + ['-' + v for v in removed])))
+      else:
+        print("{0}: {1} {2} -> {3}".format(name, field, a, b))
+    return 1 if changes else 0
+
+  try:
+    with bob.snapshot.Snapshot(args.snapshot) as snapshot:
+      problems = snapshot.verify()
+  except bob.snapshot.SnapshotError as e:
+    problems = [str(e)]
+  for p in problems:
+    print(p, file=sys.stderr)
+  if not problems:
+    print("{0}: OK".format(args.snapshot))
+  return 1 if problems else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
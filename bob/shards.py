@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Runs the test suites of the installed sub-packages in parallel.
+
+Each sub-package with tests is run in its own process (``nosetests`` by
+default). Packages are split into shards of about the same total duration,
+using the durations of the previous runs: the longest packages are placed
+first, each one into the shard with the least work so far. Shards run
+simultaneously, one process at a time each, and the duration of every package
+is recorded for the next run and reported, so that the packages dominating a
+validation are visible.
+
+A single shard of the plan can also be run, to split a validation across
+several machines that see the same durations.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+
+DEFAULT_COMMAND = (sys.executable, '-m', 'nose', '--first-package-wins', '{package}')
+"""The command running the tests of a package; ``{package}`` is replaced by its name"""
+
+DEFAULT_DURATION = 10.
+"""The duration, in seconds, assumed for packages that were never run before"""
+
+
+def default_history_file():
+  """Returns the file recording the durations of the test suites, inside the :py:mod:`bob.cache` directory"""
+  import bob.cache
+  return os.path.join(bob.cache.default_cache_dir(), 'test-durations.json')
+
+
+def has_tests(package):
+  """
+  Tells if the given (importable) package holds tests: ``test*.py`` modules,
+  or a ``test`` or ``tests`` directory
+  """
+  try:
+    from importlib.util import find_spec
+  except ImportError:
+    find_spec = None
+  if find_spec is not None:
+    spec = find_spec(package)
+    directories = spec and spec.submodule_search_locations and list(spec.submodule_search_locations)
+  else:
+    # python 2
+    import pkgutil
+    loader = pkgutil.find_loader(package)
+    directories = loader and loader.is_package(package) and [os.path.dirname(loader.get_filename())]
+  if not directories: return False
+  for d in directories:
+    for f in os.listdir(d):
+      if f in ('test', 'tests') and os.path.isdir(os.path.join(d, f)): return True
+      if f.startswith('test') and f.endswith('.py'): return True
+  return False
+
+
+def discover(roots=('bob',), prefix='bob.'):
+  """
+  Returns the sorted names of the installed packages with tests, among the
+  transitive dependencies of ``roots`` whose name starts with ``prefix``
+  """
+  from bob.dependencies import DependencyGraph
+  graph = DependencyGraph(roots)
+  packages = []
+  for name in graph.nodes:
+    if name in graph.missing or not name.startswith(prefix): continue
+    try:
+      if has_tests(name): packages.append(name)
+    except (ImportError, ValueError, OSError):
+      # an installed distribution whose module is not importable
+      continue
+  return packages
+
+
+def load_history(file_name):
+  """Returns the durations recorded in the given file, as a dictionary from package names to seconds"""
+  try:
+    with open(file_name) as f:
+      return dict((k, float(v)) for k, v in json.load(f).items())
+  except (IOError, OSError, ValueError):
+    return {}
+
+
+def save_history(file_name, durations):
+  """Records the given durations, keeping those of the packages that were not run"""
+  from bob.cache import _replace
+  history = load_history(file_name)
+  history.update(durations)
+  directory = os.path.dirname(file_name)
+  if directory and not os.path.isdir(directory): os.makedirs(directory)
+  temp = file_name + '.tmp'
+  with open(temp, 'w') as f:
+    json.dump(history, f, indent=2, sort_keys=True)
+  _replace(temp, file_name)
+
+
+def plan(packages, shards, history=None, default=DEFAULT_DURATION):
+  """
+  Splits packages into shards of about the same total duration
+
+  Packages are taken from the longest to the shortest, and each one is
+  placed into the shard with the smallest total so far (the "longest
+  processing time first" rule, which is within 4/3 of the best split).
+
+  **Parameters**:
+
+    packages: The names of the packages
+    shards: The number of shards
+    history: A dictionary from package names to their previous durations
+    default: The duration assumed for packages without history; see
+             :py:data:`DEFAULT_DURATION`
+
+  **Returns**:
+
+    A list of ``shards`` lists of package names, each one in the order in
+    which its packages run (longest first)
+
+  """
+  history = history or {}
+  estimate = lambda p: history.get(p, default)
+  ordered = sorted(set(packages), key=lambda p: (-estimate(p), p))
+  result = [[] for _ in range(max(1, shards))]
+  heap = [(0., i) for i in range(len(result))]
+  for package in ordered:
+    load, i = heapq.heappop(heap)
+    result[i].append(package)
+    heapq.heappush(heap, (load + estimate(package), i))
+  return result
+
+
+def run_package(package, command=DEFAULT_COMMAND, log_dir=None):
+  """
+  Runs the tests of a package in a new process
+
+  **Returns**:
+
+    A dictionary with the ``package``, the ``duration`` in seconds, the exit
+    ``status`` and, if ``log_dir`` is given, the ``log`` file holding the output
+    of the tests; otherwise the output is kept in ``output`` for failures
+
+  """
+  import subprocess
+  import bob.trace
+  arguments = [a.format(package=package) for a in command]
+  start = time.time()
+  with bob.trace.span('tests', package=package) as span:
+    if log_dir is not None:
+      log = os.path.join(log_dir, package + '.log')
+      with open(log, 'wb') as f:
+        status = subprocess.call(arguments, stdout=f, stderr=subprocess.STDOUT)
+      output = None
+    else:
+      log = None
+      process = subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+      output = process.communicate()[0].decode('utf-8', 'replace')
+      status = process.returncode
+    span.set(status=status)
+  result = {'package': package, 'duration': time.time() - start, 'status': status}
+  if log is not None: result['log'] = log
+  elif status: result['output'] = output
+  return result
+
+
+def run_shards(shards, command=DEFAULT_COMMAND, log_dir=None, progress=None):
+  """
+  Runs the given shards simultaneously, the packages of each shard one after
+  the other
+
+  **Parameters**:
+
+    shards: A list of lists of package names; see :py:func:`plan`
+    command: The command running the tests of a package; see
+             :py:data:`DEFAULT_COMMAND`
+    log_dir: The directory of the outputs of the tests, or ``None``
+    progress: A function called with the result of each package, as it
+              completes, or ``None``
+
+  **Returns**:
+
+    The list of the results of :py:func:`run_package`, each one with the
+    index of its ``shard``, in the order of completion
+
+  """
+  import threading
+  if log_dir is not None and not os.path.isdir(log_dir): os.makedirs(log_dir)
+  results = []
+  lock = threading.Lock()
+
+  def _run(index, packages):
+    for package in packages:
+      result = run_package(package, command, log_dir)
+      result['shard'] = index
+      with lock:
+        results.append(result)
+        if progress is not None: progress(result)
+
+  threads = [threading.Thread(target=_run, args=(i, s)) for i, s in enumerate(shards) if s]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  return results
+
+
+def report(results, wall_time=None, stream=None):
+  """Prints the duration and status of each package, longest first, and the total of each shard"""
+  stream = stream or sys.stdout
+  total = sum(r['duration'] for r in results)
+  stream.write("%-36s %6s %10s %6s  %s\n" % ('package', 'shard', 'time', 'share', 'status'))
+  for r in sorted(results, key=lambda r: -r['duration']):
+    share = 100. * r['duration'] / total if total else 0.
+    stream.write("%-36s %6d %9.1fs %5.1f%%  %s\n" % (r['package'], r['shard'], r['duration'], share, 'FAILED' if r['status'] else 'ok'))
+  loads = {}
+  for r in results: loads[r['shard']] = loads.get(r['shard'], 0.) + r['duration']
+  stream.write("shards: %s\n" % ', '.join('%d: %.1fs' % (i, loads[i]) for i in sorted(loads)))
+  if wall_time:
+    stream.write("%.1fs of tests in %.1fs (%.1fx)\n" % (total, wall_time, total / wall_time))
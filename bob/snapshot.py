@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Compact, memory-mapped snapshots of the package index.
+
+A snapshot records, for a set of packages, their releases, the chosen
+(newest) version, the archive of that version and its requirements, in a
+binary file that is read through :py:mod:`mmap`. Opening a snapshot only reads
+its header; packages are found by binary search and only the fields that are
+used are decoded, so opening and querying it takes microseconds, and all
+processes reading the same snapshot share its pages.
+
+All integers are little-endian. The file is made of:
+
+* a header (see ``_HEADER``), with the counts of the sections below and the
+  SHA-256 digest of everything that follows it;
+* the string table: ``n_strings + 1`` offsets (``uint32``) into a blob of UTF-8
+  strings, padded to 4 bytes; every string is stored once;
+* the package records (see ``_RECORD``), sorted by normalized name, whose
+  fields are indices in the string table (``0xffffffff`` for missing values)
+  and ranges in the two arrays below;
+* the release array: string indices (``uint32``) of the releases of each
+  package, from the oldest to the newest;
+* the requirement array: string indices (``uint32``) of the requirements of
+  the chosen release of each package.
+
+Setting the ``BOB_SNAPSHOT`` environment variable to the file of a snapshot
+makes :py:mod:`bob.utils` answer queries about the packages in it from the
+snapshot, without contacting the index.
+"""
+
+import os
+import mmap
+import time
+import struct
+import hashlib
+
+_MAGIC = b'BOBSNAP\x00'
+_FORMAT = 1
+_HEADER = struct.Struct('<8sIIIIId32s')
+"""magic, format, n_strings, n_packages, n_releases, n_requires, created, sha256"""
+_RECORD = struct.Struct('<IIIIIIqIIII')
+"""key, name, version, url, filename, sha256, last_serial, first release,
+number of releases, first requirement, number of requirements"""
+_NONE = 0xffffffff
+
+
+class SnapshotError(ValueError):
+  """Raised for files that are not valid snapshots"""
+
+
+def _normalize(name):
+  from bob.requirements import normalize_name
+  return normalize_name(name)
+
+
+class Package(object):
+  """
+  The record of a package in a snapshot
+
+  **Attributes**:
+
+    name: The name of the package
+    version: The chosen release, or ``None`` if it has no release
+    url, filename, sha256: The archive of the chosen release, or ``None``
+    last_serial: The serial of the last change of the package in the index
+    releases: The list of releases, from the oldest to the newest
+    requires: The requirements of the chosen release
+
+  """
+
+  fields = ('name', 'version', 'url', 'filename', 'sha256', 'last_serial', 'releases', 'requires')
+
+  def __init__(self, name, version=None, url=None, filename=None, sha256=None, last_serial=None, releases=(), requires=()):
+    self.name = name
+    self.version = version
+    self.url = url
+    self.filename = filename
+    self.sha256 = sha256
+    self.last_serial = last_serial
+    self.releases = list(releases)
+    self.requires = list(requires)
+
+  def to_dict(self):
+    return dict((f, getattr(self, f)) for f in self.fields)
+
+  def __eq__(self, other):
+    return isinstance(other, Package) and self.to_dict() == other.to_dict()
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return 'Package(%r, %r)' % (self.name, self.version)
+
+
+def write(file_name, packages, created=None):
+  """
+  Writes a snapshot of the given :py:class:`Package` records; the file is
+  replaced atomically
+  """
+  from bob.cache import _replace
+  import bob.versions
+
+  by_key = {}
+  for p in packages: by_key[_normalize(p.name)] = p
+  keys = sorted(by_key, key=lambda k: k.encode('utf-8'))
+
+  index = {}
+  strings = []
+  def _intern(s):
+    if s is None: return _NONE
+    i = index.get(s)
+    if i is None:
+      i = index[s] = len(strings)
+      strings.append(s)
+    return i
+
+  records = []
+  releases = []
+  requires = []
+  for key in keys:
+    p = by_key[key]
+    ordered = bob.versions.sort_versions(p.releases)
+    records.append(_RECORD.pack(
+        _intern(key), _intern(p.name), _intern(p.version), _intern(p.url),
+        _intern(p.filename), _intern(p.sha256),
+        -1 if p.last_serial is None else p.last_serial,
+        len(releases), len(ordered), len(requires), len(p.requires)))
+    releases.extend(_intern(r) for r in ordered)
+    requires.extend(_intern(r) for r in p.requires)
+
+  encoded = [s.encode('utf-8') for s in strings]
+  offsets = [0]
+  for s in encoded: offsets.append(offsets[-1] + len(s))
+  blob = b''.join(encoded)
+  blob += b'\0' * (-len(blob) % 4)
+
+  body = b''.join([
+      struct.pack('<%dI' % len(offsets), *offsets), blob, b''.join(records),
+      struct.pack('<%dI' % len(releases), *releases),
+      struct.pack('<%dI' % len(requires), *requires),
+      ])
+  header = _HEADER.pack(_MAGIC, _FORMAT, len(strings), len(records), len(releases), len(requires),
+      time.time() if created is None else created, hashlib.sha256(body).digest())
+
+  temp = file_name + '.tmp'
+  with open(temp, 'wb') as f:
+    f.write(header)
+    f.write(body)
+  _replace(temp, file_name)
+
+
+class Snapshot(object):
+  """
+  A snapshot, read through :py:mod:`mmap`
+
+  **Parameters**:
+
+    file_name: The file of the snapshot
+
+  **Raises**:
+
+    :py:class:`SnapshotError` if the file is not a snapshot
+
+  """
+
+  def __init__(self, file_name):
+    self.file_name = file_name
+    with open(file_name, 'rb') as f:
+      stat = os.fstat(f.fileno())
+      self._id = (stat.st_ino, stat.st_mtime, stat.st_size)
+      if stat.st_size < _HEADER.size:
+        raise SnapshotError("'%s' is not a snapshot" % file_name)
+      self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, self.n_strings, self.n_packages, self.n_releases, self.n_requires, self.created, self.digest = _HEADER.unpack_from(self._mm, 0)
+    if magic != _MAGIC or version != _FORMAT:
+      self.close()
+      raise SnapshotError("'%s' is not a snapshot (of format %d)" % (file_name, _FORMAT))
+
+    self._offsets = _HEADER.size
+    self._blob = self._offsets + 4 * (self.n_strings + 1)
+    blob_size = struct.unpack_from('<I', self._mm, self._offsets + 4 * self.n_strings)[0] if self._blob <= len(self._mm) else 0
+    self._records = self._blob + blob_size + (-blob_size % 4)
+    self._releases = self._records + _RECORD.size * self.n_packages
+    self._requires = self._releases + 4 * self.n_releases
+    if self._requires + 4 * self.n_requires != len(self._mm):
+      self.close()
+      raise SnapshotError("'%s' is truncated or corrupted" % file_name)
+
+  def close(self):
+    self._mm.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __len__(self):
+    return self.n_packages
+
+  def _string(self, i):
+    if i == _NONE: return None
+    start, end = struct.unpack_from('<II', self._mm, self._offsets + 4 * i)
+    return self._mm[self._blob + start:self._blob + end].decode('utf-8')
+
+  def _raw_string(self, i):
+    start, end = struct.unpack_from('<II', self._mm, self._offsets + 4 * i)
+    return self._mm[self._blob + start:self._blob + end]
+
+  def _record(self, i):
+    return _RECORD.unpack_from(self._mm, self._records + _RECORD.size * i)
+
+  def _array(self, base, start, count):
+    return [self._string(i) for i in struct.unpack_from('<%dI' % count, self._mm, base + 4 * start)]
+
+  def _find(self, name):
+    """Returns the record of the given package, or ``None``"""
+    key = _normalize(name).encode('utf-8')
+    low, high = 0, self.n_packages
+    while low < high:
+      middle = (low + high) // 2
+      record = self._record(middle)
+      k = self._raw_string(record[0])
+      if k == key: return record
+      if k < key: low = middle + 1
+      else: high = middle
+    return None
+
+  def __contains__(self, name):
+    return self._find(name) is not None
+
+  def _package(self, record):
+    return Package(
+        self._string(record[1]), self._string(record[2]), self._string(record[3]),
+        self._string(record[4]), self._string(record[5]),
+        None if record[6] < 0 else record[6],
+        self._array(self._releases, record[7], record[8]),
+        self._array(self._requires, record[9], record[10]))
+
+  def package(self, name):
+    """
+    Returns the :py:class:`Package` record of the given package
+
+    **Raises**:
+
+      :py:class:`KeyError` if the package is not in the snapshot
+
+    """
+    record = self._find(name)
+    if record is None: raise KeyError(name)
+    return self._package(record)
+
+  def names(self):
+    """Returns the names of the packages, sorted by normalized name"""
+    return [self._string(self._record(i)[1]) for i in range(self.n_packages)]
+
+  def packages(self):
+    """Iterates over the :py:class:`Package` records, sorted by normalized name"""
+    for i in range(self.n_packages):
+      yield self._package(self._record(i))
+
+  def query(self, method, package, version=None, prereleases='fallback'):
+    """
+    Answers the queries of :py:mod:`bob.resolver` (``get_releases``,
+    ``get_max_version``, ``get_url`` and ``get_release_file``)
+
+    The newest version is chosen among the releases in the snapshot, following
+    ``prereleases``; the archive is only known for the version chosen when the
+    snapshot was collected.
+
+    **Raises**:
+
+      :py:class:`KeyError` if the snapshot cannot answer the query
+    """
+    from bob.versions import get_max_version
+    record = self._find(package)
+    if record is None: raise KeyError(package)
+    if method == 'get_releases':
+      return self._array(self._releases, record[7], record[8])
+    if method == 'get_max_version' and record[8]:
+      # the chosen version may have been collected under another policy
+      return get_max_version(self._array(self._releases, record[7], record[8]), prereleases)
+    if record[3] == _NONE: raise KeyError(package)
+    chosen = self._string(record[2])
+    if version is None and chosen != get_max_version(self._array(self._releases, record[7], record[8])):
+      # the archive of another release than the default (newest final) one
+      raise KeyError(package)
+    if method == 'get_url':
+      return self._string(record[3])
+    if method == 'get_release_file' and version in (None, chosen):
+      return {'version': chosen, 'url': self._string(record[3]),
+          'filename': self._string(record[4]), 'sha256': self._string(record[5])}
+    raise KeyError(package)
+
+  def verify(self):
+    """
+    Checks the integrity of the snapshot
+
+    **Returns**:
+
+      A list of problems found; it is empty if the snapshot is valid
+
+    """
+    problems = []
+    if hashlib.sha256(self._mm[_HEADER.size:]).digest() != self.digest:
+      problems.append("the digest does not match the contents")
+
+    offsets = struct.unpack_from('<%dI' % (self.n_strings + 1), self._mm, self._offsets)
+    if offsets[0] != 0 or any(a > b for a, b in zip(offsets, offsets[1:])):
+      problems.append("the string offsets are not increasing")
+    for base, count, name in ((self._releases, self.n_releases, 'release'), (self._requires, self.n_requires, 'requirement')):
+      if any(i >= self.n_strings for i in struct.unpack_from('<%dI' % count, self._mm, base)):
+        problems.append("a %s refers to a missing string" % name)
+
+    previous = None
+    for i in range(self.n_packages):
+      record = self._record(i)
+      if any(s != _NONE and s >= self.n_strings for s in record[:6]) or record[0] == _NONE or record[1] == _NONE:
+        problems.append("package %d refers to a missing string" % i)
+        continue
+      key = self._raw_string(record[0])
+      if previous is not None and key <= previous:
+        problems.append("package %d is out of order" % i)
+      previous = key
+      name = self._string(record[1])
+      if _normalize(name) != key.decode('utf-8'):
+        problems.append("package '%s' is stored under '%s'" % (name, key.decode('utf-8')))
+      if record[7] + record[8] > self.n_releases or record[9] + record[10] > self.n_requires:
+        problems.append("the releases or requirements of '%s' are out of bounds" % name)
+    return problems
+
+
+def diff(old, new):
+  """
+  Compares two snapshots
+
+  **Returns**:
+
+    A list of ``(name, field, old_value, new_value)`` tuples, sorted by name.
+    Added and removed packages have the field ``package``, with the chosen
+    version as value; otherwise, ``field`` is one of :py:attr:`Package.fields`.
+
+  """
+  changes = []
+  old_packages = dict((_normalize(p.name), p) for p in old.packages())
+  new_packages = dict((_normalize(p.name), p) for p in new.packages())
+  for key in sorted(set(old_packages) | set(new_packages)):
+    a, b = old_packages.get(key), new_packages.get(key)
+    if a is None:
+      changes.append((b.name, 'package', None, b.version))
+    elif b is None:
+      changes.append((a.name, 'package', a.version, None))
+    else:
+      for field in Package.fields:
+        if getattr(a, field) != getattr(b, field):
+          changes.append((b.name, field, getattr(a, field), getattr(b, field)))
+  return changes
+
+
+def collect(names, transitive=False, workers=8, prereleases='fallback'):
+  """
+  Queries the index for the given packages
+
+  **Parameters**:
+
+    names: The names of the packages
+    transitive: If set, the requirements of the packages are also collected,
+                recursively
+    workers: The maximum number of simultaneous queries to the index
+    prereleases: The policy to choose the version; see :py:func:`bob.versions.get_max_version`
+
+  **Returns**:
+
+    A tuple ``(packages, errors)``: a list of :py:class:`Package` records and
+    a list of ``(name, exception)`` for the packages that could not be queried
+
+  """
+  from bob.utils import get_package_info, get_release_requires, get_max_version, map_concurrently, split_requirement, _release_file, _applies
+
+  def _collect(name):
+    info = get_package_info(name)
+    releases = list(info['releases'].keys())
+    version = get_max_version(releases, prereleases)
+    archive = {}
+    if version is not None:
+      try:
+        archive = _release_file(name, info, version)
+      except ValueError:
+        # a release without files
+        pass
+    if version is not None and version != info['info'].get('version'):
+      # the metadata of the package holds the requirements of its latest release
+      requires = get_release_requires(name, version)
+    else:
+      requires = []
+      for r in info['info'].get('requires_dist') or []:
+        requirement, _, marker = r.partition(';')
+        if not marker.strip() or _applies(marker.strip()):
+          requires.append(requirement.strip())
+    return Package(info['info'].get('name') or name, version, archive.get('url'), archive.get('filename'),
+        archive.get('sha256'), info.get('last_serial'), releases, requires)
+
+  packages = []
+  errors = []
+  seen = set()
+  pending = list(names)
+  while pending:
+    batch = []
+    for name in pending:
+      if _normalize(name) not in seen:
+        seen.add(_normalize(name))
+        batch.append(name)
+    pending = []
+    for name, package, error in map_concurrently(_collect, batch, workers):
+      if error is not None:
+        errors.append((name, error))
+        continue
+      packages.append(package)
+      if transitive:
+        pending.extend(split_requirement(r)[0] for r in package.requires)
+  return packages, errors
+
+
+_default = None
+
+def get_default_snapshot():
+  """
+  Returns the snapshot given by the ``BOB_SNAPSHOT`` environment variable, or
+  ``None``; it is opened again when the file is replaced
+  """
+  global _default
+  file_name = os.environ.get('BOB_SNAPSHOT')
+  if not file_name:
+    return None
+  try:
+    stat = os.stat(file_name)
+  except OSError:
+    return None
+  if _default is None or _default.file_name != file_name or _default._id != (stat.st_ino, stat.st_mtime, stat.st_size):
+    _default = Snapshot(file_name)
+  return _default
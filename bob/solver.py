@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+The newest mutually consistent versions of a set of packages.
+
+Taking the newest release of each dependency on its own, as
+:py:func:`bob.utils.resolve_versions` does, may give pins that cannot be
+installed together: the newest ``bob.learn.em`` may require an older
+``bob.core`` than the newest one. :py:class:`Solver` searches instead for the
+newest versions of all packages (the given ones and everything they require)
+that satisfy the requirements of every pinned release.
+
+Packages are decided one at a time, the one with the fewest candidate
+versions left first, each one trying its versions from the newest. The
+releases of a package are only listed once it is required, and the
+requirements of a release (see :py:func:`bob.utils.get_release_requires`) are
+only fetched when that release is tried; both are memoized. When no version
+of a package is left, the search jumps straight back to the latest decision
+involved in the conflict (conflict-directed backjumping), instead of undoing
+the decisions one by one, and releases requiring versions that do not exist
+are remembered and never tried again.
+"""
+
+import re
+
+from bob.requirements import normalize_name
+
+_REQUIREMENT = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^\]]*\])?\s*(.*?)\s*$')
+
+
+class ResolutionImpossible(ValueError):
+  """
+  Raised by :py:meth:`Solver.solve` when the requirements cannot be satisfied
+  together
+
+  **Attributes**:
+
+    package: The name of the package left without a version
+    requirements: The requirements on that package, as a list of
+                  ``(specifier, required_by)`` pairs, ``required_by`` being a
+                  release like ``bob.core 2.1.2``, or ``None`` for the given
+                  requirements
+    involved: The sorted names of the other packages whose requirements
+              conflicted along the search
+
+  """
+
+  def __init__(self, package, requirements, involved=(), error=None):
+    self.package = package
+    self.requirements = requirements
+    self.involved = sorted(involved)
+    details = ', '.join('%s (required by %s)' % (s or 'any version', r or 'the command line') for s, r in requirements)
+    message = "no version of '%s' satisfies all requirements: %s" % (package, details)
+    if self.involved: message += "; the conflict involves %s" % ', '.join(self.involved)
+    if error is not None: message += "; its releases could not be listed: %s" % error
+    ValueError.__init__(self, message)
+
+
+def parse_requirement(requirement):
+  """
+  Splits a requirement, like ``bob.core (>= 2.0, < 3)`` or ``bob.io.base[hdf5]
+  >= 2``, into the package name and the version specifier (``''`` if there is
+  none); extras and environment markers are dropped
+  """
+  m = _REQUIREMENT.match(requirement.split(';', 1)[0])
+  if m is None:
+    raise ValueError("invalid requirement: '%s'" % requirement)
+  return m.group(1), m.group(2).strip('()').strip()
+
+
+class Solver(object):
+  """
+  Searches for the newest mutually consistent versions of packages
+
+  **Parameters**:
+
+    releases: A function returning the versions of a package; by default,
+              :py:func:`bob.utils.get_releases`
+    requires: A function returning the requirements of a release, given the
+              package name and version; by default,
+              :py:func:`bob.utils.get_release_requires`
+    prereleases: Whether pre-releases are candidates: ``'fallback'`` (only
+                 for packages without final releases), ``'exclude'`` or
+                 ``'include'``; see :py:func:`bob.versions.get_max_version`
+    excluded: Packages that are neither pinned nor looked into, like
+              ``setuptools``
+    workers: The maximum number of simultaneous queries, when new packages
+             are required
+
+  **Attributes**:
+
+    decisions, backjumps, metadata: Counters of the versions tried, of the
+                                    jumps back to an earlier decision, and
+                                    of the releases whose requirements were
+                                    fetched
+
+  """
+
+  def __init__(self, releases=None, requires=None, prereleases='fallback', excluded=(), workers=8):
+    if releases is None:
+      from bob.utils import get_releases
+      releases = lambda name: get_releases(name, raise_errors=True)
+    if requires is None:
+      from bob.utils import get_release_requires
+      requires = get_release_requires
+    if prereleases not in ('fallback', 'exclude', 'include'):
+      raise ValueError("invalid prerelease policy: '%s'" % prereleases)
+    self._list_releases = releases
+    self._list_requires = requires
+    self.prereleases = prereleases
+    self.excluded = set(normalize_name(e) for e in excluded)
+    self.workers = workers
+    self._names = {}
+    self._candidates = {}
+    self._errors = {}
+    self._requires = {}
+    # releases requiring a version that does not exist are never tried again
+    self._nogoods = set()
+    self.decisions = self.backjumps = self.metadata = 0
+
+  def _key(self, name):
+    key = normalize_name(name)
+    self._names.setdefault(key, name)
+    return key
+
+  def candidates(self, name):
+    """Returns the candidate versions of a package, newest first (memoized)"""
+    key = self._key(name)
+    if key not in self._candidates:
+      import bob.versions
+      try:
+        versions = self._list_releases(self._names[key])
+      except Exception as e:
+        self._errors[key] = e
+        versions = []
+      finals = [v for v in versions if not bob.versions.is_prerelease(v)]
+      if self.prereleases == 'exclude' or (self.prereleases == 'fallback' and finals):
+        versions = finals
+      self._candidates[key] = bob.versions.sort_versions(versions, reverse=True)
+    return self._candidates[key]
+
+  def dependencies(self, name, version):
+    """
+    Returns the requirements of a release, as a list of ``(package,
+    specifier)`` pairs, the package names being normalized (memoized)
+    """
+    key = (self._key(name), version)
+    if key not in self._requires:
+      result = []
+      for r in self._list_requires(self._names[key[0]], version):
+        package, specifier = parse_requirement(r)
+        if normalize_name(package) not in self.excluded:
+          result.append((self._key(package), specifier))
+      self.metadata += 1
+      self._requires[key] = result
+    return self._requires[key]
+
+  def _prefetch(self, names):
+    """Lists the releases of new packages, and the requirements of their newest one, simultaneously"""
+    from bob.utils import map_concurrently
+    names = [n for n in names if n not in self._candidates]
+
+    def _fetch(name):
+      versions = self.candidates(name)
+      if versions: self.dependencies(name, versions[0])
+
+    # errors are raised again, or recorded, when the search gets there
+    map_concurrently(_fetch, names, self.workers)
+
+  @staticmethod
+  def _matches(version, specifier):
+    import bob.versions
+    try:
+      return bob.versions.matches(version, specifier)
+    except bob.versions.InvalidSpecifier:
+      # a malformed specifier in the metadata of a release does not restrict it
+      return True
+
+  def _remaining(self, name, constraints):
+    """
+    Returns the candidates of a package satisfying its constraints, and the
+    decisions whose constraints removed some of the others
+    """
+    versions = [v for v in self.candidates(name) if (name, v) not in self._nogoods]
+    remaining = []
+    for v in versions:
+      if all(self._matches(v, s) for s, _ in constraints[name]): remaining.append(v)
+    culprits = set()
+    if len(remaining) < len(versions):
+      for specifier, origin in constraints[name]:
+        if origin is not None and not all(self._matches(v, specifier) for v in versions):
+          culprits.add(origin)
+    return remaining, culprits
+
+  def _try(self, frame, pins, constraints):
+    """
+    Pins the next candidate of a decision that is compatible with the
+    current pins and constraints
+
+    **Returns**:
+
+      ``True`` if a candidate was pinned, ``False`` if none is left; the
+      decisions involved in the rejections are added to the conflicts of the
+      frame, and the packages involved to its ``involved`` set
+
+    """
+    name = frame['name']
+    while frame['candidates']:
+      version = frame['candidates'].pop(0)
+      self.decisions += 1
+      dependencies = self.dependencies(name, version)
+      rejected = False
+      for package, specifier in dependencies:
+        if package in pins or package in constraints or not self.candidates(package):
+          frame['involved'].add(package)
+        if package in pins:
+          if not self._matches(pins[package], specifier):
+            frame['conflicts'].add(package)
+            rejected = True
+            break
+          continue
+        if not any(self._matches(v, specifier) for v in self.candidates(package)):
+          # no release of the package satisfies the requirement, whatever the other pins
+          self._nogoods.add((name, version))
+          rejected = True
+          break
+        others = constraints.get(package, [])
+        if not any(self._matches(v, specifier) and all(self._matches(v, s) for s, _ in others) for v in self.candidates(package)):
+          frame['conflicts'].update(o for _, o in others if o is not None)
+          rejected = True
+          break
+      if rejected: continue
+
+      pins[name] = version
+      frame['version'] = version
+      new = [p for p, _ in dependencies if p not in constraints]
+      for package, specifier in dependencies:
+        constraints.setdefault(package, []).append((specifier, name))
+      self._prefetch(new)
+      return True
+    return False
+
+  @staticmethod
+  def _undo(frame, pins, constraints):
+    name = frame['name']
+    pins.pop(name, None)
+    for package in list(constraints):
+      constraints[package] = [c for c in constraints[package] if c[1] != name]
+      if not constraints[package]: del constraints[package]
+
+  def _impossible(self, frame, constraints, pins):
+    name = frame['name']
+    requirements = [(s, None if o is None else '%s %s' % (self._names[o], pins[o])) for s, o in constraints[name]]
+    involved = [self._names[n] for n in frame['involved'] if n != name]
+    return ResolutionImpossible(self._names[name], requirements, involved, self._errors.get(name))
+
+  def solve(self, requirements):
+    """
+    Searches for the newest versions satisfying the given requirements and,
+    transitively, the requirements of the chosen releases
+
+    **Parameters**:
+
+      requirements: The requirements, like ``['bob.core', 'bob.io.base >= 2']``
+
+    **Returns**:
+
+      A dictionary from the names of all the required packages to their
+      version
+
+    **Raises**:
+
+      :py:class:`ResolutionImpossible` if no set of versions satisfies the
+      requirements
+
+    """
+    import bob.trace
+
+    constraints = {}
+    order = {}
+    for r in requirements:
+      package, specifier = parse_requirement(r)
+      key = self._key(package)
+      if key in self.excluded: continue
+      constraints.setdefault(key, []).append((specifier, None))
+      order.setdefault(key, len(order))
+
+    pins = {}
+    stack = []
+    with bob.trace.span('solver', packages=len(constraints)) as span:
+      self._prefetch(list(constraints))
+      while True:
+        pending = [n for n in constraints if n not in pins]
+        if not pending: break
+        for n in pending: order.setdefault(n, len(order))
+
+        # the most constrained package first, so that conflicts show early
+        choices = [(n,) + self._remaining(n, constraints) for n in pending]
+        name, remaining, culprits = min(choices, key=lambda c: (len(c[1]), order[c[0]]))
+        stack.append({'name': name, 'candidates': remaining, 'conflicts': culprits, 'involved': set(culprits), 'version': None})
+
+        while not self._try(stack[-1], pins, constraints):
+          frame = stack[-1]
+          # the package is only required because of the decisions constraining it
+          conflicts = frame['conflicts'] | set(o for _, o in constraints[frame['name']] if o is not None)
+          conflicts -= set([frame['name']])
+          culprits = [i for i, f in enumerate(stack[:-1]) if f['name'] in conflicts]
+          if not culprits:
+            raise self._impossible(frame, constraints, pins)
+          # jumps back to the latest decision involved, undoing all decisions after it
+          target = culprits[-1]
+          for f in reversed(stack[target:]): self._undo(f, pins, constraints)
+          stack[target]['conflicts'].update(conflicts - set([stack[target]['name']]))
+          stack[target]['involved'].update(frame['involved'] | set([frame['name']]))
+          del stack[target+1:]
+          self.backjumps += 1
+
+      span.set(decisions=self.decisions, backjumps=self.backjumps, metadata=self.metadata)
+
+    return dict((self._names[n], v) for n, v in pins.items())
+
+
+def solve(requirements, excluded=('setuptools',), prereleases='fallback', workers=8):
+  """
+  Returns the newest mutually consistent versions of the given requirements
+  and their dependencies, from PyPI; see :py:meth:`Solver.solve`
+  """
+  return Solver(prereleases=prereleases, excluded=excluded, workers=workers).solve(requirements)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Selective, incremental extraction of fields from JSON documents.
+
+Package documents served by the index hold the full history of releases and
+long descriptions, of which only a few fields are used. :py:func:`extract`
+reads a document from a stream, chunk by chunk, and only builds the python
+objects for the requested fields. All other values are skipped with regular
+expressions, without being decoded, so the memory used is bounded by the
+chunk size and the largest single value, not by the size of the document.
+
+The fields to extract are described by a template:
+
+* a dictionary selects the given keys of an object, ``'*'`` standing for any
+  other key, and applies the corresponding templates to their values;
+* a list with a single template applies it to every element of an array;
+* ``True`` keeps the value as it is;
+* ``False`` keeps the key, but skips its value, which is replaced by
+  ``None``: ``{'*': False}`` lists the keys of an object.
+"""
+
+import re
+import json
+import codecs
+
+from json.decoder import scanstring
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_SCALAR = re.compile(r'[^,\]}\s]+')
+_decoder = json.JSONDecoder()
+
+
+def _project(value, template):
+  """Returns the parts of an already decoded value selected by ``template``"""
+  if template is False:
+    return None
+  if isinstance(template, dict) and isinstance(value, dict):
+    result = {}
+    for key, v in value.items():
+      sub = template.get(key, template.get('*'))
+      if sub is not None: result[key] = _project(v, sub)
+    return result
+  if isinstance(template, list) and isinstance(value, list):
+    return [_project(v, template[0]) for v in value]
+  return value
+
+
+class _Scanner(object):
+  """Reads JSON tokens from a stream of bytes, keeping a small window of it in memory"""
+
+  def __init__(self, stream, chunk_size):
+    self.stream = stream
+    self.chunk_size = chunk_size
+    self.decoder = codecs.getincrementaldecoder('utf-8')()
+    self.buf = u''
+    self.pos = 0
+    self.mark = None
+    self.eof = False
+
+  def more(self):
+    """Reads the next chunk; returns ``False`` at the end of the stream"""
+    if self.eof: return False
+    data = self.stream.read(self.chunk_size)
+    if not data:
+      self.eof = True
+      text = self.decoder.decode(b'', True)
+    else:
+      text = self.decoder.decode(data)
+    # drops what was consumed, except what is being captured
+    keep = self.pos if self.mark is None else self.mark
+    self.buf = self.buf[keep:] + text
+    self.pos -= keep
+    if self.mark is not None: self.mark -= keep
+    return bool(data) or bool(text)
+
+  def peek(self):
+    """Skips whitespace and returns the next character, or ``None`` at the end"""
+    while True:
+      self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+      if self.pos < len(self.buf): return self.buf[self.pos]
+      if not self.more(): return None
+
+  def expect(self, char):
+    if self.peek() != char:
+      raise ValueError("expected '%s' at offset %d of the current window" % (char, self.pos))
+    self.pos += 1
+
+  def _string_end(self, start):
+    """
+    Returns the position following the closing quote of the string whose
+    contents start at ``start``, or ``None`` if it is not in the window
+    """
+    buf = self.buf
+    while True:
+      end = buf.find('"', start)
+      if end < 0: return None
+      escapes = end - 1
+      while escapes >= self.pos and buf[escapes] == '\\': escapes -= 1
+      if (end - 1 - escapes) % 2 == 0: return end + 1
+      start = end + 1
+
+  def string(self):
+    """Decodes the string starting at the current position"""
+    self.peek()
+    scanned = 1
+    while True:
+      end = self._string_end(self.pos + scanned)
+      if end is not None:
+        value, self.pos = scanstring(self.buf, self.pos + 1)
+        return value
+      # the quotes scanned so far are not searched again
+      scanned = max(1, len(self.buf) - self.pos)
+      if not self.more(): raise ValueError("unterminated string")
+
+  def _skip_string(self):
+    self.pos += 1
+    while True:
+      end = self._string_end(self.pos)
+      if end is not None:
+        self.pos = end
+        return
+      if self.mark is None:
+        # drops the part of the string already scanned, except a trailing
+        # run of backslashes, which may escape the next character
+        end = len(self.buf)
+        while end > self.pos and self.buf[end-1] == '\\': end -= 1
+        self.pos = end
+      if not self.more(): raise ValueError("unterminated string")
+
+  def skip(self):
+    """Skips the value starting at the current position, without decoding it"""
+    c = self.peek()
+    if c == '"':
+      return self._skip_string()
+    if c in ('{', '['):
+      try:
+        # values entirely in the window are skipped by the (fast) json decoder
+        self.pos = _decoder.raw_decode(self.buf, self.pos)[1]
+        return
+      except ValueError:
+        pass
+    else:
+      while True:
+        m = _SCALAR.match(self.buf, self.pos)
+        if m is None: raise ValueError("unexpected character '%s'" % c)
+        # a scalar reaching the end of the window may continue in the next chunk
+        if m.end() < len(self.buf) or not self.more(): break
+      self.pos = _SCALAR.match(self.buf, self.pos).end()
+      return
+
+    depth = 0
+    while True:
+      m = _STRUCTURE.search(self.buf, self.pos)
+      if m is None:
+        self.pos = len(self.buf)
+        if not self.more(): raise ValueError("unterminated value")
+        continue
+      c = m.group()
+      self.pos = m.start()
+      if c == '"':
+        self._skip_string()
+        continue
+      if c in '{[' and depth:
+        try:
+          self.pos = _decoder.raw_decode(self.buf, self.pos)[1]
+          continue
+        except ValueError:
+          pass
+      self.pos += 1
+      if c in '{[':
+        depth += 1
+      else:
+        depth -= 1
+        if not depth: return
+
+  def capture(self):
+    """Decodes the value starting at the current position"""
+    c = self.peek()
+    if c == '"':
+      return self.string()
+    if c in ('{', '['):
+      try:
+        value, self.pos = _decoder.raw_decode(self.buf, self.pos)
+        return value
+      except ValueError:
+        pass
+    self.mark = self.pos
+    try:
+      self.skip()
+      return json.loads(self.buf[self.mark:self.pos])
+    finally:
+      self.mark = None
+
+  def value(self, template):
+    """Decodes the parts of the value at the current position selected by ``template``"""
+    if template is True:
+      return self.capture()
+    if template is False:
+      self.skip()
+      return None
+    c = self.peek()
+
+    if c in ('{', '['):
+      try:
+        # values entirely in the window are decoded by the (fast) json decoder
+        value, end = _decoder.raw_decode(self.buf, self.pos)
+        self.pos = end
+        return _project(value, template)
+      except ValueError:
+        pass
+
+    if isinstance(template, dict) and c == '{':
+      self.pos += 1
+      result = {}
+      if self.peek() == '}':
+        self.pos += 1
+        return result
+      while True:
+        key = self.string()
+        self.expect(':')
+        sub = template.get(key, template.get('*'))
+        if sub is None:
+          self.skip()
+        else:
+          result[key] = self.value(sub)
+        c = self.peek()
+        self.pos += 1
+        if c == '}': return result
+        if c != ',': raise ValueError("expected ',' or '}' in object")
+
+    if isinstance(template, list) and c == '[':
+      self.pos += 1
+      result = []
+      if self.peek() == ']':
+        self.pos += 1
+        return result
+      while True:
+        result.append(self.value(template[0]))
+        c = self.peek()
+        self.pos += 1
+        if c == ']': return result
+        if c != ',': raise ValueError("expected ',' or ']' in array")
+
+    # the value does not have the expected type (e.g. null): kept as it is
+    return self.capture()
+
+
+def extract(stream, template, chunk_size=65536):
+  """
+  Extracts the fields selected by ``template`` from the JSON document read
+  from ``stream``
+
+  **Parameters**:
+
+    stream: A readable stream returning bytes, like an HTTP response
+    template: The fields to extract, as described in :py:mod:`bob.streamjson`
+    chunk_size: The number of bytes read at once
+
+  **Returns**:
+
+    The selected parts of the document
+
+  """
+  return _Scanner(stream, chunk_size).value(template)
+
+
+def loads(data, template):
+  """Extracts the fields selected by ``template`` from the given JSON document (bytes)"""
+  import io
+  return extract(io.BytesIO(data), template)
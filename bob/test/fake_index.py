@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+A local stand-in for the package index, to measure and test the network code
+of :py:mod:`bob.utils` without PyPI.
+
+It serves, over HTTP/1.1 with keep-alive connections, the JSON documents of
+synthetic packages at ``<url>/<name>/json`` (and of each of their releases, at
+``<url>/<name>/<version>/json``) and their source archives (zip
+files, with a ``doc`` directory) at ``/packages/<name>-<version>.zip``. The
+latency of each response, the bandwidth of each connection, the rate of
+failing requests and the size of the archives are configurable::
+
+  with FakeIndex(packages=20, latency=0.02) as index:
+    bob.http.set_index_url(index.url)
+    ...
+"""
+
+import io
+import os
+import json
+import time
+import random
+import hashlib
+import zipfile
+import threading
+
+
+def synthetic_packages(count, releases=10, seed=0):
+  """
+  Returns a dictionary describing ``count`` packages, ``bob.fake.<i>``, each
+  with ``releases`` versions and requiring up to 3 of the previous packages
+  """
+  rng = random.Random(seed)
+  packages = {}
+  names = ['bob.fake.%03d' % i for i in range(count)]
+  for i, name in enumerate(names):
+    versions = ['%d.%d.%d' % (j // 10 + 1, j % 10, 0) for j in range(releases)]
+    if rng.random() < 0.3: versions.append('%d.0.0b1' % (releases // 10 + 2))
+    packages[name] = {
+        'versions': versions,
+        'requires': rng.sample(names[:i], min(i, rng.randint(0, 3))),
+        }
+  return packages
+
+
+class FakeIndex(object):
+  """
+  A threaded HTTP server imitating the JSON API of PyPI
+
+  **Parameters**:
+
+    packages: A dictionary from package names to dictionaries with their
+              ``versions`` and ``requires``, or a number of packages to
+              generate; see :py:func:`synthetic_packages`. ``requires`` is a
+              list of requirements, like ``bob.core (>=2.0)``, or a
+              dictionary from versions to the requirements of each release
+    archive_size: The approximate size, in bytes, of each archive
+    latency: The time, in seconds, waited before each response
+    bandwidth: The maximum number of bytes per second sent on each
+               connection, or ``None``
+    error_rate: The fraction of requests answered with a ``503`` error
+    seed: The seed of the random generator deciding the failing requests
+
+  **Attributes**:
+
+    url: The base URL of the index, to be given to :py:func:`bob.http.set_index_url`
+    requests, errors, connections, bytes_sent: Counters, since the start
+
+  """
+
+  def __init__(self, packages=10, archive_size=65536, latency=0., bandwidth=None, error_rate=0., seed=0):
+    self.packages = synthetic_packages(packages) if isinstance(packages, int) else packages
+    self.archive_size = archive_size
+    self.latency = latency
+    self.bandwidth = bandwidth
+    self.error_rate = error_rate
+    self.requests = self.errors = self.connections = self.bytes_sent = 0
+    self._rng = random.Random(seed)
+    self._lock = threading.Lock()
+    self._archives = {}
+    self._server = None
+
+  def archive(self, name, version):
+    """Returns the zip archive (bytes) of the given release"""
+    key = (name, version)
+    with self._lock:
+      data = self._archives.get(key)
+    if data is not None: return data
+
+    root = '%s-%s' % (name, version)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+      archive.writestr(root + '/version.txt', version + '\n')
+      archive.writestr(root + '/README.rst', '%s\n%s\n' % (name, '=' * len(name)))
+      archive.writestr(root + '/doc/index.rst', '%s %s\n' % (name, version))
+      # incompressible contents, stored as they are, make up the requested size
+      padding = os.urandom(max(self.archive_size - 512, 1))
+      archive.writestr(zipfile.ZipInfo(root + '/src/data.bin'), padding)
+    data = buffer.getvalue()
+    with self._lock:
+      self._archives[key] = data
+    return data
+
+  def requires(self, name, version):
+    """Returns the requirements of the given release"""
+    requires = self.packages[name].get('requires', [])
+    if isinstance(requires, dict): requires = requires.get(version, [])
+    return list(requires)
+
+  def document(self, name, version=None):
+    """
+    Returns the JSON document (a dictionary) of the given package or, if
+    ``version`` is given, of one of its releases
+    """
+    package = self.packages[name]
+
+    def _file(version):
+      file_name = '%s-%s.zip' % (name, version)
+      return {
+          'filename': file_name, 'packagetype': 'sdist', 'python_version': 'source',
+          'url': '%s/packages/%s' % (self.base, file_name),
+          'digests': {'sha256': hashlib.sha256(self.archive(name, version)).hexdigest()},
+          }
+
+    versions = package['versions']
+    finals = [v for v in versions if not any(c.isalpha() for c in v)]
+    latest = (finals or versions)[-1]
+    info = {'name': name, 'version': version or latest, 'summary': 'A synthetic package',
+        'description': 'A synthetic package served by bob.test.fake_index\n' * 50,
+        'requires_dist': self.requires(name, version or latest)}
+    if version is not None:
+      return {'info': info, 'last_serial': sum(ord(c) for c in name) + len(versions), 'urls': [_file(version)]}
+    return {
+        'info': info,
+        'last_serial': sum(ord(c) for c in name) + len(versions),
+        'releases': dict((v, [_file(v)]) for v in versions),
+        'urls': [_file(latest)],
+        }
+
+  def _should_fail(self):
+    with self._lock:
+      self.requests += 1
+      fail = self.error_rate and self._rng.random() < self.error_rate
+      if fail: self.errors += 1
+    return fail
+
+  def _count(self, connections=0, sent=0):
+    with self._lock:
+      self.connections += connections
+      self.bytes_sent += sent
+
+  def start(self):
+    """Starts serving, in a background thread"""
+    import six
+    index = self
+
+    class Handler(six.moves.BaseHTTPServer.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+      # headers and body are written separately: with Nagle's algorithm, each
+      # small response would wait for the delayed ACK of the client
+      disable_nagle_algorithm = True
+
+      def setup(self):
+        six.moves.BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        index._count(connections=1)
+
+      def _send(self, status, body, content_type='application/octet-stream', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers: self.send_header(*header)
+        self.end_headers()
+        if self.command == 'HEAD': return
+        if index.bandwidth is None:
+          self.wfile.write(body)
+        else:
+          start = time.time()
+          for offset in range(0, len(body), 16384):
+            self.wfile.write(body[offset:offset+16384])
+            delay = start + (offset + 16384.) / index.bandwidth - time.time()
+            if delay > 0: time.sleep(delay)
+        index._count(sent=len(body))
+
+      def do_GET(self):
+        if index.latency: time.sleep(index.latency)
+        if index._should_fail():
+          return self._send(503, b'Service Unavailable', 'text/plain')
+
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) in (3, 4) and parts[0] == 'pypi' and parts[-1] == 'json' and parts[1] in index.packages:
+          version = parts[2] if len(parts) == 4 else None
+          if version is not None and version not in index.packages[parts[1]]['versions']:
+            return self._send(404, b'Not Found', 'text/plain')
+          body = json.dumps(index.document(parts[1], version)).encode('utf-8')
+          etag = '"%s"' % hashlib.sha1(body).hexdigest()
+          if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', headers=[('ETag', etag)])
+          return self._send(200, body, 'application/json', [('ETag', etag)])
+        if len(parts) == 2 and parts[0] == 'packages' and parts[1].endswith('.zip'):
+          name, _, version = parts[1][:-4].rpartition('-')
+          if name in index.packages and version in index.packages[name]['versions']:
+            return self._send(200, index.archive(name, version), 'application/zip')
+        self._send(404, b'Not Found', 'text/plain')
+
+      do_HEAD = do_GET
+
+      def log_message(self, *args):
+        pass
+
+    class Server(six.moves.socketserver.ThreadingMixIn, six.moves.BaseHTTPServer.HTTPServer):
+      daemon_threads = True
+      request_queue_size = 128
+
+    self._server = Server(('127.0.0.1', 0), Handler)
+    self.base = 'http://127.0.0.1:%d' % self._server.server_address[1]
+    self.url = self.base + '/pypi'
+    thread = threading.Thread(target=self._server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return self
+
+  def stop(self):
+    """Stops serving"""
+    if self._server is not None:
+      self._server.shutdown()
+      self._server.server_close()
+      self._server = None
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *exc):
+    self.stop()
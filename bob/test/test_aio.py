@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the coroutines of bob.aio, against the fake index"""
+
+import sys
+import shutil
+import tempfile
+
+import bob.http
+import bob.cache
+import bob.retry
+from bob.test.fake_index import FakeIndex
+
+
+def _setup():
+  directory = tempfile.mkdtemp()
+  saved = bob.cache._default_cache
+  bob.cache._default_cache = bob.cache.DiskCache(directory)
+  policy = bob.retry.RetryPolicy(attempts=10, backoff=0.001)
+  bob.retry.set_policy(policy)
+
+  def _teardown():
+    bob.retry.set_policy(None)
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved
+    shutil.rmtree(directory)
+
+  return policy, _teardown
+
+
+def test_retries():
+  if sys.version_info < (3, 5):
+    from unittest import SkipTest
+    raise SkipTest("bob.aio requires python 3.5")
+  import bob.aio
+  from bob.versions import get_max_version
+
+  policy, teardown = _setup()
+  try:
+    with FakeIndex(20, error_rate=0.3, seed=1) as index:
+      bob.http.set_index_url(index.url)
+      names = sorted(index.packages)
+      results = bob.aio.run(bob.aio.resolve_versions(names))
+      assert [e for _, _, e in results if e is not None] == []
+      assert [v for _, v, _ in results] == [get_max_version(index.packages[n]['versions']) for n in names]
+      assert index.errors > 0 and policy.retries >= index.errors
+  finally:
+    teardown()
+
+
+def test_unknown_package():
+  if sys.version_info < (3, 5):
+    from unittest import SkipTest
+    raise SkipTest("bob.aio requires python 3.5")
+  import bob.aio
+
+  policy, teardown = _setup()
+  try:
+    with FakeIndex(2) as index:
+      bob.http.set_index_url(index.url)
+      assert bob.aio.run(bob.aio.get_releases('bob.missing')) == []
+      try:
+        bob.aio.run(bob.aio.get_releases('bob.missing', raise_errors=True))
+      except bob.http.HTTPError as e:
+        assert e.code == 404
+      else:
+        raise AssertionError("the error was not raised")
+      # a 404 is not transient
+      assert policy.retries == 0
+  finally:
+    teardown()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the on-disk metadata cache of bob.cache"""
+
+import os
+import time
+import shutil
+import tempfile
+
+from bob.cache import DiskCache, CacheEntry, fetch
+from bob.test.fake_index import FakeIndex
+
+
+def test_revalidation():
+  directory = tempfile.mkdtemp()
+  try:
+    with FakeIndex(3) as index:
+      cache = DiskCache(directory, ttl=3600)
+      url = index.url + '/bob.fake.000/json'
+      body = fetch(url, cache=cache)
+      # the counters of the index are updated once the response is sent
+      time.sleep(0.1)
+      requests, sent = index.requests, index.bytes_sent
+
+      # fresh: served without contacting the index
+      assert fetch(url, cache=cache) == body
+      assert index.requests == requests
+
+      # stale, but unchanged: revalidated with a 304, without a body
+      assert fetch(url, cache=cache, max_age=0) == body
+      assert index.requests == requests + 1
+      time.sleep(0.1)
+      assert index.bytes_sent == sent
+
+      # changed: downloaded again
+      index.packages['bob.fake.000']['versions'].append('9.0.0')
+      changed = fetch(url, cache=cache, max_age=0)
+      assert changed != body and b'9.0.0' in changed
+      assert index.requests == requests + 2
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_offline():
+  directory = tempfile.mkdtemp()
+  try:
+    cache = DiskCache(directory, offline=True)
+    try:
+      fetch('http://127.0.0.1:1/pypi/missing/json', cache=cache)
+    except IOError:
+      pass
+    else:
+      raise AssertionError("a missing entry was served offline")
+    cache.put('http://127.0.0.1:1/pypi/old/json', CacheEntry('http://127.0.0.1:1/pypi/old/json', b'{}', fetched=0))
+    assert fetch('http://127.0.0.1:1/pypi/old/json', cache=cache, max_age=0) == b'{}'
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_eviction():
+  directory = tempfile.mkdtemp()
+  try:
+    # files of other modules, sharing the directory
+    others = [os.path.join(directory, n) for n in ('resolver.sock', 'test-durations.json')]
+    for path in others:
+      with open(path, 'w') as f: f.write('x' * 1000)
+    os.makedirs(os.path.join(directory, 'packages'))
+
+    cache = DiskCache(directory, max_size=None)
+    keys = ['key%d' % i for i in range(5)]
+    for i, key in enumerate(keys):
+      cache.put(key, CacheEntry(key, b'x' * 100))
+      # the oldest entries are the least recently used ones
+      os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    # reading an entry makes it the most recently used one
+    assert cache.get('key0') is not None
+
+    cache.max_size = sum(os.path.getsize(cache._path(k)) for k in ('key0', 'key3', 'key4'))
+    cache.evict()
+    kept = [k for k in keys if cache.get(k) is not None]
+    assert kept == ['key0', 'key3', 'key4'], kept
+    assert all(os.path.exists(p) for p in others)
+
+    cache.clear()
+    assert all(cache.get(k) is None for k in keys)
+    assert all(os.path.exists(p) for p in others)
+    assert os.path.isdir(os.path.join(directory, 'packages'))
+  finally:
+    shutil.rmtree(directory)
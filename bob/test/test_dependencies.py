@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the dependency graph of bob.dependencies"""
+
+from bob.dependencies import DependencyGraph, CycleError
+
+
+def _graph(requires, roots=('root',)):
+  return DependencyGraph(roots, lambda name: requires.get(name))
+
+
+def test_build_levels():
+  graph = _graph({'root': ['a', 'b >= 2'], 'a': ['c == 1.0'], 'b': ['c'], 'c': []})
+  assert graph.build_levels() == [['c'], ['a', 'b'], ['root']]
+  assert graph.dependencies('root', transitive=True) == ['a', 'b', 'c']
+  assert graph.dependents('c') == ['a', 'b']
+
+
+def test_missing():
+  graph = _graph({'root': ['a']})
+  assert graph.missing == set(['a'])
+  assert graph.nodes == ['a', 'root']
+
+
+def test_normalized_names():
+  # Foo_Bar, foo-bar and FOO.BAR are the same package (PEP 503)
+  graph = _graph({'root': ['Foo_Bar >= 1', 'bob.core'], 'foo_bar': ['Bob.Core'], 'bob.core': []}, roots=('Root',))
+  assert graph.nodes == ['bob.core', 'foo_bar', 'root']
+  assert not graph.missing
+  assert graph.dependencies('FOO.BAR') == ['bob.core']
+  assert graph.dependents('bob_core') == ['foo_bar', 'root']
+
+
+def test_cycles():
+  graph = _graph({'root': ['a'], 'a': ['b'], 'b': ['a']})
+  assert graph.cycles() == [['a', 'b']]
+  try:
+    graph.build_levels()
+  except CycleError as e:
+    assert e.cycles == [['a', 'b']]
+  else:
+    raise AssertionError("the cycle was not detected")
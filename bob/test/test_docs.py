@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the umbrella index and the generated configurations of bob.docs"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import bob.cache
+from bob.docs import parse_index, write_umbrella, _UNIT_CONF
+
+_INDEX = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'doc', 'index.rst')
+
+
+def _index():
+  if not os.path.exists(_INDEX):
+    raise unittest.SkipTest("the umbrella index is not installed")
+  return _INDEX
+
+
+def test_parse_index():
+  sections = parse_index(_index())
+  assert [s for s, _ in sections] == ['Basic Functionality', 'Data Input and Output',
+      'Signal, Audio, Image and Video Processing', 'Machine Learning', 'Database Modules', 'Modules for Developers']
+  packages = dict(sections)
+  # entries with and without the .rst extension
+  assert packages['Basic Functionality'] == ['bob.core', 'bob.math', 'bob.measure']
+  assert packages['Data Input and Output'][0] == 'bob.io.base'
+  assert packages['Modules for Developers'] == ['bob.buildout', 'bob.extension', 'bob.blitz']
+  names = sum((p for _, p in sections), [])
+  assert len(names) == len(set(names)) == 30
+
+
+def test_write_umbrella():
+  directory = tempfile.mkdtemp()
+  try:
+    output = os.path.join(directory, 'index.rst')
+    write_umbrella(_index(), output, {'bob.core': '2.1.2', 'bob.blitz': '2.0.8'})
+    with open(output) as f:
+      text = f.read()
+    # the toctrees are replaced by links to the documentation of each package
+    assert '.. toctree::' not in text and 'temp/' not in text and ':maxdepth:' not in text
+    lines = text.splitlines()
+    assert '* `bob.core <bob.core/index.html>`__ (2.1.2)' in lines
+    assert '* `bob.blitz <bob.blitz/index.html>`__ (2.0.8)' in lines
+    assert '* bob.math (not available)' in lines
+    # in the sections of the index, and separated from the next title
+    basic = lines.index('Basic Functionality')
+    assert lines[basic + 2:basic + 6] == ['', '* `bob.core <bob.core/index.html>`__ (2.1.2)', '* bob.math (not available)', '* bob.measure (not available)']
+    assert lines[basic + 6:basic + 8] == ['', 'Data Input and Output']
+    assert len([l for l in lines if l.startswith('* ')]) == 30
+    # the rest of the index is kept
+    assert '.. todolist::' in lines and '.. _idiap: http://www.idiap.ch' in lines
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_unit_conf():
+  directory = tempfile.mkdtemp()
+  saved = bob.cache._default_cache, os.environ.get('BOB_CACHE_DIR')
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'cache'))
+    os.environ['BOB_CACHE_DIR'] = os.path.join(directory, 'cache')
+    source = os.path.join(directory, 'doc')
+    os.makedirs(source)
+    inventory = os.path.join(directory, 'html', 'bob.core', 'objects.inv')
+    links = {'bob.core': ('../bob.core/', inventory)}
+    for conf, extensions in (
+        ("project = u'bob.a'\ntemplates_path = ['templates']\n", ['sphinx.ext.intersphinx']),
+        ("extensions = ['sphinx.ext.autodoc']\nintersphinx_mapping = {'numpy': ('https://numpy.org/doc/', 'numpy.inv')}\n",
+          ['sphinx.ext.autodoc', 'sphinx.ext.intersphinx']),
+        ):
+      with open(os.path.join(source, 'conf.py'), 'w') as f:
+        f.write(conf)
+      namespace = {}
+      generated = _UNIT_CONF % {'conf': os.path.join(source, 'conf.py'), 'links': links}
+      exec(compile(generated, 'conf.py', 'exec'), namespace)
+      # configurations without extensions get those needed for the links
+      assert namespace['extensions'] == extensions
+      assert namespace['intersphinx_mapping']['bob.core'] == links['bob.core']
+    # the mapping of the package is kept, and local inventories are not fetched
+    assert namespace['intersphinx_mapping']['numpy'] == ('https://numpy.org/doc/', 'numpy.inv')
+  finally:
+    bob.cache._default_cache = saved[0]
+    if saved[1] is None: os.environ.pop('BOB_CACHE_DIR', None)
+    else: os.environ['BOB_CACHE_DIR'] = saved[1]
+    shutil.rmtree(directory)
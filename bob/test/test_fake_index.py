@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the local stand-in for the package index of bob.test.fake_index"""
+
+import io
+import json
+import time
+import hashlib
+import zipfile
+
+import six
+
+from bob.test.fake_index import FakeIndex, synthetic_packages
+
+
+def _get(connection, path, headers={}):
+  connection.request('GET', path, headers=headers)
+  response = connection.getresponse()
+  return response.status, dict((k.lower(), v) for k, v in response.getheaders()), response.read()
+
+
+def _connect(index):
+  return six.moves.http_client.HTTPConnection(index.base.split('//')[1], timeout=5)
+
+
+def test_synthetic_packages():
+  packages = synthetic_packages(20, releases=12)
+  assert packages == synthetic_packages(20, releases=12)
+  names = sorted(packages)
+  for i, name in enumerate(names):
+    assert len([v for v in packages[name]['versions'] if 'b' not in v]) == 12
+    # packages only require the previous ones: there is no cycle
+    assert all(r in names[:i] for r in packages[name]['requires'])
+
+
+def test_documents():
+  packages = {'bob.a': {'versions': ['1.0.0', '2.0.0', '3.0.0b1'], 'requires': {'2.0.0': ['bob.b (>=1.0)']}}, 'bob.b': {'versions': ['1.0.0']}}
+  with FakeIndex(packages, archive_size=4096) as index:
+    connection = _connect(index)
+    status, headers, body = _get(connection, '/pypi/bob.a/json')
+    assert status == 200 and headers['content-type'] == 'application/json'
+    document = json.loads(body.decode('utf-8'))
+    assert document == index.document('bob.a')
+    # the latest final release
+    assert document['info']['version'] == '2.0.0' and document['info']['requires_dist'] == ['bob.b (>=1.0)']
+    assert sorted(document['releases']) == ['1.0.0', '2.0.0', '3.0.0b1']
+
+    # unchanged documents are not sent again
+    status, _, body = _get(connection, '/pypi/bob.a/json', {'If-None-Match': headers['etag']})
+    assert status == 304 and body == b''
+
+    status, _, body = _get(connection, '/pypi/bob.a/1.0.0/json')
+    release = json.loads(body.decode('utf-8'))
+    assert status == 200 and release['info']['version'] == '1.0.0' and release['info']['requires_dist'] == []
+    for path in ('/pypi/bob.c/json', '/pypi/bob.a/9.0.0/json', '/packages/bob.a-9.0.0.zip', '/simple/'):
+      assert _get(connection, path)[0] == 404, path
+
+    # the archives match their digest, and have documentation
+    status, _, body = _get(connection, six.moves.urllib.parse.urlparse(release['urls'][0]['url']).path)
+    assert status == 200 and hashlib.sha256(body).hexdigest() == release['urls'][0]['digests']['sha256']
+    assert len(body) >= 4096
+    names = zipfile.ZipFile(io.BytesIO(body)).namelist()
+    assert 'bob.a-1.0.0/doc/index.rst' in names
+
+    # all requests went through a single connection
+    assert index.connections == 1 and index.requests == 8
+    connection.close()
+
+
+def test_keep_alive_latency():
+  with FakeIndex(1) as index:
+    connection = _connect(index)
+    _get(connection, '/pypi/bob.fake.000/json')
+    start = time.time()
+    for _ in range(20):
+      assert _get(connection, '/pypi/bob.fake.000/json')[0] == 200
+    # with Nagle's algorithm, each response would wait for a delayed ACK (40 ms)
+    assert (time.time() - start) / 20 < 0.02
+    connection.close()
+
+
+def test_errors():
+  with FakeIndex(1, error_rate=0.5, seed=3) as index:
+    connection = _connect(index)
+    statuses = [_get(connection, '/pypi/bob.fake.000/json')[0] for _ in range(100)]
+    assert set(statuses) == set([200, 503])
+    assert statuses.count(503) == index.errors and 30 < index.errors < 70
+    connection.close()
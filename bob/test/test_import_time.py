@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Checks that importing bob and bob.utils stays cheap: each module is imported
+in a fresh interpreter, and the test fails if the import takes longer than the
+budget (``BOB_IMPORT_BUDGET``, in seconds) or loads one of the heavy modules
+that must only be imported when first used
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+HEAVY_MODULES = ('pkg_resources', 'distutils', 'pkgtools')
+"""Modules that must not be loaded by a plain ``import bob.utils``"""
+
+DEFAULT_BUDGET = 0.05
+"""The maximum import time, in seconds"""
+
+REPEAT = 5
+"""The number of imports; the fastest is compared to the budget"""
+
+_PROBE = """
+import sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+import json
+print(json.dumps({'time': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def measure_import(module, python=None):
+  """
+  Imports ``module`` in a fresh interpreter
+
+  **Returns**:
+
+    A dictionary with the ``time`` taken by the import statement, in seconds,
+    and the list of ``modules`` loaded once it is done
+
+  """
+  output = subprocess.check_output([python or sys.executable, '-c', _PROBE % module], env=dict(os.environ))
+  return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def _check(module):
+  budget = float(os.environ.get('BOB_IMPORT_BUDGET', DEFAULT_BUDGET))
+  results = [measure_import(module) for _ in range(REPEAT)]
+  elapsed = min(r['time'] for r in results)
+  heavy = [m for m in HEAVY_MODULES if m in results[0]['modules']]
+  assert not heavy, "import %s loads %s, which should only be loaded when used" % (module, ', '.join(heavy))
+  assert elapsed <= budget, "import %s takes %.2f ms (budget: %.2f ms)" % (module, elapsed * 1000, budget * 1000)
+
+
+def test_import_bob():
+  _check('bob')
+
+
+def test_import_bob_utils():
+  _check('bob.utils')
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the local intersphinx inventories of bob.inventories, against the fake index"""
+
+import os
+import json
+import shutil
+import tempfile
+
+import bob.cache
+from bob.inventories import localize, link_documentation, inventory_url
+from bob.test.fake_index import FakeIndex
+
+
+def test_inventory_url():
+  assert inventory_url('https://docs/bob.a/') == 'https://docs/bob.a/objects.inv'
+  assert inventory_url('https://docs/bob.a', None) == 'https://docs/bob.a/objects.inv'
+  assert inventory_url('https://docs/bob.a/', 'http://mirror/bob.a.inv') == 'http://mirror/bob.a.inv'
+  assert inventory_url('https://docs/bob.a/', ('http://mirror/bob.a.inv', None)) == 'http://mirror/bob.a.inv'
+  assert inventory_url('https://docs/bob.a/', '/html/bob.a/objects.inv') is None
+  assert inventory_url('../bob.a/') is None
+
+
+def test_offline():
+  directory = tempfile.mkdtemp()
+  try:
+    inventories = os.path.join(directory, 'inventories')
+    online = bob.cache.DiskCache(os.path.join(directory, 'cache'), offline=False)
+    with FakeIndex({'bob.a': {'versions': ['1.0.0']}, 'bob.b': {'versions': ['1.0.0']}}) as index:
+      # the archives of the index stand for inventories
+      mapping = {
+          'bob.a': ('https://docs/bob.a/', index.document('bob.a')['urls'][0]['url']),
+          'bob.b': ('https://docs/bob.b/', index.base + '/packages/bob.b-9.0.0.zip'),
+          'bob.c': ('../bob.c/', '/html/bob.c/objects.inv'),
+          }
+      localized = localize(mapping, inventories, online)
+      file_name = localized['bob.a'][1]
+      assert localized['bob.a'][0] == 'https://docs/bob.a/' and os.path.dirname(file_name) == inventories
+      with open(file_name, 'rb') as f:
+        assert f.read() == index.archive('bob.a', '1.0.0')
+      # inventories that could not be fetched are left to Sphinx, local ones untouched
+      assert localized['bob.b'] == mapping['bob.b'] and localized['bob.c'] == mapping['bob.c']
+
+      # as recorded by an online build
+      with open(os.path.join(inventories, 'mapping.json'), 'w') as f:
+        json.dump(mapping, f)
+      requests = index.requests
+      os.remove(file_name)
+
+      offline = bob.cache.DiskCache(os.path.join(directory, 'cache'), offline=True)
+      localized = link_documentation(directory=inventories, cache=offline)
+      # the recorded mapping is used, with the inventories of the cache, and unavailable ones are removed
+      assert sorted(localized) == ['bob.a', 'bob.c']
+      assert localized['bob.a'] == ('https://docs/bob.a/', file_name) and localized['bob.c'] == mapping['bob.c']
+      with open(file_name, 'rb') as f:
+        assert f.read() == index.archive('bob.a', '1.0.0')
+      assert index.requests == requests
+
+    # without a recorded mapping, there are no links
+    os.remove(os.path.join(inventories, 'mapping.json'))
+    assert link_documentation(directory=inventories, cache=offline) == {}
+  finally:
+    shutil.rmtree(directory)
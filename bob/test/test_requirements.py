@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the incremental refresh of requirement files of bob.requirements"""
+
+import os
+import shutil
+import tempfile
+
+import bob.http
+import bob.cache
+from bob.requirements import refresh_requirements, read_pins
+from bob.utils import get_package_info
+from bob.test.fake_index import FakeIndex
+
+
+def test_read_pins():
+  lines = ['# comment\n', 'bob.core == 2.1.2  # pinned\n', 'numpy\n', '\n', 'bob.io.base==2.0.8\n']
+  assert read_pins(lines) == [(1, 'bob.core', '2.1.2'), (4, 'bob.io.base', '2.0.8')]
+
+
+def test_refresh_revalidates_the_cache():
+  directory = tempfile.mkdtemp()
+  default_cache = bob.cache._default_cache
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'cache'))
+    packages = {
+        'bob.a': {'versions': ['1.0.0', '1.1.0'], 'requires': []},
+        'bob.b': {'versions': ['2.0.0'], 'requires': []},
+        }
+    with FakeIndex(packages) as index:
+      bob.http.set_index_url(index.url)
+      requirements = os.path.join(directory, 'requirements.txt')
+      with open(requirements, 'w') as f:
+        f.write('# pins\nbob.a == 1.0.0\nbob.b == 2.0.0\n')
+
+      # the metadata is cached, and fresh, before a release is published
+      get_package_info('bob.a')
+      packages['bob.a']['versions'].append('1.2.0')
+
+      # the index has no changelog: all packages are revalidated
+      changes, errors = refresh_requirements(requirements, workers=1)
+      assert not errors, errors
+      assert changes == [('bob.a', '1.0.0', '1.2.0')], changes
+      with open(requirements) as f:
+        assert f.read() == '# pins\nbob.a == 1.2.0\nbob.b == 2.0.0\n'
+  finally:
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = default_cache
+    shutil.rmtree(directory)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the resolver daemon of bob.resolver, running against the fake index"""
+
+import os
+import sys
+import time
+import errno
+import shutil
+import socket
+import threading
+import tempfile
+import subprocess
+
+import bob.http
+import bob.cache
+import bob.resolver
+import bob.utils
+from bob.test.fake_index import FakeIndex
+
+try:
+  ConnectionResetError
+except NameError:
+  # python 2
+  ConnectionResetError = lambda message: socket.error(errno.ECONNRESET, message)
+
+
+def _start(path, index_url, cache_dir):
+  """Starts a daemon serving the given index, and waits for it to answer"""
+  environ = dict(os.environ, BOB_INDEX_URL=index_url, BOB_CACHE_DIR=cache_dir)
+  environ.pop('BOB_SNAPSHOT', None)
+  process = subprocess.Popen([sys.executable, '-m', 'bob.script.resolver', 'serve', '--socket', path, '--hedge', 'none'],
+      env=environ, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  client = bob.resolver.Client(path, timeout=5.)
+  for _ in range(500):
+    try:
+      client.call('ping')
+      return process, client
+    except bob.resolver.Unavailable:
+      if process.poll() is not None: break
+      time.sleep(0.01)
+  process.kill()
+  raise AssertionError("the resolver did not start: %s" % process.communicate()[0])
+
+
+def test_context():
+  directory = tempfile.mkdtemp()
+  path = os.path.join(directory, 'resolver.sock')
+  saved_cache = bob.cache._default_cache
+  saved_socket = os.environ.get('BOB_RESOLVER_SOCKET')
+  a = {'bob.a': {'versions': ['1.0.0', '1.1.0'], 'requires': []}}
+  b = {'bob.a': {'versions': ['1.0.0', '2.0.0'], 'requires': []}}
+  try:
+    with FakeIndex(a) as index_a, FakeIndex(b) as index_b:
+      process, client = _start(path, index_a.url, os.path.join(directory, 'daemon'))
+      try:
+        os.environ['BOB_RESOLVER_SOCKET'] = path
+        bob.resolver._disabled = False
+        bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'client'))
+
+        # the daemon answers the queries about its index
+        bob.http.set_index_url(index_a.url)
+        assert sorted(bob.utils.get_releases('bob.a')) == ['1.0.0', '1.1.0']
+        assert bob.utils.resolve_versions(['bob.a'])[0][1] == '1.1.0'
+        assert client.call('stats')['misses'] == 1
+        assert index_a.requests == 1
+
+        # but not those about another index, which are answered directly
+        bob.http.set_index_url(index_b.url)
+        assert sorted(bob.utils.get_releases('bob.a')) == ['1.0.0', '2.0.0']
+        assert bob.utils.resolve_versions(['bob.a'])[0][1] == '2.0.0'
+        assert index_a.requests == 1 and index_b.requests == 1
+
+        # nor those asking for fresher metadata than it holds
+        bob.http.set_index_url(index_a.url)
+        bob.cache._default_cache.ttl = 0
+        assert bob.utils.resolve_versions(['bob.a'])[0][1] == '1.1.0'
+        assert index_a.requests == 2
+
+        # a mismatch does not disable the daemon
+        assert not bob.resolver._disabled
+      finally:
+        client.call('shutdown')
+        process.wait()
+  finally:
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved_cache
+    bob.resolver._disabled = False
+    if saved_socket is None: os.environ.pop('BOB_RESOLVER_SOCKET', None)
+    else: os.environ['BOB_RESOLVER_SOCKET'] = saved_socket
+    shutil.rmtree(directory)
+
+
+class _ResetResolver(bob.resolver.Resolver):
+  """A resolver whose connections to the index are reset"""
+
+  def _package(self, name):
+    raise ConnectionResetError("connection reset by the index")
+
+
+def test_daemon_errors():
+  directory = tempfile.mkdtemp()
+  path = os.path.join(directory, 'resolver.sock')
+  saved_socket = os.environ.get('BOB_RESOLVER_SOCKET')
+  thread = threading.Thread(target=bob.resolver.serve, args=(path, _ResetResolver()))
+  thread.daemon = True
+  thread.start()
+  client = bob.resolver.Client(path, timeout=5.)
+  try:
+    for _ in range(500):
+      if os.path.exists(path): break
+      time.sleep(0.01)
+    # the daemon runs in this process, which queries it as a client
+    bob.resolver._disabled = False
+    os.environ['BOB_RESOLVER_SOCKET'] = path
+
+    try:
+      client.call('get_releases', package='bob.a')
+    except IOError as e:
+      assert 'connection reset' in str(e)
+    else:
+      raise AssertionError("the error of the daemon was not raised")
+
+    # reported as the failure of a package, not raised
+    assert bob.utils.get_releases('bob.a') == []
+    results = bob.utils.resolve_versions(['bob.a', 'bob.b'])
+    assert [v for _, v, _ in results] == [None, None]
+    assert all(isinstance(e, IOError) for _, _, e in results)
+    assert not bob.resolver._disabled
+  finally:
+    client.call('shutdown')
+    thread.join(5)
+    bob.resolver._disabled = False
+    if saved_socket is None: os.environ.pop('BOB_RESOLVER_SOCKET', None)
+    else: os.environ['BOB_RESOLVER_SOCKET'] = saved_socket
+    shutil.rmtree(directory)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the retries, deadlines and hedged requests of bob.retry"""
+
+import time
+import shutil
+import tempfile
+import threading
+
+import bob.http
+import bob.cache
+import bob.retry
+import bob.utils
+from bob.retry import RetryPolicy, DeadlineExceeded, is_retryable, parse_hedge
+from bob.test.fake_index import FakeIndex
+
+
+class _Flaky(object):
+  """A function failing with the given exceptions, in order, before returning its number of calls"""
+
+  def __init__(self, *errors):
+    self.errors = list(errors)
+    self.calls = 0
+
+  def __call__(self):
+    self.calls += 1
+    if self.errors: raise self.errors.pop(0)
+    return self.calls
+
+
+def test_classification():
+  assert is_retryable(IOError("connection reset"))
+  assert is_retryable(bob.http.HTTPError('http://index/x', 503, 'Service Unavailable'))
+  assert is_retryable(bob.http.HTTPError('http://index/x', 429, 'Too Many Requests'))
+  assert not is_retryable(bob.http.HTTPError('http://index/x', 404, 'Not Found'))
+  assert not is_retryable(ValueError("malformed document"))
+  assert parse_hedge('p95') == 'p95' and parse_hedge('0.5') == 0.5
+  assert parse_hedge('') is None and parse_hedge('None') is None
+  try:
+    RetryPolicy(hedge='95%')
+  except ValueError:
+    pass
+  else:
+    raise AssertionError("an invalid hedge was accepted")
+
+
+def test_retries():
+  policy = RetryPolicy(attempts=3, backoff=0.001)
+  assert policy.call(_Flaky(IOError(), IOError())) == 3
+  assert policy.retries == 2
+
+  # the error of the last attempt is raised
+  flaky = _Flaky(IOError('1'), IOError('2'), IOError('3'))
+  try:
+    policy.call(flaky)
+  except IOError as e:
+    assert str(e) == '3' and flaky.calls == 3
+  else:
+    raise AssertionError("no error was raised")
+
+  # other errors are not retried
+  flaky = _Flaky(ValueError(), IOError())
+  try:
+    policy.call(flaky)
+  except ValueError:
+    assert flaky.calls == 1
+  else:
+    raise AssertionError("no error was raised")
+
+
+def test_backoff():
+  policy = RetryPolicy(backoff=0.1, max_backoff=0.3)
+  for retry, bound in enumerate((0.1, 0.2, 0.3, 0.3)):
+    delays = [policy.delay(retry) for _ in range(100)]
+    assert all(0 <= d <= bound for d in delays)
+    # jittered: retries of simultaneous failures are spread
+    assert len(set(delays)) > 50
+
+
+def test_deadline():
+  policy = RetryPolicy(attempts=2, backoff=0.001, deadline=0.05)
+  release = threading.Event()
+  start = time.time()
+  try:
+    policy.call(lambda: release.wait(5))
+  except DeadlineExceeded:
+    pass
+  else:
+    raise AssertionError("the deadline was not enforced")
+  finally:
+    release.set()
+  assert time.time() - start < 1
+  assert policy.deadlines == 2 and policy.retries == 1
+
+
+def test_hedging():
+  policy = RetryPolicy(hedge=0.05)
+  calls = []
+  release = threading.Event()
+
+  def _request():
+    calls.append(None)
+    # the first attempt is a straggler
+    if len(calls) == 1: release.wait(5)
+    return len(calls)
+
+  start = time.time()
+  try:
+    assert policy.call(_request) == 2
+  finally:
+    release.set()
+  assert time.time() - start < 1
+  assert policy.hedges == 1
+  # downloads are not hedged
+  calls[:] = []
+  assert policy.call(lambda: len(calls), hedge=False) == 0 and policy.hedges == 1
+
+
+def test_hedge_percentile():
+  policy = RetryPolicy(hedge='p90', min_samples=10)
+  for latency in range(9): policy._record(latency / 100.)
+  # not enough samples yet
+  assert policy.hedge_delay() is None
+  policy._record(0.09)
+  assert policy.hedge_delay() == 0.09
+  for latency in range(90): policy._record(0.01)
+  assert policy.hedge_delay() == 0.01
+
+
+def test_fake_index():
+  directory = tempfile.mkdtemp()
+  saved = bob.cache._default_cache
+  policy = RetryPolicy(attempts=10, backoff=0.001)
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(directory)
+    bob.retry.set_policy(policy)
+    with FakeIndex(20, error_rate=0.3, seed=2) as index:
+      bob.http.set_index_url(index.url)
+      for name in sorted(index.packages):
+        assert bob.utils.get_package_info(name)['info']['name'] == name
+      assert index.errors > 0 and policy.retries >= index.errors
+  finally:
+    bob.retry.set_policy(None)
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved
+    shutil.rmtree(directory)
+
+
+def test_downloads_have_no_deadline():
+  directory = tempfile.mkdtemp()
+  policy = RetryPolicy(attempts=2, backoff=0.001, deadline=0.05)
+  try:
+    assert policy.call(lambda: time.sleep(0.1) or 1, deadline=False) == 1
+    # an archive taking longer than the deadline is downloaded once, by a single writer
+    with FakeIndex({'bob.a': {'versions': ['1.0.0']}}, archive_size=20000, bandwidth=100000) as index:
+      url = index.document('bob.a')['urls'][0]['url']
+      file_name = bob.utils.download(url, directory, progress=None, policy=policy)
+      with open(file_name, 'rb') as f:
+        assert f.read() == index.archive('bob.a', '1.0.0')
+    assert policy.deadlines == 0 and policy.retries == 0
+  finally:
+    shutil.rmtree(directory)
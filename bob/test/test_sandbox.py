@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the package store and the incremental sandbox of bob.sandbox"""
+
+import os
+import time
+import shutil
+import tempfile
+
+import bob.http
+import bob.cache
+import bob.retry
+import bob.utils
+from bob.sandbox import PackageStore, sync_packages, read_manifest
+from bob.test.fake_index import FakeIndex
+
+
+def _setup(directory):
+  saved = bob.cache._default_cache, os.environ.pop('BOB_SNAPSHOT', None), os.environ.pop('BOB_RESOLVER_SOCKET', None)
+  bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'cache'))
+
+  def _teardown():
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved[0]
+    if saved[1] is not None: os.environ['BOB_SNAPSHOT'] = saved[1]
+    if saved[2] is not None: os.environ['BOB_RESOLVER_SOCKET'] = saved[2]
+    shutil.rmtree(directory)
+
+  return _teardown
+
+
+def test_store():
+  directory = tempfile.mkdtemp()
+  teardown = _setup(directory)
+  try:
+    packages = dict(('bob.%s' % n, {'versions': ['1.0.0', '2.0.0'], 'requires': []}) for n in 'abc')
+    with FakeIndex(packages, archive_size=10000) as index:
+      bob.http.set_index_url(index.url)
+      store = PackageStore(os.path.join(directory, 'store'), max_size=None)
+      paths = []
+      for i, name in enumerate(sorted(packages)):
+        release = bob.utils.get_release_file(name, '1.0.0')
+        path, sha256 = store.fetch(name, release)
+        assert sha256 == release['sha256'] and os.path.basename(path) == '%s-1.0.0-%s.zip' % (name, sha256)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+        paths.append(path)
+
+      # archives in the store are not downloaded again, and become the most recently used
+      time.sleep(0.1)
+      sent = index.bytes_sent
+      assert store.fetch('bob.a', bob.utils.get_release_file('bob.a', '1.0.0'))[0] == paths[0]
+      time.sleep(0.1)
+      assert index.bytes_sent == sent
+
+      # files of others, and downloads in progress or left over
+      other = os.path.join(store.directory, 'notes.txt')
+      with open(other, 'w') as f: f.write('x' * 100000)
+      running, stale = os.path.join(store.directory, '.tmp-running'), os.path.join(store.directory, '.tmp-stale')
+      os.makedirs(running)
+      os.makedirs(stale)
+      os.utime(stale, (0, 0))
+
+      store.max_size = os.path.getsize(paths[0]) + os.path.getsize(paths[2])
+      assert store.evict(keep=[paths[2]]) == [paths[1]]
+      assert [os.path.exists(p) for p in paths] == [True, False, True]
+      assert os.path.exists(other) and os.path.isdir(running) and not os.path.exists(stale)
+
+      store.max_size = 0
+      assert store.evict(keep=[paths[2]]) == [paths[0]]
+      assert os.path.exists(paths[2])
+  finally:
+    teardown()
+
+
+def test_sync_evicts_unused_archives():
+  directory = tempfile.mkdtemp()
+  teardown = _setup(directory)
+  try:
+    packages = dict(('bob.%s' % n, {'versions': ['1.0.0', '2.0.0'], 'requires': []}) for n in 'ab')
+    with FakeIndex(packages, archive_size=10000) as index:
+      bob.http.set_index_url(index.url)
+      store = PackageStore(os.path.join(directory, 'store'), max_size=0)
+      sandbox = os.path.join(directory, 'sandbox')
+
+      assert sorted(sync_packages(['bob.a == 1.0.0', 'bob.b == 1.0.0'], sandbox, store=store)) == ['bob.a', 'bob.b']
+      # the archives unpacked in the sandbox are kept
+      assert sorted(os.listdir(store.directory)) == sorted(e['archive'] for e in read_manifest(sandbox).values())
+
+      assert sync_packages(['bob.a == 2.0.0', 'bob.b == 1.0.0'], sandbox, store=store) == ['bob.a']
+      assert sorted(a.split('-')[1] for a in os.listdir(store.directory) if a.startswith('bob.a-')) == ['2.0.0']
+      assert os.path.isfile(os.path.join(sandbox, 'bob.a', 'version.txt'))
+  finally:
+    teardown()
+
+
+def test_stream_retries():
+  directory = tempfile.mkdtemp()
+  teardown = _setup(directory)
+  policy = bob.retry.RetryPolicy(attempts=20, backoff=0.001)
+  try:
+    bob.retry.set_policy(policy)
+    packages = dict(('bob.%s' % n, {'versions': ['1.0.0'], 'requires': []}) for n in 'abcd')
+    with FakeIndex(packages, archive_size=10000, error_rate=0.4, seed=1) as index:
+      bob.http.set_index_url(index.url)
+      sandbox = os.path.join(directory, 'sandbox')
+      requirements = ['%s == 1.0.0' % n for n in sorted(packages)]
+      # archives failing to stream are downloaded and extracted again
+      assert sorted(sync_packages(requirements, sandbox, stream=True)) == sorted(packages)
+      assert index.errors > 0 and policy.retries >= index.errors
+      assert sorted(os.listdir(sandbox)) == ['.manifest.json'] + sorted(packages)
+  finally:
+    bob.retry.set_policy(None)
+    teardown()
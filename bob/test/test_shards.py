@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the test shards of bob.shards and of bob/script/run_tests.py"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+
+import six
+
+from bob.shards import plan, load_history, save_history, report, DEFAULT_DURATION
+
+
+def test_plan():
+  rng = random.Random(4)
+  history = dict(('bob.p%02d' % i, rng.uniform(1, 100)) for i in range(40))
+  shards = plan(history, 4, history)
+  assert sorted(sum(shards, [])) == sorted(history)
+  # each shard runs its longest packages first
+  for shard in shards:
+    assert [history[p] for p in shard] == sorted((history[p] for p in shard), reverse=True)
+  # the longest processing time first rule is within 4/3 of the best split
+  loads = [sum(history[p] for p in s) for s in shards]
+  best = max(sum(history.values()) / 4, max(history.values()))
+  assert max(loads) <= best * 4 / 3.
+  # no shard could give its last package to the least loaded one and end sooner
+  for shard, load in zip(shards, loads):
+    assert load - history[shard[-1]] <= min(loads) + 1e-9
+
+  # more shards than packages, and duplicates
+  assert plan(['bob.a', 'bob.a', 'bob.b'], 3) == [['bob.a'], ['bob.b'], []]
+  assert plan(['bob.a'], 0) == [['bob.a']]
+
+
+def test_default_duration():
+  history = {'bob.a': 2 * DEFAULT_DURATION, 'bob.b': DEFAULT_DURATION / 2, 'bob.c': DEFAULT_DURATION / 4}
+  # packages never run before count as DEFAULT_DURATION: between bob.a and the others
+  assert plan(['bob.a', 'bob.b', 'bob.c', 'bob.new'], 1, history) == [['bob.a', 'bob.new', 'bob.b', 'bob.c']]
+  assert plan(['bob.a', 'bob.b', 'bob.c', 'bob.new'], 2, history) == [['bob.a'], ['bob.new', 'bob.b', 'bob.c']]
+  assert plan(['bob.b', 'bob.new'], 2, history, default=0.) == [['bob.b'], ['bob.new']]
+  assert plan(['bob.x', 'bob.y', 'bob.z'], 2) == [['bob.x', 'bob.z'], ['bob.y']]
+
+
+def test_history():
+  directory = tempfile.mkdtemp()
+  try:
+    file_name = os.path.join(directory, 'cache', 'test-durations.json')
+    assert load_history(file_name) == {}
+    save_history(file_name, {'bob.a': 1.5, 'bob.b': 2})
+    assert load_history(file_name) == {'bob.a': 1.5, 'bob.b': 2.}
+    # the durations of the packages that were not run are kept
+    save_history(file_name, {'bob.b': 3.25, 'bob.c': 4})
+    assert load_history(file_name) == {'bob.a': 1.5, 'bob.b': 3.25, 'bob.c': 4.}
+    assert os.listdir(os.path.dirname(file_name)) == ['test-durations.json']
+
+    with open(file_name, 'w') as f: f.write('{"bob.a": ')
+    assert load_history(file_name) == {}
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_report():
+  results = [
+      {'package': 'bob.a', 'shard': 0, 'duration': 3., 'status': 0},
+      {'package': 'bob.b', 'shard': 1, 'duration': 1., 'status': 1},
+      ]
+  stream = six.StringIO()
+  report(results, wall_time=2., stream=stream)
+  lines = stream.getvalue().splitlines()
+  assert lines[1].split() == ['bob.a', '0', '3.0s', '75.0%', 'ok']
+  assert lines[2].split() == ['bob.b', '1', '1.0s', '25.0%', 'FAILED']
+  assert lines[3] == 'shards: 0: 3.0s, 1: 1.0s'
+  assert lines[4] == '4.0s of tests in 2.0s (2.0x)'
+
+
+def test_run_shard():
+  from bob.script.run_tests import main
+  directory = tempfile.mkdtemp()
+  try:
+    history = {'bob.a': 40., 'bob.b': 30., 'bob.c': 20., 'bob.d': 10.}
+    packages = sorted(history)
+    shards = plan(packages, 2, history)
+    assert shards == [['bob.a', 'bob.d'], ['bob.b', 'bob.c']]
+
+    # each machine runs its own shard of the same plan, from the same durations
+    for index, shard in enumerate(shards):
+      history_file = os.path.join(directory, 'test-durations-%d.json' % index)
+      save_history(history_file, history)
+      output = os.path.join(directory, 'results-%d.json' % index)
+      command = '%s -c pass {package}' % sys.executable
+      assert main(['--shard', '%d/2' % (index + 1), '--history', history_file, '--command', command, '--output', output] + packages) == 0
+      with open(output) as f:
+        results = json.load(f)['results']
+      assert [r['package'] for r in results] == shard and all(r['shard'] == index for r in results)
+      # only the durations of the packages that were run are updated
+      durations = load_history(history_file)
+      assert sorted(durations) == packages
+      assert all((durations[p] < history[p]) == (p in shard) for p in packages)
+
+    for shard in ('0/2', '3/2', '1', 'a/b'):
+      try:
+        main(['--shard', shard, '--history', history_file, '--dry-run'] + packages)
+      except SystemExit as e:
+        assert e.code == 2
+      else:
+        raise AssertionError("--shard %s was accepted" % shard)
+  finally:
+    shutil.rmtree(directory)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the memory-mapped snapshots of bob.snapshot"""
+
+import os
+import shutil
+import tempfile
+
+import bob.http
+import bob.cache
+from bob.snapshot import Package, Snapshot, SnapshotError, write, diff, collect
+from bob.test.fake_index import FakeIndex
+
+
+def _packages():
+  return [
+      Package('bob.core', '2.1.2', 'https://files/bob.core-2.1.2.zip', 'bob.core-2.1.2.zip', 'ab' * 32, 1234,
+        ['2.0.0', '2.1.2', '2.1.0', '2.2.0rc1'], ['bob.extension', 'numpy (>=1.8)']),
+      Package('Bob_Extension', '2.0.8', releases=['2.0.8']),
+      Package(u'bob.ünicode', None),
+      ]
+
+
+def test_round_trip():
+  directory = tempfile.mkdtemp()
+  try:
+    file_name = os.path.join(directory, 'bob.snap')
+    packages = _packages()
+    write(file_name, packages, created=1000.)
+    with Snapshot(file_name) as snapshot:
+      assert snapshot.verify() == []
+      assert len(snapshot) == 3 and snapshot.created == 1000.
+      core = snapshot.package('bob.core')
+      # the releases are stored from the oldest to the newest
+      assert core.releases == ['2.0.0', '2.1.0', '2.1.2', '2.2.0rc1']
+      core.releases = packages[0].releases
+      assert core == packages[0]
+      # packages are found by their normalized name
+      assert snapshot.package('bob-extension') == packages[1]
+      assert 'BOB.EXTENSION' in snapshot and 'bob.io.base' not in snapshot
+      assert snapshot.package(u'bob.ünicode') == packages[2]
+      assert sorted(snapshot.names()) == sorted(p.name for p in packages)
+      try:
+        snapshot.package('bob.io.base')
+      except KeyError:
+        pass
+      else:
+        raise AssertionError("a missing package was found")
+
+    # a new snapshot, compared to the old one
+    new_name = os.path.join(directory, 'new.snap')
+    packages[0].version = '2.1.0'
+    write(new_name, packages[:1] + [Package('bob.io.base', '2.0.8')])
+    with Snapshot(file_name) as old, Snapshot(new_name) as new:
+      changes = diff(old, new)
+    assert ('bob.core', 'version', '2.1.2', '2.1.0') in changes
+    assert ('bob.io.base', 'package', None, '2.0.8') in changes
+    assert ('Bob_Extension', 'package', '2.0.8', None) in changes
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_corruption():
+  directory = tempfile.mkdtemp()
+  try:
+    file_name = os.path.join(directory, 'bob.snap')
+    write(file_name, _packages())
+    with open(file_name, 'rb') as f:
+      data = bytearray(f.read())
+    data[-1] ^= 0xff
+    with open(file_name, 'wb') as f:
+      f.write(data)
+    with Snapshot(file_name) as snapshot:
+      assert snapshot.verify()
+
+    with open(file_name, 'wb') as f:
+      f.write(bytes(data[:-4]))
+    try:
+      Snapshot(file_name)
+    except SnapshotError:
+      pass
+    else:
+      raise AssertionError("a truncated snapshot was opened")
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_query():
+  directory = tempfile.mkdtemp()
+  saved = bob.cache._default_cache
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'cache'))
+    packages = {
+        'bob.a': {'versions': ['1.0.0', '1.1.0', '2.0.0b1'], 'requires': ['bob.b']},
+        'bob.b': {'versions': ['0.1.0', '0.2.0'], 'requires': []},
+        }
+    with FakeIndex(packages) as index:
+      bob.http.set_index_url(index.url)
+      file_name = os.path.join(directory, 'bob.snap')
+      for prereleases in ('fallback', 'include'):
+        collected, errors = collect(['bob.a'], transitive=True, workers=2, prereleases=prereleases)
+        assert errors == [] and sorted(p.name for p in collected) == ['bob.a', 'bob.b']
+        write(file_name, collected)
+        with Snapshot(file_name) as snapshot:
+          assert snapshot.query('get_releases', 'bob.a') == ['1.0.0', '1.1.0', '2.0.0b1']
+          # whatever the policy of the snapshot, that of the query is followed
+          assert snapshot.query('get_max_version', 'bob.a') == '1.1.0'
+          assert snapshot.query('get_max_version', 'bob.a', prereleases='include') == '2.0.0b1'
+          assert snapshot.query('get_release_file', 'bob.b')['url'] == index.document('bob.b')['urls'][0]['url']
+          chosen = snapshot.package('bob.a').version
+          assert snapshot.query('get_release_file', 'bob.a', version=chosen)['version'] == chosen
+          if chosen == '1.1.0':
+            assert snapshot.query('get_url', 'bob.a').endswith('/bob.a-1.1.0.zip')
+          else:
+            # the archive of the default release is not in the snapshot
+            for method in ('get_url', 'get_release_file'):
+              try:
+                snapshot.query(method, 'bob.a')
+              except KeyError:
+                pass
+              else:
+                raise AssertionError("%s was answered with the archive of %s" % (method, chosen))
+  finally:
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved
+    shutil.rmtree(directory)
+
+
+def test_release_requirements():
+  directory = tempfile.mkdtemp()
+  saved = bob.cache._default_cache
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(os.path.join(directory, 'cache'))
+    packages = {
+        'bob.x': {'versions': ['1.0.0', '2.0.0b1'], 'requires': {'1.0.0': ['bob.y'], '2.0.0b1': ['bob.y', 'bob.z']}},
+        'bob.y': {'versions': ['1.0.0'], 'requires': []},
+        'bob.z': {'versions': ['1.0.0'], 'requires': []},
+        }
+    with FakeIndex(packages) as index:
+      bob.http.set_index_url(index.url)
+      collected, errors = collect(['bob.x'], transitive=True, workers=2, prereleases='fallback')
+      assert errors == [] and sorted(p.name for p in collected) == ['bob.x', 'bob.y']
+      # the requirements are those of the chosen release, not of the latest one
+      collected, errors = collect(['bob.x'], transitive=True, workers=2, prereleases='include')
+      assert errors == [] and sorted(p.name for p in collected) == ['bob.x', 'bob.y', 'bob.z']
+      x = [p for p in collected if p.name == 'bob.x'][0]
+      assert x.version == '2.0.0b1' and x.requires == ['bob.y', 'bob.z']
+  finally:
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved
+    shutil.rmtree(directory)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the dependency solver of bob.solver, against an exhaustive search"""
+
+import random
+import itertools
+
+from bob.solver import Solver, ResolutionImpossible, parse_requirement
+from bob.versions import matches, sort_versions
+
+
+def _solver(packages):
+  return Solver(releases=lambda name: list(packages[name]), requires=lambda name, version: packages[name][version], workers=1)
+
+
+def _consistent(packages, pins, roots):
+  """Whether the pins include the roots and satisfy the requirements of every pinned release"""
+  if any(r not in pins for r in roots): return False
+  for name, version in pins.items():
+    for requirement in packages[name][version]:
+      package, specifier = parse_requirement(requirement)
+      if package not in pins or not matches(pins[package], specifier): return False
+  return True
+
+
+def _exhaustive(packages, roots):
+  """Whether some versions of the packages required from the roots satisfy all requirements"""
+  names = sorted(packages)
+  for versions in itertools.product(*[sort_versions(packages[n]) for n in names]):
+    pins = dict(zip(names, versions))
+    # only the packages reachable from the roots need to be consistent
+    required, pending = set(roots), list(roots)
+    while pending:
+      name = pending.pop()
+      for requirement in packages[name][pins[name]]:
+        package = parse_requirement(requirement)[0]
+        if package not in required:
+          required.add(package)
+          pending.append(package)
+    if _consistent(packages, dict((n, pins[n]) for n in required), roots): return True
+  return False
+
+
+def _random_index(rng, size=5, releases=4):
+  """Packages with up to ``releases`` releases, requiring versions that may not exist"""
+  names = ['p%d' % i for i in range(size)]
+  packages = {}
+  for name in names:
+    packages[name] = {}
+    for i in range(1, rng.randint(1, releases) + 1):
+      requires = []
+      for package in rng.sample(names, rng.randint(0, 2)):
+        if package == name: continue
+        requires.append('%s (%s%d.0)' % (package, rng.choice(['>=', '<', '<=', '==', '!=']), rng.randint(1, releases)))
+      packages[name]['%d.0' % i] = requires
+  return packages
+
+
+def test_newest():
+  packages = {
+      'a': {'1.0': ['b'], '2.0': ['b >= 2']},
+      'b': {'1.0': [], '2.0': ['c < 2'], '3.0': ['c >= 3']},
+      'c': {'1.0': [], '2.0': []},
+      }
+  assert _solver(packages).solve(['a']) == {'a': '2.0', 'b': '2.0', 'c': '1.0'}
+
+
+def test_impossible():
+  packages = {'a': {'1.0': ['b >= 2']}, 'b': {'1.0': []}}
+  try:
+    _solver(packages).solve(['a'])
+  except ResolutionImpossible as e:
+    assert e.package == 'a'
+  else:
+    raise AssertionError("no error was raised")
+
+
+def test_exhausted_domain():
+  # p2 is only required by p0 2.0, and its only release requires a version
+  # of p3 that does not exist: the search must go back to p0
+  packages = {
+      'p0': {'1.0': [], '2.0': ['p2']},
+      'p1': {'1.0': [], '2.0': ['p0 < 3.0']},
+      'p2': {'1.0': ['p3 == 3.0']},
+      'p3': {'1.0': [], '2.0': []},
+      }
+  assert _solver(packages).solve(['p0', 'p1']) == {'p0': '1.0', 'p1': '2.0'}
+
+
+def test_against_exhaustive_search():
+  rng = random.Random(0)
+  for _ in range(3000):
+    packages = _random_index(rng)
+    roots = ['p0', 'p1']
+    try:
+      pins = _solver(packages).solve(roots)
+      assert _consistent(packages, pins, roots), (packages, pins)
+      found = True
+    except ResolutionImpossible:
+      found = False
+    assert found == _exhaustive(packages, roots), packages
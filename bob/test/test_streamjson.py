@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the selective extraction of bob.streamjson, against json.loads"""
+
+import io
+import json
+import random
+
+from bob.streamjson import extract, loads
+
+_CHUNK_SIZES = (1, 2, 3, 7, 64, 65536)
+"""Small chunks split every token between two reads"""
+
+
+def _select(value, template):
+  """The parts of a decoded document selected by ``template``, as described in bob.streamjson"""
+  if template is True: return value
+  if template is False: return None
+  if isinstance(template, dict) and isinstance(value, dict):
+    result = {}
+    for key in value:
+      if key in template: result[key] = _select(value[key], template[key])
+      elif '*' in template: result[key] = _select(value[key], template['*'])
+    return result
+  if isinstance(template, list) and isinstance(value, list):
+    return [_select(v, template[0]) for v in value]
+  return value
+
+
+def _check(document, template, data=None):
+  data = data or json.dumps(document).encode('utf-8')
+  expected = _select(json.loads(data.decode('utf-8')), template)
+  for chunk_size in _CHUNK_SIZES:
+    result = extract(io.BytesIO(data), template, chunk_size=chunk_size)
+    assert result == expected, (chunk_size, result, expected)
+
+
+def _random_value(rng, depth=0):
+  kind = rng.randint(0, 7 if depth < 3 else 4)
+  if kind == 0: return rng.randint(-10**6, 10**6)
+  if kind == 1: return rng.random() * 10**rng.randint(-5, 5)
+  if kind == 2: return rng.choice([True, False, None])
+  if kind in (3, 4):
+    return u''.join(rng.choice(u'ab "\\/\n\t{}[],:é中\U0001f600') for _ in range(rng.randint(0, 12)))
+  if kind == 5: return [_random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+  return dict(('k%d' % rng.randint(0, 5), _random_value(rng, depth + 1)) for _ in range(rng.randint(0, 4)))
+
+
+def test_package_document():
+  releases = dict(('1.%d' % i, [{'url': 'https://files/p-1.%d.zip' % i, 'size': i, 'digests': {'sha256': '%064x' % i, 'md5': 'x'}}]) for i in range(20))
+  document = {
+      'info': {'name': 'p', 'version': '1.19', 'description': u'é "quoted" \\ text\n' * 100, 'requires_dist': None},
+      'last_serial': 12,
+      'releases': releases,
+      'urls': releases['1.19'],
+      }
+  file_fields = {'url': True, 'digests': {'sha256': True}}
+  template = {'info': {'name': True, 'version': True, 'requires_dist': True}, 'last_serial': True, 'releases': {'*': False}, 'urls': [file_fields]}
+  _check(document, template)
+  _check(document, {'releases': {'*': [file_fields]}})
+  result = loads(json.dumps(document).encode('utf-8'), template)
+  assert sorted(result['releases']) == sorted(releases) and set(result['releases'].values()) == set([None])
+
+
+def test_whitespace_and_unicode():
+  data = u' { "a" :\n[ 1 , 2.5e3 , -0 ] ,\t"b" : { "c" : "\\u00e9\\"\\\\" } , "d" : "中\U0001f600" } '.encode('utf-8')
+  _check(None, {'a': True, 'b': {'c': True}, 'd': True}, data)
+  _check(None, {'a': False, '*': True}, data)
+  _check(None, {'b': False}, data)
+
+
+def test_random_documents():
+  rng = random.Random(0)
+  templates = [True, {'*': True}, {'*': False}, {'k0': True, 'k1': {'*': [True]}}, {'*': {'k2': True, '*': False}}, {'k3': [{'k4': True}]}]
+  for _ in range(300):
+    document = dict(('k%d' % i, _random_value(rng)) for i in range(rng.randint(0, 6)))
+    for template in templates:
+      _check(document, template)
+
+
+def test_invalid():
+  for data in (b'{"a": ', b'{"a": "unterminated}', b'{"a" 1}'):
+    for chunk_size in (1, 65536):
+      try:
+        extract(io.BytesIO(data), {'a': True}, chunk_size=chunk_size)
+      except ValueError:
+        pass
+      else:
+        raise AssertionError("%r was accepted" % data)
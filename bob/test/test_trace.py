@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the spans and exporters of bob.trace"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+import six
+
+import bob.trace
+
+
+def _hooks():
+  """Uninstalls the hooks of the process (as with ``BOB_TRACE``), and returns a function reinstalling them"""
+  saved = list(bob.trace._hooks)
+  del bob.trace._hooks[:]
+
+  def _restore():
+    bob.trace._hooks[:] = saved
+
+  return _restore
+
+
+def test_disabled():
+  restore = _hooks()
+  try:
+    assert not bob.trace.enabled()
+    with bob.trace.span('download', url='http://index/x') as s:
+      s.set(status=200)
+      s.add('bytes', 10)
+    # the same object, doing nothing, for all spans
+    assert s is bob.trace.span('other') and not isinstance(s, bob.trace.Span)
+  finally:
+    restore()
+
+
+def test_nesting():
+  restore = _hooks()
+  spans = []
+  try:
+    bob.trace.add_hook(spans.append)
+    assert bob.trace.enabled()
+
+    def _thread():
+      with bob.trace.span('thread'):
+        with bob.trace.span('thread.child'):
+          pass
+
+    with bob.trace.span('outer', url='http://index/x') as outer:
+      with bob.trace.span('inner') as inner:
+        inner.add('bytes', 10)
+        inner.add('bytes', 5)
+      # spans of other threads are not children of those of this one
+      thread = threading.Thread(target=_thread)
+      thread.start()
+      thread.join()
+
+    names = dict((s.name, s) for s in spans)
+    # spans are passed to the hooks as they end
+    assert [s.name for s in spans] == ['inner', 'thread.child', 'thread', 'outer']
+    assert outer.parent is None and inner.parent == outer.id
+    assert inner.attributes == {'bytes': 15} and outer.attributes == {'url': 'http://index/x'}
+    assert names['thread'].parent is None and names['thread.child'].parent == names['thread'].id
+    assert names['thread'].thread == thread.ident and outer.thread == threading.current_thread().ident
+    assert outer.start <= inner.start and 0 <= inner.duration <= outer.duration
+
+    # the stack is empty once all spans ended
+    with bob.trace.span('next') as s:
+      pass
+    assert s.parent is None
+  finally:
+    restore()
+
+
+def test_error():
+  restore = _hooks()
+  spans = []
+  try:
+    bob.trace.add_hook(spans.append)
+    try:
+      with bob.trace.span('outer'):
+        with bob.trace.span('inner'):
+          raise IOError('connection reset')
+    except IOError:
+      pass
+    else:
+      raise AssertionError("the exception was swallowed")
+    assert [s.attributes['error'] for s in spans] == ['%s: connection reset' % IOError.__name__] * 2
+    with bob.trace.span('next') as s:
+      pass
+    assert s.parent is None and 'error' not in s.attributes
+  finally:
+    restore()
+
+
+def test_exporters():
+  restore = _hooks()
+  directory = tempfile.mkdtemp()
+  try:
+    chrome = bob.trace.ChromeTraceExporter(os.path.join(directory, 'trace.json'))
+    stream = six.StringIO()
+    lines = bob.trace.JSONLinesExporter(stream)
+    file_name = os.path.join(directory, 'trace.jsonl')
+    owned = bob.trace.JSONLinesExporter(file_name)
+    for hook in (chrome, lines, owned): bob.trace.add_hook(hook)
+
+    with bob.trace.span('http.request', url='http://index/x') as outer:
+      with bob.trace.span('cache.lookup') as inner:
+        inner.set(hit=False)
+
+    chrome.close()
+    with open(chrome.file_name) as f:
+      trace = json.load(f)
+    assert trace['displayTimeUnit'] == 'ms'
+    events = trace['traceEvents']
+    assert [(e['name'], e['cat'], e['ph']) for e in events] == [('cache.lookup', 'cache', 'X'), ('http.request', 'http', 'X')]
+    # times are in microseconds
+    assert events[1]['ts'] == outer.start * 1e6 and events[1]['dur'] == outer.duration * 1e6
+    assert events[1]['args'] == {'url': 'http://index/x'} and events[0]['args'] == {'hit': False}
+    assert all(e['pid'] == os.getpid() and e['tid'] == threading.current_thread().ident for e in events)
+
+    # streams given to the exporter stay open
+    lines.close()
+    records = [json.loads(l) for l in stream.getvalue().splitlines()]
+    assert records == [inner.to_dict(), outer.to_dict()]
+    assert records[0]['parent'] == records[1]['id'] and records[0]['attributes'] == {'hit': False}
+    assert not stream.closed
+
+    owned.close()
+    assert owned.stream.closed
+    with open(file_name) as f:
+      assert [json.loads(l) for l in f] == records
+  finally:
+    restore()
+    shutil.rmtree(directory)
+
+
+def test_remove_hook():
+  restore = _hooks()
+  spans = []
+  try:
+    bob.trace.add_hook(spans.append)
+    with bob.trace.span('first'):
+      pass
+    bob.trace.remove_hook(spans.append)
+    assert not bob.trace.enabled()
+    # removing a hook that is not installed does nothing
+    bob.trace.remove_hook(spans.append)
+    with bob.trace.span('second'):
+      pass
+    assert [s.name for s in spans] == ['first']
+
+    # the other hooks are kept
+    others = []
+    bob.trace.add_hook(spans.append)
+    bob.trace.add_hook(others.append)
+    bob.trace.remove_hook(spans.append)
+    with bob.trace.span('third'):
+      pass
+    assert [s.name for s in spans] == ['first'] and [s.name for s in others] == ['third']
+  finally:
+    restore()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the metadata lookups of bob.utils, against the fake index"""
+
+import os
+import shutil
+import tempfile
+
+import bob.http
+import bob.cache
+import bob.utils
+from bob.test.fake_index import FakeIndex
+
+
+def test_release_file():
+  directory = tempfile.mkdtemp()
+  saved_cache = bob.cache._default_cache
+  saved_snapshot = os.environ.pop('BOB_SNAPSHOT', None)
+  saved_socket = os.environ.pop('BOB_RESOLVER_SOCKET', None)
+  try:
+    bob.cache._default_cache = bob.cache.DiskCache(directory)
+    with FakeIndex({'bob.a': {'versions': ['1.0.0', '1.1.0', '2.0.0'], 'requires': []}}) as index:
+      bob.http.set_index_url(index.url)
+
+      # only the versions of the releases are kept, not their files
+      info = bob.utils.get_package_info('bob.a')
+      assert info['releases'] == {'1.0.0': None, '1.1.0': None, '2.0.0': None}
+
+      # the archive of the latest release is in the metadata of the package
+      latest = bob.utils.get_release_file('bob.a')
+      assert latest['version'] == '2.0.0' and latest['url'].endswith('/bob.a-2.0.0.zip')
+      assert index.requests == 1
+
+      # that of the others, in the metadata of the release
+      old = bob.utils.get_release_file('bob.a', '1.0.0')
+      assert old['filename'] == 'bob.a-1.0.0.zip' and old['sha256'] == index.document('bob.a', '1.0.0')['urls'][0]['digests']['sha256']
+      assert index.requests == 2
+      assert bob.utils.get_release_file('bob.a', '1.0.0') == old
+      assert index.requests == 2
+
+      try:
+        bob.utils.get_release_file('bob.a', '3.0.0')
+      except ValueError:
+        pass
+      else:
+        raise AssertionError("a missing release was found")
+  finally:
+    bob.http.set_index_url(None)
+    bob.cache._default_cache = saved_cache
+    if saved_snapshot is not None: os.environ['BOB_SNAPSHOT'] = saved_snapshot
+    if saved_socket is not None: os.environ['BOB_RESOLVER_SOCKET'] = saved_socket
+    shutil.rmtree(directory)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""Tests of the version ordering and specifiers of bob.versions"""
+
+from bob.versions import sort_versions, is_prerelease, get_max_version, matches, parse_specifier, InvalidSpecifier
+
+_BASES = ['0.9', '1.0', '1.0.0', '1.0.1', '1!0.5', '2.0']
+_SUFFIXES = ['', 'a1', 'rc1', '.dev0', 'a1.dev0', '.post1', '.post1.dev0', '.post2', 'a1.post1', 'a1.post1.dev0']
+_VERSIONS = [b + s for b in _BASES for s in _SUFFIXES]
+_VERSIONS += [v + '+local' for v in _VERSIONS] + [v + '+1.a' for v in _VERSIONS[:20]]
+"""Versions exercising the corner cases of PEP 440"""
+
+
+def _packaging():
+  try:
+    import packaging.version
+    import packaging.specifiers
+  except ImportError:
+    from unittest import SkipTest
+    raise SkipTest("the packaging module is not installed")
+  return packaging
+
+
+def test_ordering():
+  ordered = ['1.0.dev0', '1.0a1.dev0', '1.0a1', '1.0a1.post1', '1.0b2', '1.0rc1', '1.0', '1.0+local', '1.0.post1.dev0', '1.0.post1', '1.0.1', '1!0.5']
+  assert sort_versions(reversed(ordered)) == ordered
+  assert sort_versions(['1.10.0', '1.9.0', '1.2.0']) == ['1.2.0', '1.9.0', '1.10.0']
+  # invalid versions sort before all valid ones
+  assert sort_versions(['1.0', 'nightly']) == ['nightly', '1.0']
+
+
+def test_ordering_like_packaging():
+  packaging = _packaging()
+  expected = sorted(_VERSIONS, key=packaging.version.Version)
+  assert [packaging.version.Version(v) for v in sort_versions(_VERSIONS)] == [packaging.version.Version(v) for v in expected]
+
+
+def test_max_version():
+  versions = ['1.0', '1.1rc1', '0.9']
+  assert is_prerelease('1.1rc1') and is_prerelease('1.0.dev0') and not is_prerelease('1.0.post1')
+  assert get_max_version(versions) == '1.0'
+  assert get_max_version(versions, 'include') == '1.1rc1'
+  assert get_max_version(['1.1rc1'], 'fallback') == '1.1rc1'
+  assert get_max_version(['1.1rc1'], 'exclude') is None
+
+
+def test_specifiers():
+  assert matches('2.1', '>= 2.0, != 2.1.*, < 3') is False
+  assert matches('2.2', '>= 2.0, != 2.1.*, < 3')
+  assert matches('2.2', '(>=2.0,<3)')
+  assert matches('anything', '')
+  assert matches('1.4.5', '~= 1.4.2') and not matches('1.5', '~= 1.4.2')
+  # local versions
+  assert matches('1.0+local', '== 1.0') and matches('1.0+local', '<= 1.0') and not matches('1.0+local', '> 1.0')
+  # pre-releases of the bound
+  assert not matches('1.0rc1', '< 1.0') and matches('1.0rc1', '< 1.0.post1')
+  assert not matches('1.0.post1.dev0', '< 1.0.post1')
+  # post-releases of the bound
+  assert not matches('1.0.post1', '> 1.0') and matches('1.0a1.post1', '> 1.0a1.dev0')
+  for invalid in ('>= 1.*', '~= 1', '=> 1.0'):
+    try:
+      parse_specifier(invalid)
+    except InvalidSpecifier:
+      pass
+    else:
+      raise AssertionError("'%s' was accepted" % invalid)
+
+
+def test_specifiers_like_packaging():
+  packaging = _packaging()
+  for operator in ('<', '<=', '>', '>=', '==', '!=', '~=', '==='):
+    for target in _VERSIONS:
+      try:
+        specifier = packaging.specifiers.Specifier(operator + target)
+      except packaging.specifiers.InvalidSpecifier:
+        continue
+      for version in _VERSIONS:
+        expected = specifier.contains(version, prereleases=True)
+        assert matches(version, operator + target) == expected, (version, operator + target, expected)
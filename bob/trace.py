@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Timing instrumentation of the operations of :py:mod:`bob.utils`.
+
+Connections, requests to the package index, cache lookups, downloads,
+extractions and dependency scans run inside spans. A span records its name,
+start time, duration, thread, parent span and attributes, like the number of
+bytes transferred. Finished spans are passed to hooks: exporters writing them
+in the Chrome trace format (to be loaded in ``chrome://tracing`` or Perfetto)
+or as JSON lines, or any function collecting metrics.
+
+When no hook is installed, :py:func:`span` returns a shared object whose
+methods do nothing, so the instrumentation costs a function call per span.
+
+Setting the ``BOB_TRACE`` environment variable to a file name traces the
+whole process: spans are written, when it exits, to that file, as JSON lines
+if its name ends with ``.jsonl`` and in the Chrome trace format otherwise.
+"""
+
+import os
+import json
+import time
+import atexit
+import itertools
+import threading
+
+_hooks = []
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+class Span(object):
+  """
+  A timed operation
+
+  **Attributes**:
+
+    name: The name of the operation, like ``http.request``
+    id: A number identifying the span in the process
+    parent: The id of the span in which this one started, in the same thread,
+            or ``None``
+    start: The time at which the span started, in seconds since the epoch
+    duration: The duration of the span, in seconds
+    thread: The identifier of the thread running the span
+    attributes: A dictionary of attributes, like ``url`` or ``bytes``; spans
+                ending with an exception have an ``error`` attribute
+
+  """
+
+  __slots__ = ('name', 'id', 'parent', 'start', 'duration', 'thread', 'attributes', '_clock')
+
+  def __init__(self, name, attributes):
+    self.name = name
+    self.id = next(_ids)
+    self.parent = None
+    self.start = None
+    self.duration = None
+    self.thread = None
+    self.attributes = attributes
+
+  def set(self, **attributes):
+    """Sets attributes of the span"""
+    self.attributes.update(attributes)
+
+  def add(self, name, value):
+    """Adds ``value`` to a numerical attribute, like a byte count"""
+    self.attributes[name] = self.attributes.get(name, 0) + value
+
+  def __enter__(self):
+    stack = getattr(_local, 'stack', None)
+    if stack is None: stack = _local.stack = []
+    if stack: self.parent = stack[-1].id
+    stack.append(self)
+    self.thread = threading.current_thread().ident
+    self.start = time.time()
+    self._clock = _clock()
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.duration = _clock() - self._clock
+    if type is not None:
+      self.attributes['error'] = '%s: %s' % (type.__name__, value)
+    stack = _local.stack
+    # spans of interleaved coroutines may not end in the reverse order they started
+    if stack and stack[-1] is self: stack.pop()
+    elif self in stack: stack.remove(self)
+    for hook in list(_hooks):
+      hook(self)
+
+  def to_dict(self):
+    """Returns the span as a dictionary, ready to be serialized to JSON"""
+    return {
+        'name': self.name, 'id': self.id, 'parent': self.parent,
+        'start': self.start, 'duration': self.duration, 'thread': self.thread,
+        'pid': os.getpid(), 'attributes': self.attributes,
+        }
+
+
+class _NullSpan(object):
+  """The span returned when tracing is disabled"""
+
+  def set(self, **attributes): pass
+  def add(self, name, value): pass
+  def __enter__(self): return self
+  def __exit__(self, type, value, traceback): pass
+
+_null_span = _NullSpan()
+
+# a monotonic clock for durations, where available
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def span(name, **attributes):
+  """
+  Returns a span to time an operation, to be used as a context manager::
+
+    with bob.trace.span('download', url=url) as s:
+      ...
+      s.add('bytes', len(data))
+
+  If tracing is disabled, a span doing nothing is returned.
+  """
+  if not _hooks: return _null_span
+  return Span(name, attributes)
+
+
+def enabled():
+  """Tells if spans are being recorded, i.e., if at least one hook is installed"""
+  return bool(_hooks)
+
+
+def add_hook(hook):
+  """Installs a function, called with each :py:class:`Span` once it ended, from the thread that ran it"""
+  _hooks.append(hook)
+
+
+def remove_hook(hook):
+  """Removes a function installed by :py:func:`add_hook`"""
+  if hook in _hooks: _hooks.remove(hook)
+
+
+class ChromeTraceExporter(object):
+  """
+  Collects spans and writes them in the Chrome trace event format
+
+  **Parameters**:
+
+    file_name: The file where the trace is written by :py:meth:`close`
+
+  """
+
+  def __init__(self, file_name):
+    self.file_name = file_name
+    self.events = []
+    self._lock = threading.Lock()
+
+  def __call__(self, span):
+    event = {
+        'name': span.name, 'cat': span.name.split('.')[0], 'ph': 'X',
+        'ts': span.start * 1e6, 'dur': span.duration * 1e6,
+        'pid': os.getpid(), 'tid': span.thread, 'args': span.attributes,
+        }
+    with self._lock:
+      self.events.append(event)
+
+  def close(self):
+    """Writes the collected spans"""
+    with self._lock:
+      events = list(self.events)
+    with open(self.file_name, 'w') as f:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+class JSONLinesExporter(object):
+  """
+  Writes each span, as soon as it ends, as a line of JSON
+
+  **Parameters**:
+
+    stream: The file name, or the (text) stream, to write to
+
+  """
+
+  def __init__(self, stream):
+    self._owned = not hasattr(stream, 'write')
+    self.stream = open(stream, 'a') if self._owned else stream
+    self._lock = threading.Lock()
+
+  def __call__(self, span):
+    line = json.dumps(span.to_dict(), default=str, sort_keys=True) + '\n'
+    with self._lock:
+      self.stream.write(line)
+
+  def close(self):
+    """Flushes the stream, and closes it if it was opened by the exporter"""
+    with self._lock:
+      if self._owned: self.stream.close()
+      else: self.stream.flush()
+
+
+def trace_to(file_name):
+  """
+  Records all spans until the process exits, into the given file; see
+  :py:mod:`bob.trace` for the formats
+
+  **Returns**:
+
+    The exporter, installed as a hook
+
+  """
+  if file_name.endswith('.jsonl'):
+    exporter = JSONLinesExporter(file_name)
+  else:
+    exporter = ChromeTraceExporter(file_name)
+  add_hook(exporter)
+  atexit.register(exporter.close)
+  return exporter
+
+
+if os.environ.get('BOB_TRACE'):
+  trace_to(os.environ['BOB_TRACE'])
@@ -6,9 +6,32 @@
 # Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
 
 import os
-import pkgtools.pypi
-import distutils.version
-import pkg_resources
+import json
+
+_FILE_FIELDS = {'url': True, 'filename': True, 'packagetype': True, 'digests': {'sha256': True}}
+
+PACKAGE_FIELDS = {
+    'info': {'name': True, 'version': True, 'requires_dist': True},
+    'last_serial': True,
+    'releases': {'*': False},
+    'urls': [_FILE_FIELDS],
+    }
+"""The fields of the PyPI JSON documents that are extracted and cached; see
+:py:mod:`bob.streamjson`. Only the versions of the releases are kept, not their
+files, which grow with the release history: the archives of the latest release
+are in ``urls``, and those of the others in the metadata of that release (see
+:py:data:`RELEASE_FIELDS`)"""
+
+BUILD_ONLY_PACKAGES = ('setuptools',)
+"""Packages required to install bob, but that are not part of it: they are
+neither pinned with the sub-packages nor documented"""
+
+RELEASE_FIELDS = {'info': {'requires_dist': True}, 'urls': [_FILE_FIELDS]}
+"""The fields of the JSON documents of single releases that are extracted and cached"""
+
+RELEASE_MAX_AGE = 30 * 24 * 3600
+"""The age, in seconds, after which the cached metadata of a release is
+revalidated; the requirements of a published release do not change"""
 
 def get_config():
   """
@@ -18,121 +41,630 @@ def get_config():
   return bob.extension.get_config(__name__)
 
 
+def get_package_info(package_name, max_age=None, policy=None):
+  """
+  Given a package name, get its metadata from PyPI, as a dictionary
+
+  The metadata is kept in the on-disk cache of :py:mod:`bob.cache`, so
+  repeated queries for the same package cost (almost) no network time.
+  Cached metadata older than ``max_age`` seconds (by default, the TTL of the
+  cache) is revalidated with PyPI.
+
+  Only the fields in :py:data:`PACKAGE_FIELDS` are kept. They are extracted
+  while the document is downloaded, without parsing the rest of it.
+
+  Transient failures are retried as decided by ``policy``, a
+  :py:class:`bob.retry.RetryPolicy` (by default, the one of
+  :py:func:`bob.retry.get_policy`).
+  """
+  import bob.cache
+  import bob.http
+  import bob.streamjson
+  import bob.trace
+
+  def _extract(response):
+    return json.dumps(bob.streamjson.extract(response, PACKAGE_FIELDS)).encode('utf-8')
+
+  url = bob.http.index_url(package_name, 'json')
+  with bob.trace.span('metadata', package=package_name):
+    return json.loads(bob.cache.fetch(url, max_age=max_age, transform=_extract, key=url + '#fields', policy=policy).decode('utf-8'))
+
+
+def _query_resolver(method, **params):
+  """
+  Answers a query from the snapshot given by ``BOB_SNAPSHOT`` (see
+  :py:mod:`bob.snapshot`), or else sends it to the resolver daemon of
+  :py:mod:`bob.resolver`
+
+  **Raises**:
+
+    :py:class:`bob.resolver.Unavailable` if the package is not in the
+    snapshot and no daemon is running
+
+  """
+  import bob.snapshot
+  snapshot = bob.snapshot.get_default_snapshot()
+  if snapshot is not None:
+    try:
+      return snapshot.query(method, **params)
+    except KeyError:
+      pass
+  import bob.resolver
+  return bob.resolver.query(method, **params)
+
+
 def get_url(package_name):
   "Given a package name get, from PyPI, the URL name"
-  import pkgtools.pypi
-  return pkgtools.pypi.PyPIJson(package_name).retrieve()['urls'][0]['url']
+  from bob.resolver import Unavailable
+  try:
+    return _query_resolver('get_url', package=package_name)
+  except Unavailable:
+    return get_package_info(package_name)['urls'][0]['url']
+
+
+def get_release_file(package_name, version=None):
+  """
+  Given a package name, get, from PyPI, the description of the source archive
+  of one of its releases
+
+  **Parameters**:
+
+    package_name: The package name
+    version: The release; if not given, the latest one is used
+
+  **Returns**:
+
+    A dictionary with the ``version``, the ``url`` and the ``filename`` of the
+    archive, and its ``sha256`` digest (``None`` if PyPI does not provide it)
+
+  """
+  from bob.resolver import Unavailable
+  try:
+    return _query_resolver('get_release_file', package=package_name, version=version)
+  except Unavailable:
+    return _release_file(package_name, get_package_info(package_name), version)
+
+
+def _release_file(package_name, info, version=None, release=None):
+  """
+  Selects the archive of a release in the metadata of a package or, for
+  releases other than the latest one, in ``release``, the metadata of that
+  release (fetched with :py:func:`get_release_info` if not given); see
+  :py:func:`get_release_file`
+  """
+  version = version or info['info']['version']
+  if version == info['info']['version']:
+    files = info['urls']
+  elif version not in info['releases']:
+    files = None
+  else:
+    # metadata cached with the files of all releases still has them
+    files = info['releases'][version] or (release or get_release_info(package_name, version))['urls']
+  if not files:
+    raise ValueError("package '%s' has no files for release '%s'" % (package_name, version))
+  # prefers source distributions, which contain the documentation
+  sdists = [f for f in files if f.get('packagetype') == 'sdist']
+  f = (sdists or files)[0]
+  return {
+      'version': version,
+      'url': f['url'],
+      'filename': f.get('filename') or f['url'].split('/')[-1],
+      'sha256': f.get('digests', {}).get('sha256'),
+      }
+
+
+def print_progress(done, total):
+  """Prints the status of a download, as the number of bytes transferred so far"""
+  if total:
+    status = r"%10d  [%3.2f%%]" % (done, done * 100. / total)
+  else:
+    status = r"%10d" % done
+  print (status)
+
+
+def copy_stream(source, destination, total=None, progress=None, interval=0.5, min_block=65536, max_block=1048576):
+  """
+  Copies a readable stream into a writable one
+
+  Data is read into a single, preallocated buffer, whenever the source
+  supports ``readinto``. The block size starts at ``min_block`` and doubles,
+  up to ``max_block``, every time the source fills a whole block, so that fast
+  transfers need fewer system calls.
+
+  **Parameters**:
+
+    source: The stream to read from, like an HTTP response
+    destination: The stream to write to
+    total: The expected number of bytes, if known; only passed to ``progress``
+    progress: A function called as ``progress(done, total)`` with the number of
+              bytes copied so far; it is called at most once every ``interval``
+              seconds, and once at the end
+    interval: The minimum time, in seconds, between two calls to ``progress``
+    min_block: The initial block size, in bytes
+    max_block: The maximum block size, in bytes
 
+  **Returns**:
 
-def download(url, output_dir="."):
+    The number of bytes copied
+
+  """
+  import time
+
+  readinto = getattr(source, 'readinto', None)
+  if readinto is not None:
+    view = memoryview(bytearray(max_block))
+  block = min_block
+  done = 0
+  last = time.time()
+  while True:
+    if readinto is not None:
+      n = readinto(view[:block])
+      if not n: break
+      destination.write(view[:n])
+    else:
+      data = source.read(block)
+      if not data: break
+      n = len(data)
+      destination.write(data)
+
+    done += n
+    if n == block and block < max_block:
+      block = min(2 * block, max_block)
+    if progress is not None:
+      now = time.time()
+      if now - last >= interval:
+        progress(done, total)
+        last = now
+
+  if progress is not None: progress(done, total)
+  return done
+
+
+def download(url, output_dir=".", progress=print_progress, interval=0.5, policy=None):
   """
   Download a file given the URL
-  
+
+  A download failing on a transient error starts over, as decided by
+  ``policy``; downloads are neither duplicated by hedging nor bounded by the
+  deadline of the policy, which is meant for metadata requests.
+
   **Parameters**:
-  
+
     url: The URL
     output_dir: The directory that stores the file
-  
+    progress: A function called as ``progress(done, total)`` to report the
+              status of the download, or ``None``; see :py:func:`copy_stream`
+    interval: The minimum time, in seconds, between two status reports
+    policy: The :py:class:`bob.retry.RetryPolicy` of the download; see
+            :py:func:`bob.retry.get_policy`
+
   """
 
-  import six
-  import os
-  
+  import bob.http
+  import bob.retry
+  import bob.trace
+
   file_name = url.split('/')[-1] #Getting only the file name without the version
   file_name = os.path.join(output_dir,file_name)
-  u = six.moves.urllib.request.urlopen(url)
-  f = open(file_name, 'wb')
-  meta = u.info()
-  file_size = int(meta.get("Content-Length")[0])
-  print ("Downloading: %s Bytes: %s" % (file_name, file_size))
-
-  file_size_dl = 0
-  block_sz = 8192
-  while True:
-    buffer = u.read(block_sz)
-    if not buffer:
-      break
 
-    file_size_dl += len(buffer)
-    f.write(buffer)
-    status = r"%10d  [%3.2f%%]" % (file_size_dl, file_size_dl * 100. / file_size)
-    status = status + chr(8)*(len(status)+1)
-    print (status)
+  def _download():
+    u = bob.http.get(url)
+    try:
+      length = u.getheader("Content-Length")
+      file_size = int(length) if length else None
+      print ("Downloading: %s Bytes: %s" % (file_name, file_size))
+      with open(file_name, 'wb') as f:
+        return copy_stream(u, f, file_size, progress, interval)
+    finally:
+      u.close()
 
-  f.close()
+  with bob.trace.span('download', url=url) as span:
+    span.set(bytes=(policy or bob.retry.get_policy()).call(_download, hedge=False, deadline=False))
   return file_name
 
 
+def split_requirement(requirement):
+  """
+  Splits a requirement, like ``bob.core == 2.1.2``, into the package name and
+  the pinned version; the version is ``None`` for requirements that are not
+  pinned with ``==``
+  """
+  import re
+  name = re.split(r'[\s=<>!~;\[(]', requirement.strip(), 1)[0]
+  match = re.search(r'==\s*([^\s,;)]+)', requirement)
+  return name, (match.group(1) if match else None)
+
+
+def _pipeline(items, stages, queue_size=4):
+  """
+  Runs items through a sequence of stages, each stage with its own pool of
+  threads. Stages are connected by bounded queues, so that a slow stage does
+  not let the previous ones run arbitrarily ahead of it, while still
+  overlapping the processing of consecutive items.
+
+  **Parameters**:
+
+    items: An iterable of ``(key, value)`` pairs; ``key`` identifies the item in
+           the results
+    stages: A list of ``(function, workers)`` pairs; each function receives the
+            value produced by the previous stage
+    queue_size: The maximum number of items waiting in front of each stage
+
+  **Returns**:
+
+    A tuple ``(results, errors)``: ``results`` is a dictionary from keys to the
+    values returned by the last stage and ``errors`` a dictionary from keys to
+    the exception raised by the stage in which the item failed
+
+  """
+  import threading
+  import six
+
+  done = object()
+  queues = [six.moves.queue.Queue(maxsize=queue_size) for _ in stages] + [six.moves.queue.Queue()]
+  results = {}
+  errors = {}
+  lock = threading.Lock()
+
+  def _worker(index, remaining):
+    function = stages[index][0]
+    source, destination = queues[index], queues[index+1]
+    while True:
+      token = source.get()
+      if token is done:
+        break
+      key, value = token
+      try:
+        destination.put((key, function(value)))
+      except Exception as e:
+        with lock: errors[key] = e
+
+    with lock:
+      remaining[0] -= 1
+      last = not remaining[0]
+    if last:
+      # the last worker of a stage to finish closes the next stage
+      next_workers = stages[index+1][1] if index+1 < len(stages) else 1
+      for _ in range(next_workers): destination.put(done)
+
+  threads = []
+  for index, (function, workers) in enumerate(stages):
+    remaining = [workers]
+    for _ in range(workers):
+      t = threading.Thread(target=_worker, args=(index, remaining))
+      t.daemon = True
+      t.start()
+      threads.append(t)
+
+  for item in items:
+    queues[0].put(item)
+  for _ in range(stages[0][1]): queues[0].put(done)
+
+  for t in threads: t.join()
+
+  while True:
+    token = queues[-1].get()
+    if token is done: break
+    results[token[0]] = token[1]
+
+  return results, errors
+
+
+def _extract(file_name, package_name, output_dir, patterns=None):
+  """
+  Unpacks the given source archive into ``output_dir/package_name``, keeping
+  only the members matching ``patterns`` (see :py:func:`bob.archive.extract`)
+  """
+  import tempfile
+  import shutil
+  import bob.archive
+  import bob.trace
+
+  target = os.path.join(output_dir, package_name)
+  temp = tempfile.mkdtemp(dir=output_dir, prefix='.tmp-')
+  try:
+    with bob.trace.span('extract', package=package_name, bytes=os.path.getsize(file_name)):
+      bob.archive.extract(file_name, temp, patterns)
+    with bob.trace.span('extract.rename', package=package_name):
+      if os.path.exists(target): shutil.rmtree(target)
+      os.rename(temp, target)
+  except:
+    shutil.rmtree(temp, ignore_errors=True)
+    raise
+  return target
+
 
-def download_packages(requirements,  output_dir="./temp"):
+def download_packages(requirements,  output_dir="./temp", metadata_workers=8, download_workers=4, extract_workers=2, queue_size=4):
   """
   This function downloads and unpacks all the required packages to a temp directory,
   so this can be used in the future to build an integrated documentation
-  
+
+  Fetching the URLs, downloading and unpacking the archives run as overlapping
+  stages, each one with its own pool of threads: while one package is being
+  unpacked, the next ones are already being downloaded.
+
   **Parameters**:
 
-  requirements: The list of files to be downloaded
-  
-   
-  """ 
-  import zipfile
-  import os
+    requirements: The list of files to be downloaded
+    output_dir: The directory where the packages are unpacked
+    metadata_workers: The number of simultaneous queries to PyPI
+    download_workers: The number of simultaneous downloads
+    extract_workers: The number of archives unpacked simultaneously
+    queue_size: The maximum number of packages waiting in front of each stage
+
+  **Returns**:
+
+    A list of ``(package_name, directory)`` pairs for the unpacked packages, in
+    the order of ``requirements``
 
-  import bob.io.base    
+  """
+  import bob.io.base
   bob.io.base.create_directories_safe(output_dir)
 
-  urls = []
-  print ("Fetching urls!!!")
-  for r in requirements:
-    try:
-      package_name = r.split("=")[0]
-      print ("  Fetching {0}".format(package_name))
-      urls.append(get_url(package_name))
-    except HTTPError as exc:
-      # url request failed with a something else than 404 Error
-      print ("Requesting URL %s returned error %s" % (url, exc))
-  
-  for u in urls:
-    file_name = download(u, output_dir)
-
-    print ("Unziping {0}".format(u)    )
-    f = open(file_name, 'rb')
-    z = zipfile.ZipFile(f)
-    z.extractall(os.path.dirname(file_name))
-    f.close()
-    os.rename(file_name.rstrip(".zip"),file_name.split("-")[0])
+  names = [split_requirement(r)[0] for r in requirements]
+
+  def _fetch_url(package_name):
+    print ("  Fetching {0}".format(package_name))
+    return package_name, get_url(package_name)
+
+  def _download(args):
+    package_name, url = args
+    return package_name, download(url, output_dir)
+
+  def _unpack(args):
+    package_name, file_name = args
+    print ("Unziping {0}".format(file_name))
+    target = _extract(file_name, package_name, output_dir)
     os.unlink(file_name)
+    return target
+
+  results, errors = _pipeline(
+      ((n, n) for n in names),
+      [(_fetch_url, metadata_workers), (_download, download_workers), (_unpack, extract_workers)],
+      queue_size=queue_size,
+      )
+
+  for n in names:
+    if n in errors:
+      print ("Could not download package %s: %s" % (n, errors[n]))
+
+  return [(n, results[n]) for n in names if n in results]
 
 
-def get_releases(package):
+def get_releases(package, raise_errors=False):
   """
   Given a package name, get the release versions
-  """  
+
+  **Parameters**:
+
+    package: The package name
+    raise_errors: If set, errors while querying PyPI are raised instead of
+                  being reported as an empty list of releases
+
+  """
+  import six
+  from bob.resolver import Unavailable
   try:
-    return pkgtools.pypi.PyPIJson(package).retrieve()['releases'].keys()
-  except:
+    try:
+      return _query_resolver('get_releases', package=package)
+    except Unavailable:
+      return list(get_package_info(package)['releases'].keys())
+  except (IOError, OSError, ValueError, KeyError, six.moves.http_client.HTTPException):
+    # the index failed, after the retries of bob.retry, or does not know the package
+    if raise_errors: raise
     return []
 
 
-def get_max_version(versions):
+def get_release_info(package, version, policy=None):
+  """
+  Given a package name and one of its versions, get the metadata of that
+  release from PyPI, as a dictionary
+
+  Only the fields in :py:data:`RELEASE_FIELDS` are kept. The metadata of each
+  release is kept in the cache of :py:mod:`bob.cache`, and is only revalidated
+  after :py:data:`RELEASE_MAX_AGE`.
+  """
+  import bob.cache
+  import bob.http
+  import bob.streamjson
+  import bob.trace
+
+  def _extract(response):
+    return json.dumps(bob.streamjson.extract(response, RELEASE_FIELDS)).encode('utf-8')
+
+  url = bob.http.index_url(package, version, 'json')
+  with bob.trace.span('metadata.release', package=package, version=version):
+    # not '#fields': the entries cached before the archives were kept lack them
+    return json.loads(bob.cache.fetch(url, max_age=RELEASE_MAX_AGE, transform=_extract, key=url + '#release', policy=policy).decode('utf-8'))
+
+
+_release_requires_cache = {}
+
+def get_release_requires(package, version, policy=None):
+  """
+  Given a package name and one of its versions, get the requirements of that
+  release from PyPI
+
+  The metadata of each release comes from :py:func:`get_release_info`;
+  results are also memoized in memory.
+
+  **Returns**:
+
+    The list of requirements that apply here, without their environment
+    markers, like ``bob.core (>=2.0.5)``. Releases that do not declare their
+    requirements (most source distributions) give an empty list.
+
+  """
+  key = (package.lower(), version)
+  if key in _release_requires_cache:
+    return _release_requires_cache[key]
+
+  info = get_release_info(package, version, policy)
+  requires = []
+  for r in (info.get('info') or {}).get('requires_dist') or []:
+    requirement, _, marker = r.partition(';')
+    if not marker.strip() or _applies(marker.strip()):
+      requires.append(requirement.strip())
+  _release_requires_cache[key] = requires
+  return requires
+
+
+def map_concurrently(function, items, workers=8):
+  """
+  Applies ``function`` to every item using a pool of at most ``workers``
+  threads, returning the results in the order of ``items``
+
+  **Returns**:
+
+    A list of ``(item, result, error)`` tuples. If ``function`` raised for an
+    item, ``result`` is ``None`` and ``error`` holds the exception.
+
+  """
+  from multiprocessing.pool import ThreadPool
+
+  def _apply(item):
+    try:
+      return (item, function(item), None)
+    except Exception as e:
+      return (item, None, e)
 
+  items = list(items)
+  if workers <= 1 or len(items) <= 1:
+    return [_apply(i) for i in items]
+
+  pool = ThreadPool(min(workers, len(items)))
   try:
-    v = list(reversed(sorted([distutils.version.StrictVersion(k) for k in versions])))
-    final = [k for k in v if not k.prerelease]
-    if final: return final[0]
-    return v[0]
-  except:
-    v = list(reversed(sorted([distutils.version.LooseVersion(k) for k in versions])))
-    final = [k for k in v if not re.search(r'[a-z]', k.vstring)]
-    if final: return final[0]
-    return v[0]
-    
+    # map() keeps the order of the input, regardless of completion order
+    return pool.map(_apply, items)
+  finally:
+    pool.close()
+    pool.join()
+
+
+def resolve_versions(packages, workers=8):
+  """
+  Resolves the latest version of several packages, querying PyPI concurrently
+
+  **Parameters**:
+
+    packages: The list of package names
+    workers: The maximum number of simultaneous queries to PyPI
+
+  **Returns**:
+
+    A list of ``(package, version, error)`` tuples in the same order as
+    ``packages``. For packages that could not be resolved, ``version`` is
+    ``None`` and ``error`` holds the exception that was raised.
+
+  """
+  from bob.resolver import Unavailable
+
+  def _resolve(package):
+    try:
+      # the daemon keeps the newest version of the packages it knows
+      return _query_resolver('get_max_version', package=package, prereleases='fallback')
+    except Unavailable:
+      pass
+    versions = get_releases(package, raise_errors=True)
+    if not versions:
+      raise ValueError("no releases found for package '%s'" % package)
+    return get_max_version(versions)
+
+  return map_concurrently(_resolve, packages, workers)
+
+
+def get_max_version(versions, prereleases='fallback'):
+  """
+  Given a list of release versions, get the newest one
+
+  Final releases are preferred over pre-releases, unless stated otherwise by
+  ``prereleases``; see :py:func:`bob.versions.get_max_version`.
+  """
+  import bob.versions
+  return bob.versions.get_max_version(versions, prereleases)
+
+
+_requires_cache = {}
+
+def _applies(marker):
+  """Tells if a requirement with the given environment marker applies here"""
+  if 'extra' in marker:
+    # requirements of optional features are not dependencies
+    return False
+  try:
+    from packaging.markers import Marker
+  except ImportError:
+    return True
+  return Marker(marker).evaluate()
+
+
+def get_requires(pkg_name):
+  """
+  Given a package name, get the requirements of its installed distribution
+
+  Distributions are looked up with :py:mod:`importlib.metadata`, which only
+  reads the metadata of the requested package; ``pkg_resources``, which scans
+  the whole working set when imported, is only used on older pythons. Results
+  are memoized.
+
+  **Returns**:
+
+    The list of requirements, like ``bob.core==2.1.2``, or ``None`` if the
+    package is not installed
+
+  """
+  key = pkg_name.lower()
+  if key in _requires_cache:
+    return _requires_cache[key]
+
+  import bob.trace
+  with bob.trace.span('dependencies.scan', package=pkg_name) as span:
+    requires = _find_requires(pkg_name)
+    span.set(requirements=None if requires is None else len(requires))
+  _requires_cache[key] = requires
+  return requires
+
+
+def _find_requires(pkg_name):
+  """Reads the requirements of an installed distribution; see :py:func:`get_requires`"""
+  try:
+    try:
+      import importlib.metadata as metadata
+    except ImportError:
+      import importlib_metadata as metadata
+  except ImportError:
+    import pkg_resources
+    distribution = pkg_resources.working_set.by_key.get(pkg_name.lower())
+    requires = None if distribution is None else [str(r) for r in distribution.requires()]
+  else:
+    try:
+      requirements = metadata.distribution(pkg_name).requires or []
+    except metadata.PackageNotFoundError:
+      requires = None
+    else:
+      requires = []
+      for r in requirements:
+        requirement, _, marker = r.partition(';')
+        if not marker.strip() or _applies(marker.strip()):
+          requires.append(requirement.strip())
+  return requires
+
 
 def get_dependencies(pkg_name="bob"):
   """
   Given a package name, get the dependency list
-  """  
-  package      = pkg_resources.working_set.by_key[pkg_name]
-  return [str(r) for r in package.requires()]
+  """
+  requires = get_requires(pkg_name)
+  if requires is None:
+    raise KeyError(pkg_name)
+  return requires
+
+
+def get_sub_packages(pkg_name="bob"):
+  """
+  Given a package name, get its dependency list without the packages of
+  :py:data:`BUILD_ONLY_PACKAGES`
+  """
+  return [r for r in get_dependencies(pkg_name) if split_requirement(r)[0].lower() not in BUILD_ONLY_PACKAGES]
 
   
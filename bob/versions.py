@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Tiago de Freitas Pereira <tiago.pereira@idiap.ch>
+#
+# Copyright (C) 2011-2014 Idiap Research Institute, Martigny, Switzerland
+
+"""
+Ordering of package versions, following `PEP 440`_.
+
+Each version string is parsed once into a tuple that compares like the
+version it represents; parsed keys are memoized, so ranking the releases of a
+package again, or of another package sharing the same version numbers, costs a
+dictionary lookup per version. Strings that are not valid PEP 440 versions
+are ordered before all valid ones, by their numeric and alphabetic parts.
+
+Version specifiers, like ``>= 2.0, < 3``, are parsed once into functions
+telling if a version satisfies them; see :py:func:`parse_specifier`.
+
+.. _PEP 440: https://www.python.org/dev/peps/pep-0440/
+"""
+
+import re
+
+_VERSION = re.compile(r"""
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?P<pre>
+        [-_\.]?
+        (?P<pre_l>alpha|a|beta|b|preview|pre|c|rc)
+        [-_\.]?
+        (?P<pre_n>[0-9]+)?
+    )?
+    (?P<post>
+        (?:-(?P<post_n1>[0-9]+))
+        |
+        (?:
+            [-_\.]?
+            (?P<post_l>post|rev|r)
+            [-_\.]?
+            (?P<post_n2>[0-9]+)?
+        )
+    )?
+    (?P<dev>
+        [-_\.]?
+        (?P<dev_l>dev)
+        [-_\.]?
+        (?P<dev_n>[0-9]+)?
+    )?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_\.][a-z0-9]+)*))?
+    \s*$
+    """, re.VERBOSE | re.IGNORECASE)
+
+_PRE_LETTERS = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1, 'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
+_LEGACY_PARTS = re.compile(r'\d+|[a-z]+', re.IGNORECASE)
+
+_cache = {}
+_CACHE_SIZE = 100000
+
+
+class InvalidVersion(ValueError):
+  """Raised by :py:func:`parse` for strings that are not PEP 440 versions"""
+  pass
+
+
+def parse(version):
+  """
+  Parses a PEP 440 version string
+
+  **Parameters**:
+
+    version: The version string, like ``2.0.8`` or ``1.10.0rc1``
+
+  **Returns**:
+
+    A tuple ``(key, prerelease)``: ``key`` is a tuple that compares like the
+    version, ``prerelease`` tells if it is a pre- or development release
+
+  **Raises**:
+
+    :py:class:`InvalidVersion` if the string is not a valid version
+
+  """
+  m = _VERSION.match(version)
+  if m is None:
+    raise InvalidVersion("invalid version: '%s'" % version)
+
+  release = [int(i) for i in m.group('release').split('.')]
+  # 1.0 == 1.0.0: trailing zeros do not change the ordering
+  while len(release) > 1 and release[-1] == 0: release.pop()
+
+  pre, post, dev = m.group('pre_l'), m.group('post'), m.group('dev')
+  if pre:
+    pre_key = (_PRE_LETTERS[pre.lower()], int(m.group('pre_n') or 0))
+  elif dev and not post:
+    # 1.0.dev0 < 1.0a0
+    pre_key = (-1, 0)
+  else:
+    pre_key = (3, 0)
+
+  if post:
+    post_key = int(m.group('post_n1') or m.group('post_n2') or 0)
+  else:
+    post_key = -1
+
+  dev_key = (0, int(m.group('dev_n') or 0)) if dev else (1, 0)
+
+  local = m.group('local')
+  if local:
+    # numeric segments sort after alphanumeric ones
+    local_key = tuple((1, int(p), '') if p.isdigit() else (0, 0, p.lower()) for p in re.split(r'[-_\.]', local))
+  else:
+    local_key = ()
+
+  key = (int(m.group('epoch') or 0), tuple(release), pre_key, post_key, dev_key, local_key)
+  return key, bool(pre or dev)
+
+
+def _legacy(version):
+  """Parses a string which is not a PEP 440 version"""
+  parts = tuple((1, int(p), '') if p.isdigit() else (0, 0, p.lower()) for p in _LEGACY_PARTS.findall(version))
+  # epoch -1 sorts these before all valid versions
+  key = (-1, parts, (3, 0), -1, (1, 0), ())
+  return key, any(not p[0] for p in parts)
+
+
+def version_key(version):
+  """
+  Returns the (memoized) sort key and prerelease flag of the given version
+  string; invalid versions are accepted and sorted before valid ones
+  """
+  try:
+    return _cache[version]
+  except KeyError:
+    pass
+  try:
+    value = parse(version)
+  except InvalidVersion:
+    value = _legacy(version)
+  if len(_cache) >= _CACHE_SIZE: _cache.clear()
+  _cache[version] = value
+  return value
+
+
+def sort_versions(versions, reverse=False):
+  """Returns the given version strings, sorted from the oldest to the newest"""
+  return sorted(versions, key=lambda v: version_key(v)[0], reverse=reverse)
+
+
+def is_prerelease(version):
+  """Tells if the given version string is a pre- or development release"""
+  return version_key(version)[1]
+
+
+def get_max_version(versions, prereleases='fallback'):
+  """
+  Returns the newest of the given versions, in a single pass
+
+  **Parameters**:
+
+    versions: An iterable of version strings
+    prereleases: The policy regarding pre- and development releases:
+
+      * ``'fallback'``: they are only returned if there is no final release
+      * ``'exclude'``: they are never returned
+      * ``'include'``: they are ranked like any other release
+
+  **Returns**:
+
+    The newest version string, or ``None`` if there is no candidate
+
+  """
+  if prereleases not in ('fallback', 'exclude', 'include'):
+    raise ValueError("unknown prerelease policy '%s'" % prereleases)
+
+  best = best_key = None
+  best_final = best_final_key = None
+  for v in versions:
+    key, pre = version_key(v)
+    if not pre:
+      if best_final_key is None or key > best_final_key:
+        best_final, best_final_key = v, key
+    elif best_key is None or key > best_key:
+      best, best_key = v, key
+
+  if prereleases == 'exclude' or best_final is not None and prereleases == 'fallback':
+    return best_final
+  if best_final_key is not None and (best_key is None or best_final_key > best_key):
+    return best_final
+  return best
+
+
+def get_max_versions(releases, prereleases='fallback'):
+  """
+  Returns the newest version of several packages at once
+
+  **Parameters**:
+
+    releases: A dictionary from package names to iterables of version strings
+    prereleases: The policy regarding pre-releases; see :py:func:`get_max_version`
+
+  **Returns**:
+
+    A dictionary from package names to their newest version (or ``None``)
+
+  """
+  return dict((name, get_max_version(versions, prereleases)) for name, versions in releases.items())
+
+
+_SPECIFIER = re.compile(r'^\s*(~=|===|==|!=|<=|>=|<|>)\s*([^\s,;]+)\s*$')
+
+_specifier_cache = {}
+
+
+class InvalidSpecifier(ValueError):
+  """Raised by :py:func:`parse_specifier` for strings that are not PEP 440 version specifiers"""
+  pass
+
+
+def _release(version):
+  """Returns the release numbers of a version, as written (trailing zeros included)"""
+  m = _VERSION.match(version)
+  return tuple(int(i) for i in m.group('release').split('.')) if m else ()
+
+
+def _prefix_match(version, prefix):
+  """Tells if the release of ``version`` starts with the release numbers of ``prefix``"""
+  key = version_key(version)[0]
+  wanted = _release(prefix)
+  if key[0] != version_key(prefix)[0][0]: return False
+  release = key[1] + (0,) * max(0, len(wanted) - len(key[1]))
+  return release[:len(wanted)] == wanted
+
+
+def _clause(operator, target):
+  """Returns a function telling if a version satisfies a single clause, like ``>= 2.0``"""
+  if operator == '===':
+    return lambda v: v.strip().lower() == target.lower()
+
+  if target.endswith('.*'):
+    if operator not in ('==', '!='):
+      raise InvalidSpecifier("'.*' is only allowed with == and !=: '%s%s'" % (operator, target))
+    prefix = target[:-2]
+    if operator == '==': return lambda v: _prefix_match(v, prefix)
+    return lambda v: not _prefix_match(v, prefix)
+
+  key, pre = version_key(target)
+  if operator in ('==', '!='):
+    # without a local label in the specifier, the local label of the candidate is ignored
+    width = 6 if key[5] else 5
+    equal = lambda v: version_key(v)[0][:width] == key[:width]
+    return equal if operator == '==' else (lambda v: not equal(v))
+  # the local label of the candidate is ignored by ordered comparisons, except > (below)
+  if operator == '<=': return lambda v: version_key(v)[0][:5] <= key[:5]
+  if operator == '>=': return lambda v: version_key(v)[0] >= key
+  if operator == '<':
+    # < 2.0 does not accept the pre-releases of 2.0 (like 2.0rc1), nor < 2.0.post1
+    # those of 2.0.post1 (like 2.0.post1.dev0), unless it is a pre-release itself
+    width = 4 if key[3] >= 0 else 2
+
+    def _less(v):
+      k, p = version_key(v)
+      return k[:5] < key[:5] and (pre or not (p and k[:width] == key[:width]))
+    return _less
+  if operator == '>':
+    # > 2.0 does not accept the post-releases of 2.0 (like 2.0.post1), unless it
+    # is a post- or development release itself, nor its local versions
+    final = key[3:5] == (-1, (1, 0))
+
+    def _greater(v):
+      k = version_key(v)[0]
+      return k > key and k[:5] != key[:5] and not (final and k[3] >= 0 and k[:3] == key[:3])
+    return _greater
+  # ~= 2.1.3 is >= 2.1.3, == 2.1.*
+  release = _release(target)
+  if len(release) < 2:
+    raise InvalidSpecifier("~= requires at least two release numbers: '~=%s'" % target)
+  prefix = '.'.join(str(i) for i in release[:-1])
+  if key[0]: prefix = '%d!%s' % (key[0], prefix)
+  return lambda v: version_key(v)[0] >= key and _prefix_match(v, prefix)
+
+
+def parse_specifier(specifier):
+  """
+  Parses a PEP 440 version specifier, like ``>= 2.0, != 2.1.*, < 3``
+
+  **Returns**:
+
+    A function telling if a version string satisfies all clauses of the
+    specifier; the empty specifier accepts all versions. Parsed specifiers
+    are memoized.
+
+  **Raises**:
+
+    :py:class:`InvalidSpecifier` if the string is not a valid specifier
+
+  """
+  try:
+    return _specifier_cache[specifier]
+  except KeyError:
+    pass
+  clauses = []
+  for part in specifier.strip().strip('()').split(','):
+    if not part.strip(): continue
+    m = _SPECIFIER.match(part)
+    if m is None:
+      raise InvalidSpecifier("invalid version specifier: '%s'" % specifier)
+    clauses.append(_clause(m.group(1), m.group(2)))
+  function = lambda version: all(c(version) for c in clauses)
+  if len(_specifier_cache) >= _CACHE_SIZE: _specifier_cache.clear()
+  _specifier_cache[specifier] = function
+  return function
+
+
+def matches(version, specifier):
+  """Tells if the given version string satisfies the given specifier; see :py:func:`parse_specifier`"""
+  return parse_specifier(specifier)(version)
@@ -8,7 +8,6 @@
 import os
 import sys
 import glob
-import pkg_resources
 
 # If extensions (or modules to document with autodoc) are in another directory,
 # add these directories to sys.path here. If the directory is relative to the
@@ -36,16 +35,16 @@ extensions = [
 
 
 #Hack to download the dependencies
-from bob.utils import get_dependencies, download_packages
+# Only packages whose pinned version changed since the last build are
+# downloaded again; only the files needed by the documentation are unpacked,
+# straight from the download stream
+from bob.utils import get_sub_packages
+from bob.sandbox import sync_packages
+from bob.archive import DOC_PATTERNS
 temp_dir="./temp"
-try:
-  import shutil
-  shutil.rmtree(temp_dir)
-except:
-  None
 
-packages = get_dependencies()
-download_packages(packages[2:], temp_dir)
+packages = get_sub_packages()
+sync_packages(packages, temp_dir, patterns=DOC_PATTERNS, stream=True)
 
 
 # The viewcode extension appeared only on Sphinx >= 1.0.0
@@ -261,8 +260,9 @@ autoclass_content = 'both'
 autodoc_member_order = 'bysource'
 autodoc_default_flags = ['members', 'undoc-members', 'inherited-members', 'show-inheritance']
 
-# For inter-documentation mapping:
-from bob.extension.utils import link_documentation
+# For inter-documentation mapping; the inventories are fetched simultaneously
+# into a local cache, which is used alone with BOB_OFFLINE=1
+from bob.inventories import link_documentation
 intersphinx_mapping = link_documentation(additional_packages = ['python', 'numpy', 'scipy', 'gridtk'], requirements_file = None)
 
 #import shutil
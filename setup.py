@@ -51,7 +51,24 @@ setup(
     # scripts of this package. Don't worry - You won't need administrative
     # privileges when using buildout.
     install_requires=["setuptools"] + requeriments,
-        
+
+    entry_points = {
+      'console_scripts': [
+        'get_versions.py = bob.script.get_versions:main',
+        'benchmark_download.py = bob.script.benchmark_download:main',
+        'benchmark_versions.py = bob.script.benchmark_versions:main',
+        'benchmark_json.py = bob.script.benchmark_json:main',
+        'dependency_graph.py = bob.script.dependency_graph:main',
+        'benchmark_imports.py = bob.script.benchmark_imports:main',
+        'resolver.py = bob.script.resolver:main',
+        'snapshot.py = bob.script.snapshot:main',
+        'benchmark_network.py = bob.script.benchmark_network:main',
+        'artifacts.py = bob.script.artifacts:main',
+        'run_tests.py = bob.script.run_tests:main',
+        'build_docs.py = bob.script.build_docs:main',
+      ],
+    },
+
     classifiers = [
       'Development Status :: 5 - Production/Stable',
       'License :: OSI Approved :: BSD License',